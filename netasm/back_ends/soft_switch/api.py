@@ -33,15 +33,14 @@
 
 __author__ = 'shahbaz'
 
-from ast import literal_eval
-
 from pox.openflow import libopenflow_01 as of
+from netasm.back_ends.soft_switch import codec
 
 
 class InMessage:
     def __init__(self, vendor):
         self.vendor = vendor
-        self.message = literal_eval(vendor.data)
+        self.message = codec.decode(vendor.data)
 
         if not self.message['type'] == 'in':
             raise TypeError()
@@ -49,6 +48,7 @@ class InMessage:
         self.is_packet_in = self.message['operation'] == 'packet-in'
         self.is_query_table_entry = self.message['operation'] == 'query-table-entry'
         self.is_query_table_list = self.message['operation'] == 'query-table-list'
+        self.is_dump_table = self.message['operation'] == 'dump-table'
 
         if self.is_packet_in:
             self.port = self.message['data'][0]
@@ -61,6 +61,12 @@ class InMessage:
             self.table_entry = self.message['data'][2]
         elif self.is_query_table_list:
             self.table_list = self.message['data']
+        elif self.is_dump_table:
+            self.table_name = self.message['data'][0]
+            self.table_version = self.message['data'][1]
+            self.table_fields = self.message['data'][2]
+            self.table_entries = self.message['data'][3]
+            self.is_dump_complete = self.message['data'][4]
         else:
             raise TypeError()
 
@@ -73,27 +79,48 @@ class OutMessage(of.ofp_vendor_generic):
     def set_policy(self, policy):
         self.message['operation'] = 'set-policy'
         self.message['data'] = policy
-        self.data = str(self.message)
+        self.data = codec.encode(self.message)
 
     def clr_policy(self):
         self.message['operation'] = 'clr-policy'
         self.message['data'] = None
-        self.data = str(self.message)
+        self.data = codec.encode(self.message)
 
     def add_table_entry(self, name, index, entry):
         self.message['operation'] = 'add-table-entry'
         self.message['data'] = (name, index, entry)
-        self.data = str(self.message)
+        self.data = codec.encode(self.message)
 
     def del_table_entry(self, name, index):
         self.message['operation'] = 'del-table-entry'
         self.message['data'] = (name, index)
-        self.data = str(self.message)
+        self.data = codec.encode(self.message)
 
     def packet_out(self, ports, packet=None):
         self.message['operation'] = 'packet-out'
         self.message['data'] = (ports, packet)
-        self.data = str(self.message)
+        self.data = codec.encode(self.message)
+
+    # Note: updates are ('add', name, index, entry), ('mod', name, index, entry) or ('del', name, index), where 'add'
+    #       writes the entry afresh and 'mod' only the fields given. The switch makes them, all or none, once a message
+    #       with commit=True arrives, along with those of the messages (with commit=False) before it.
+    def update_table_entries(self, updates, commit=True):
+        self.message['operation'] = 'update-table-entries'
+        self.message['data'] = (list(updates), commit)
+        self.data = codec.encode(self.message)
+
+
+# Note: a long list of updates is split across messages (see codec.MAX_BODY_SIZE), sent back to back, of which the last
+#       commits them all (see OutMessage.update_table_entries)
+def get_update_table_entries_messages(updates):
+    lists = codec.split_values(list(updates), codec.MAX_BODY_SIZE - codec.get_size(([], True)))
+
+    messages = []
+    for i in range(0, len(lists)):
+        message = OutMessage()
+        message.update_table_entries(lists[i], i == len(lists) - 1)
+        messages.append(message)
+    return messages
 
 
 class QueryMessage(of.ofp_vendor_generic):
@@ -104,9 +131,17 @@ class QueryMessage(of.ofp_vendor_generic):
     def table_entry(self, name, index):
         self.message['operation'] = 'query-table-entry'
         self.message['data'] = (name, index)
-        self.data = str(self.message)
+        self.data = codec.encode(self.message)
 
     def table_list(self):
         self.message['operation'] = 'query-table-list'
         self.message['data'] = None
-        self.data = str(self.message)
\ No newline at end of file
+        self.data = codec.encode(self.message)
+
+    # Note: the switch replies with the entries from start to stop (see ArrayPatterns.dump_entries for since and
+    #       non_zero), split across messages (see InMessage.is_dump_table) of which the last is_dump_complete. All of
+    #       them carry the version of the entries, to be given as since in the next dump for only the updated ones.
+    def dump_table(self, name, start=0, stop=None, since=None, non_zero=False):
+        self.message['operation'] = 'dump-table'
+        self.message['data'] = (name, start, stop, since, non_zero)
+        self.data = codec.encode(self.message)
\ No newline at end of file
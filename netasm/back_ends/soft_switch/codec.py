@@ -0,0 +1,318 @@
+# ###############################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        codec.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+from ast import literal_eval
+from struct import Struct
+
+# Note: the messages between the controller and the switch (see api) are dicts of type ('out', 'query' or 'in'),
+#       operation and data, carried in vendor messages. They are encoded as a header, i.e., MAGIC, VERSION, the type,
+#       the operation and the length of the body, followed by the body. Packet-in and packet-out bodies are packed
+#       as is (with the packet as raw bytes), as are the entries of a dump-table reply (see _pack_entries), and the
+#       data of the other operations (and of dump-table queries) as typed values (see _encode_value).
+# Note: messages in the old (textual) format, i.e., str(message), are still decoded, and a message can be encoded in it
+#       (textual=True) for a peer that only knows that format.
+MAGIC = 'NASM'
+VERSION = 1
+
+_HEADER = Struct('!4sBBBxI')
+
+# Note: the data of a vendor message is at most 64KB, less the OpenFlow headers (12 bytes) and the message's header, so
+#       long lists (e.g., of table updates or of the entries of a dump) are split across messages (see split_values)
+MAX_BODY_SIZE = 0xFFFF - 12 - _HEADER.size
+
+_TYPES = ['out', 'query', 'in']
+_OPERATIONS = ['set-policy', 'clr-policy', 'add-table-entry', 'del-table-entry', 'packet-out',
+               'query-table-entry', 'query-table-list', 'packet-in', 'update-table-entries', 'dump-table']
+
+_TYPE_CODES = dict((type, code) for code, type in enumerate(_TYPES))
+_OPERATION_CODES = dict((operation, code) for code, operation in enumerate(_OPERATIONS))
+
+_PACKET_IN = Struct('!IIHH')
+_PACKET_OUT = Struct('!HI')
+_NO_PACKET = 0xFFFFFFFF
+# Note: the number of entries of a dump-table and of lists (of values, and of masks) per entry, or _TYPED_ENTRIES
+_DUMP = Struct('!IB')
+_TYPED_ENTRIES = 0xFF
+
+_INT = Struct('!q')
+_LENGTH = Struct('!I')
+_COUNT = Struct('!H')
+
+
+def is_textual(data):
+    return not data.startswith(MAGIC)
+
+
+def _encode_value(value, chunks):
+    if value is None:
+        chunks.append('N')
+    elif value is True:
+        chunks.append('T')
+    elif value is False:
+        chunks.append('F')
+    elif isinstance(value, (int, long)):
+        if -(1 << 63) <= value < (1 << 63):
+            chunks.append('i')
+            chunks.append(_INT.pack(value))
+        else:
+            value = hex(value).rstrip('L')
+            chunks.append('I')
+            chunks.append(_COUNT.pack(len(value)))
+            chunks.append(value)
+    elif isinstance(value, (str, bytearray)):
+        chunks.append('s')
+        chunks.append(_LENGTH.pack(len(value)))
+        chunks.append(str(value))
+    elif isinstance(value, (tuple, list)):
+        chunks.append('t' if isinstance(value, tuple) else 'l')
+        chunks.append(_COUNT.pack(len(value)))
+        for item in value:
+            _encode_value(item, chunks)
+    elif isinstance(value, dict):
+        chunks.append('d')
+        chunks.append(_COUNT.pack(len(value)))
+        for key, item in value.iteritems():
+            _encode_value(key, chunks)
+            _encode_value(item, chunks)
+    else:
+        raise RuntimeError("Can't encode %s" % (type(value), ))
+
+
+# Note: the size of a value once encoded (see _encode_value)
+def get_size(value):
+    chunks = []
+    _encode_value(value, chunks)
+    return sum([len(chunk) for chunk in chunks])
+
+
+# Note: splits a list of values into lists that are each at most size bytes once encoded (unless of a single value).
+#       There is always at least one (possibly empty) list.
+def split_values(values, size):
+    lists = []
+
+    start = 0
+    _size = 0
+    for i in range(0, len(values)):
+        value_size = get_size(values[i])
+        if _size + value_size > size and i > start:
+            lists.append(values[start:i])
+            start = i
+            _size = 0
+        _size += value_size
+
+    lists.append(values[start:])
+    return lists
+
+
+# Note: the entries of a dump-table, i.e., (index, values) or (index, values, masks) (see ArrayPatterns.dump_entries),
+#       are packed as a flat array of 64-bit integers, unless some don't fit (e.g., of wide fields), in which case
+#       None is returned and they are encoded as typed values
+def _pack_entries(entries, fields):
+    if not entries:
+        return 0, []
+
+    lists = len(entries[0]) - 1
+    integers = []
+    for entry in entries:
+        integers.append(entry[0])
+        for values in entry[1:]:
+            integers.extend(values)
+
+    if len(integers) != len(entries) * (1 + lists * len(fields)):
+        return None
+    if min(integers) < -(1 << 63) or max(integers) >= (1 << 63):
+        return None
+    return lists, integers
+
+
+def _unpack_entries(integers, lists, fields):
+    entries = []
+    width = 1 + lists * len(fields)
+    for offset in range(0, len(integers), width):
+        entry = [integers[offset]]
+        for k in range(0, lists):
+            start = offset + 1 + k * len(fields)
+            entry.append(list(integers[start:start + len(fields)]))
+        entries.append(tuple(entry))
+    return entries
+
+
+# Note: splits the entries of a dump-table into lists that each fit in a message (see MAX_BODY_SIZE)
+def split_entries(name, version, fields, entries):
+    size = MAX_BODY_SIZE - get_size((name, version, fields, True)) - _DUMP.size
+    packed = _pack_entries(entries, fields)
+    if packed is None:
+        return split_values(entries, size - get_size([]))
+
+    lists, _ = packed
+    count = max(size // (8 * (1 + lists * len(fields))), 1)
+    return [entries[start:start + count] for start in range(0, len(entries), count)] or [[]]
+
+
+def _decode_value(data, offset):
+    tag = data[offset]
+    offset += 1
+
+    if tag == 'N':
+        return None, offset
+    elif tag == 'T':
+        return True, offset
+    elif tag == 'F':
+        return False, offset
+    elif tag == 'i':
+        return _INT.unpack_from(data, offset)[0], offset + _INT.size
+    elif tag == 'I':
+        length, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        return int(data[offset:offset + length], 16), offset + length
+    elif tag == 's':
+        length, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        return data[offset:offset + length], offset + length
+    elif tag in ('t', 'l'):
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        items = []
+        for _ in range(0, count):
+            item, offset = _decode_value(data, offset)
+            items.append(item)
+        return (tuple(items) if tag == 't' else items), offset
+    elif tag == 'd':
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        items = {}
+        for _ in range(0, count):
+            key, offset = _decode_value(data, offset)
+            items[key], offset = _decode_value(data, offset)
+        return items, offset
+    else:
+        raise RuntimeError("Invalid value tag: %r" % (tag, ))
+
+
+def _encode_body(type, operation, data):
+    if operation == 'packet-in':
+        port, packet, (reason, description) = data
+        packet, reason, description = str(packet), str(reason), str(description)
+        return _PACKET_IN.pack(port, len(packet), len(reason), len(description)) + packet + reason + description
+    elif operation == 'packet-out':
+        ports, packet = data
+        if packet is None:
+            packet = ''
+            length = _NO_PACKET
+        else:
+            packet = str(packet)
+            length = len(packet)
+        return _PACKET_OUT.pack(len(ports), length) + Struct('!%sI' % len(ports)).pack(*ports) + packet
+    elif operation == 'dump-table' and type == 'in':
+        name, version, fields, entries, is_last = data
+        chunks = []
+        _encode_value((name, version, fields, is_last), chunks)
+
+        packed = _pack_entries(entries, fields)
+        if packed is None:
+            chunks.append(_DUMP.pack(len(entries), _TYPED_ENTRIES))
+            _encode_value(entries, chunks)
+        else:
+            lists, integers = packed
+            chunks.append(_DUMP.pack(len(entries), lists))
+            chunks.append(Struct('!%sq' % len(integers)).pack(*integers))
+        return ''.join(chunks)
+    elif operation == 'set-policy':
+        return str(data)
+    else:
+        chunks = []
+        _encode_value(data, chunks)
+        return ''.join(chunks)
+
+
+def _decode_body(type, operation, body):
+    if operation == 'packet-in':
+        port, packet_length, reason_length, description_length = _PACKET_IN.unpack_from(body)
+        offset = _PACKET_IN.size
+        packet = body[offset:offset + packet_length]
+        offset += packet_length
+        reason = body[offset:offset + reason_length]
+        offset += reason_length
+        description = body[offset:offset + description_length]
+        return port, packet, (reason, description)
+    elif operation == 'packet-out':
+        count, length = _PACKET_OUT.unpack_from(body)
+        offset = _PACKET_OUT.size
+        ports = list(Struct('!%sI' % count).unpack_from(body, offset))
+        offset += 4 * count
+        packet = None if length == _NO_PACKET else body[offset:offset + length]
+        return ports, packet
+    elif operation == 'dump-table' and type == 'in':
+        (name, version, fields, is_last), offset = _decode_value(body, 0)
+        count, lists = _DUMP.unpack_from(body, offset)
+        offset += _DUMP.size
+
+        if lists == _TYPED_ENTRIES:
+            entries, _ = _decode_value(body, offset)
+        else:
+            integers = Struct('!%sq' % (count * (1 + lists * len(fields)))).unpack_from(body, offset)
+            entries = _unpack_entries(integers, lists, fields)
+        return name, version, fields, entries, is_last
+    elif operation == 'set-policy':
+        return body
+    else:
+        data, _ = _decode_value(body, 0)
+        return data
+
+
+def encode(message, textual=False):
+    if textual:
+        return str(message)
+
+    type = message['type']
+    operation = message['operation']
+    body = _encode_body(type, operation, message.get('data'))
+    return _HEADER.pack(MAGIC, VERSION, _TYPE_CODES[type], _OPERATION_CODES[operation], len(body)) + body
+
+
+def decode(data):
+    if is_textual(data):
+        return literal_eval(data)
+
+    magic, version, type, operation, length = _HEADER.unpack_from(data)
+    if version != VERSION:
+        raise RuntimeError("Unsupported message version: %s" % (version, ))
+    if len(data) < _HEADER.size + length:
+        raise RuntimeError("Truncated message")
+
+    type = _TYPES[type]
+    operation = _OPERATIONS[operation]
+    body = data[_HEADER.size:_HEADER.size + length]
+    return {'type': type, 'operation': operation, 'data': _decode_body(type, operation, body)}
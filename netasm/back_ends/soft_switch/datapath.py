@@ -43,12 +43,12 @@ Example:
 import sys
 from ast import literal_eval
 from importlib import import_module
-from Queue import Queue
+from itertools import count
+from multiprocessing import cpu_count
 from threading import Thread
+from time import sleep
 import logging
 
-from bitstring import BitArray
-
 from pox.core import core
 from pox.lib.util import dpid_to_str, str_to_dpid
 from pox.lib.ioworker.workers import BackoffWorker
@@ -59,7 +59,9 @@ import pox.lib.pxpcap as pxpcap
 import pox.openflow.libopenflow_01 as of
 from netasm.netasm.core.syntax import *
 from netasm.netasm.core.common import bitmap_to_ports, ports_to_bitmap
-from netasm.netasm import validate, execute, optimize, cost
+from netasm.netasm import execute, policy_cache
+from netasm.netasm.core.utilities.queues import BoundedQueue, TAIL_DROP
+from netasm.back_ends.soft_switch import codec
 
 
 class OpenFlowWorker(BackoffWorker):
@@ -160,13 +162,19 @@ _switches = {}
 
 _MAX_PORTS = 64
 
+_TX_THREADS = 4
 
-def load_policy(switch, policy_name):
-    if switch.policy:
-        switch.policy.stop()
-    switch.policy_name = ''
-    switch.policy = None
+# Note: the rx queue, each tx queue and each of the policy's workers (see execute.ExecuteWorkers) hold at most
+#       queue_capacity packets; the packets beyond that are dropped as per drop_policy (see queues.Admission)
+_QUEUE_CAPACITY = 4096
+
+_policy_cache = policy_cache.PolicyCache(_MAX_PORTS, processes=cpu_count())
 
+
+# Note: a new policy is swapped into the running policy's execution (see execute.Execute.swap), so packets keep being
+#       forwarded while it loads and the entries of the tables the two policies share are kept. If the new policy fails
+#       to load, the running one is left as it is.
+def load_policy(switch, policy_name):
     try:
         if policy_name in sys.modules:
             del sys.modules[policy_name]
@@ -183,26 +191,34 @@ def load_policy(switch, policy_name):
     if main:
         policy = main()
         if isinstance(policy, Policy):
-            try:
-                validate.type_check.type_check_Policy(policy, _MAX_PORTS)
+            compiled_policy, is_cached = _policy_cache.get(policy)
+            if is_cached:
+                print "Policy [%s] (compile cache): hit [%s]" % (policy_name, compiled_policy.key)
+
+            if compiled_policy.type_error is None:
                 print "Policy [%s] (type check): passed!" % policy_name
-            except Exception, e:
-                switch.policy_name = ''
-                switch.policy = None
+            else:
                 raise RuntimeError('Policy [%s] (type check): failed... \n' % policy_name +
                            '\n' +
-                           'Exception message was:' + e.message)
+                           'Exception message was:' + compiled_policy.type_error)
 
-            area, latency = cost.cost_Policy(policy)
+            area, latency = compiled_policy.original_cost
             print "policy [%s] (original cost): Area=%s, Latency=%s" % (policy_name, area, latency)
 
-            policy = optimize.optimize_Policy(policy)
-            area, latency = cost.cost_Policy(policy)
+            if not is_cached:
+                print "Policy [%s] (optimize time): %s" % (policy_name, compiled_policy.optimize_time)
+            area, latency = compiled_policy.optimized_cost
             print "Policy [%s] (optimize cost): Area=%s, Latency=%s" % (policy_name, area, latency)
 
+            # Note: table updates not yet committed were meant for the policy being replaced
+            switch.clr_table_updates()
+            if switch.policy:
+                switch.policy.swap(compiled_policy.policy)
+            else:
+                switch.policy = execute.Execute(compiled_policy.policy, ordered=False,
+                                                queue_capacity=switch.queue_capacity, drop_policy=switch.drop_policy)
+                switch.policy.start()
             switch.policy_name = policy_name
-            switch.policy = execute.Execute(policy)
-            switch.policy.start()
         else:
             raise RuntimeError("Invalid policy: %s" % (policy_name, ))
     else:
@@ -216,6 +232,11 @@ def _do_ctl(event):
     event.worker.send(r + "\n")
 
 
+def _format_queue(name, stats):
+    return " queue %s: depth %s, drops %s, high watermark %s" % (
+        name, stats['depth'], stats['drops'], stats['high_watermark'])
+
+
 def _do_ctl2(event):
     def errf(msg, *args):
         raise RuntimeError(msg % args)
@@ -260,6 +281,7 @@ def _do_ctl2(event):
             ra(1)
             switch = _switches[event.args[0]]
 
+            switch.clr_table_updates()
             if switch.policy:
                 switch.policy.stop()
             switch.policy_name = ''
@@ -305,6 +327,16 @@ def _do_ctl2(event):
             s = []
             for switch in _switches.values():
                 s.append("Switch %s (%s)" % (switch.name, switch.policy_name))
+                if switch.policy:
+                    flow_cache = switch.policy.query_flow_cache()
+                    s.append(" flow cache: %s hits, %s wildcard hits, %s misses" % (
+                        flow_cache['hits'], flow_cache['wildcard_hits'], flow_cache['misses']))
+                s.append(_format_queue('rx', switch.rx_q.stats()))
+                if switch.policy:
+                    for name, stats in switch.policy.query_queues():
+                        s.append(_format_queue(name, stats))
+                for i, tx_q in enumerate(switch.tx_qs):
+                    s.append(_format_queue('tx %s' % i, tx_q.stats()))
                 for no, p in switch.ports.iteritems():
                     s.append(" %3s %s" % (no, p.name))
             return "\n".join(s)
@@ -318,15 +350,21 @@ def _do_ctl2(event):
 
 
 def launch(standalone=False, address='127.0.0.1', port=6633, max_retry_delay=16,
-           dpid=None, ports='', policy='', extra=None, ctl_port=None,
+           dpid=None, ports='', policy='', extra=None, ctl_port=None, policy_cache_dir=None,
            __INSTANCE__=None):
     """
     Launches a switch
+
+    policy_cache_dir (optional) is a directory where compiled policies are cached across runs
+    extra (optional) is more switch options, e.g., "queue_capacity=1024,drop_policy='random-early-drop',tx_threads=2"
     """
 
     if not pxpcap.enabled:
         raise RuntimeError("You need PXPCap to use this component")
 
+    if policy_cache_dir:
+        _policy_cache.directory = policy_cache_dir
+
     if ctl_port:
         if core.hasComponent('ctld'):
             raise RuntimeError("Only one ctl_port is allowed")
@@ -365,10 +403,18 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
         """
         log_level = kw.pop('log_level', self.default_log_level)
         self.policy = None
-        self.rx_q = Queue()
+        self.queue_capacity = kw.pop('queue_capacity', _QUEUE_CAPACITY)
+        self.drop_policy = kw.pop('drop_policy', TAIL_DROP)
+        self.rx_q = BoundedQueue(self.queue_capacity, self.drop_policy)
         self.consumer_thread = Thread(target=self._consumer_threadproc)
-        self.tx_q = Queue()
         self.producer_thread = Thread(target=self._producer_threadproc)
+        self.tx_qs = [BoundedQueue(self.queue_capacity, self.drop_policy)
+                      for _ in range(0, kw.pop('tx_threads', _TX_THREADS))]
+        self.tx_threads = [Thread(target=self._tx_threadproc, args=(tx_q,)) for tx_q in self.tx_qs]
+        self._packet_ids = count()
+        self._is_textual_vendor = False
+        # Note: the table updates received but not yet committed (see api.OutMessage.update_table_entries)
+        self._table_updates = []
         core.addListeners(self)
 
         ports = kw.pop('ports', [])
@@ -394,6 +440,8 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
 
         self.consumer_thread.start()
         self.producer_thread.start()
+        for tx_thread in self.tx_threads:
+            tx_thread.start()
 
     def add_interface(self, name, port_no=-1, on_error=None, start=False):
         if on_error is None:
@@ -464,11 +512,14 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
         self.policy_name = ''
         self.policy = None
         self.rx_q.put(None)
-        self.tx_q.put(None)
+        for tx_q in self.tx_qs:
+            tx_q.put(None)
 
     def _rx_vendor(self, vendor, connection):
         if vendor.data:
-            message = literal_eval(vendor.data)
+            # Note: replies are in the format of the controller's last message (see codec)
+            self._is_textual_vendor = codec.is_textual(vendor.data)
+            message = codec.decode(vendor.data)
             type = message['type']
 
             if type == 'out':
@@ -478,8 +529,11 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
         else:
             raise RuntimeError("Invalid message from the controller")
 
-    def _tx_vendor(self, vendor):
-        self.send(vendor)
+    def clr_table_updates(self):
+        self._table_updates = []
+
+    def _tx_vendor(self, message):
+        self.send(of.ofp_vendor_generic(data=codec.encode(message, self._is_textual_vendor)))
 
     def _handle_out_message(self, message, connection):
         if message['operation'] == 'set-policy':
@@ -487,6 +541,7 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
 
             load_policy(self, policy_name)
         elif message['operation'] == 'clr-policy':
+            self.clr_table_updates()
             if self.policy:
                 self.policy.stop()
             self.policy_name = ''
@@ -506,6 +561,19 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
             if self.policy:
                 t_id = TableId(t_name)
                 self.policy.del_table_entry(t_id, t_index)
+        elif message['operation'] == 'update-table-entries':
+            t_updates = message['data'][0]
+            commit = message['data'][1]
+
+            self._table_updates.extend(t_updates)
+            if commit:
+                ''' Taken before they are made, so a failed commit drops them rather than leaving them for the next '''
+                t_updates = self._table_updates
+                self.clr_table_updates()
+
+                if self.policy:
+                    self.policy.update_table_entries([(t_update[0], TableId(t_update[1])) + tuple(t_update[2:])
+                                                      for t_update in t_updates])
         elif message['operation'] == 'packet-out':
             # self.log.debug("Packet out details: %s", packet_out.show())
             ports = message['data'][0]
@@ -531,14 +599,32 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
 
                 data = {'type': 'in', 'operation': 'query-table-entry',
                         'data': (t_name, t_index, t_entry)}
-                self._tx_vendor(of.ofp_vendor_generic(data=str(data)))
+                self._tx_vendor(data)
         elif message['operation'] == 'query-table-list':
             if self.policy:
                 t_list = self.policy.query_table_list()
 
                 data = {'type': 'in', 'operation': 'query-table-list',
                         'data': t_list}
-                self._tx_vendor(of.ofp_vendor_generic(data=str(data)))
+                self._tx_vendor(data)
+        elif message['operation'] == 'dump-table':
+            t_name = message['data'][0]
+            t_start = message['data'][1]
+            t_stop = message['data'][2]
+            t_since = message['data'][3]
+            t_non_zero = message['data'][4]
+
+            if self.policy:
+                t_id = TableId(t_name)
+                t_version, t_fields, t_entries = self.policy.dump_table_entries(t_id, t_start, t_stop, t_since,
+                                                                                t_non_zero)
+
+                ''' Stream the entries, in as many messages as they need '''
+                t_entries_lists = codec.split_entries(t_name, t_version, t_fields, t_entries)
+                for i in range(0, len(t_entries_lists)):
+                    data = {'type': 'in', 'operation': 'dump-table',
+                            'data': (t_name, t_version, t_fields, t_entries_lists[i], i == len(t_entries_lists) - 1)}
+                    self._tx_vendor(data)
         else:
             raise RuntimeError("Invalid message from the controller")
 
@@ -555,9 +641,9 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
             batch = []
             while True:
                 self.rx_q.task_done()
-                port_no, data = data
-                # data = ethernet(data)
-                batch.append((data, port_no))
+                for port_no, packet_data in data:
+                    # packet_data = ethernet(packet_data)
+                    batch.append((packet_data, port_no))
                 try:
                     data = self.rx_q.get(block=False)
                 except:
@@ -565,28 +651,33 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
             core.callLater(self.rx_batch, batch)
 
     def rx_batch(self, batch):
-        for packet_data, port_no in batch:
-            self.rx_packet(None, port_no, packet_data)
+        if self.policy:
+            states = []
+            for packet_data, port_no in batch:
+                states.append(self._new_state(port_no, packet_data))
+
+            self.policy.put_batch(states)
 
     def _pcap_rx(self, px, data, sec, usec, length):
         if px.port_no is None: return
-        self.rx_q.put((px.port_no, data))
+        self.rx_q.offer([(px.port_no, data)])
 
-    def rx_packet(self, packet, in_port, packet_data=None):
-        if self.policy:
-            state = execute.State(execute.Header(), execute.Packet())
+    def _new_state(self, in_port, packet_data):
+        state = execute.State(execute.Header(), execute.Packet(packet_data),
+                              packet_id=next(self._packet_ids), in_port=in_port)
 
-            state.packet.append(BitArray(bytes=packet_data))
+        port = ports_to_bitmap(in_port)
+        state.header[Field('inport_bitmap')] = Value(port, Size(_MAX_PORTS))
+        state.header[Field('outport_bitmap')] = Value(0, Size(_MAX_PORTS))
+        state.header[Field('bit_length')] = Value(len(state.packet), Size(32))
+        state.header[Field('DRP')] = Value(0, Size(1))
+        state.header[Field('CTR')] = Value(0, Size(1))
 
-            port = ports_to_bitmap(in_port)
-            state.header[Field('inport_bitmap')] = Value(port, Size(_MAX_PORTS))
-            state.header[Field('outport_bitmap')] = Value(0, Size(_MAX_PORTS))
-            state.header[Field('bit_length')] = Value(len(state.packet), Size(32))
-            state.header[Field('DRP')] = Value(0, Size(1))
-            state.header[Field('CTR')] = Value(0, Size(1))
+        return state
 
-            self.policy.put(state)
-        self.tx_q.put((in_port, packet_data))
+    def rx_packet(self, packet, in_port, packet_data=None):
+        if self.policy:
+            self.policy.put(self._new_state(in_port, packet_data))
 
     def _output_packet_physical(self, packet, port_no):
         """
@@ -601,29 +692,47 @@ class ProgSwitch(ExpireMixin, SoftwareSwitchBase):
 
     tx_packet = _output_packet_physical
 
+    # Note: the states are drained as they are done (see Execute.get_completed), i.e., in order within a flow but not
+    #       across flows, and their packets are handed, in batches, to the tx thread of each output port. A port has a
+    #       single tx thread, so the packets of a flow go out in order.
     def _producer_threadproc(self):
+        timeout = 0.1
         while core.running:
-            data = self.tx_q.get()
-            if data is None:
+            policy = self.policy
+            if not policy:
+                sleep(timeout)
+                continue
+
+            batches = [[] for _ in self.tx_qs]
+            for state in policy.get_completed():
+                self._tx_state(state, batches)
+
+            for tx_q, batch in zip(self.tx_qs, batches):
+                if batch:
+                    tx_q.offer(batch)
+
+    def _tx_state(self, state, batches):
+        if state.header[Field('DRP')].value == 1:
+            pass
+        elif state.header[Field('CTR')].value == 1:
+            reason = (str(state.reason.reason), str(state.reason.description))
+            data = {'type': 'in', 'operation': 'packet-in',
+                    'data': (state.in_port, str(state.packet.data), reason)}
+            self._tx_vendor(data)
+        else:
+            out_ports = bitmap_to_ports(state.header[Field('outport_bitmap')].value)
+            # Note: the packet's bytearray is handed to pcap as is, with no conversion from bits (pcap still copies it)
+            packet_data = state.packet.data
+
+            for out_port in out_ports:
+                batches[out_port % len(batches)].append((packet_data, out_port))
+
+    def _tx_threadproc(self, tx_q):
+        while True:
+            batch = tx_q.get()
+            if batch is None:
                 # Signal to quit
                 break
-            (in_port, packet_data) = data
 
-            if self.policy:
-                state = self.policy.get()
-
-                if state.header[Field('DRP')].value == 1:
-                    pass
-                elif state.header[Field('CTR')].value == 1:
-                    reason = (str(state.reason.reason), str(state.reason.description))
-                    data = {'type': 'in', 'operation': 'packet-in',
-                            'data': (in_port, packet_data, reason)}
-                    self._tx_vendor(of.ofp_vendor_generic(data=str(data)))
-                else:
-                    out_ports = bitmap_to_ports(state.header[Field('outport_bitmap')].value)
-                    packet_data = state.packet.bytes
-
-                    for out_port in out_ports:
-                        self.tx_packet(packet_data, out_port)
-            else:
-                continue
+            for packet_data, out_port in batch:
+                self.tx_packet(packet_data, out_port)
@@ -0,0 +1,103 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        execute.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+'''
+Compare the per-packet cost of the execution engines, without and with their flow cache (the packets are all alike, so
+with the flow cache nearly every packet is a cache hit)
+
+Example:
+python -m netasm.examples.benchmarks.execute [iterations]
+'''
+
+import sys
+import time
+from importlib import import_module
+
+from netasm.netasm.core.syntax import *
+from netasm.netasm.core.execute import State, Header, Packet
+from netasm.netasm.core.execute import single_process, compiled, multi_process, flow_cache
+
+
+POLICIES = ['netasm.examples.netasm.standalone.hub',
+            'netasm.examples.netasm.standalone.pass_through_2ports',
+            'netasm.examples.netasm.standalone.decrement_loop',
+            'netasm.examples.netasm.standalone.learning_switch']
+
+ENGINES = [('single_process', single_process),
+           ('compiled', compiled),
+           ('multi_process', multi_process)]
+
+
+def new_state(in_port):
+    state = State(Header(), Packet(1000))
+    state.header[Field('inport_bitmap')] = Value(1 << (in_port - 1), Size(64))
+    state.header[Field('outport_bitmap')] = Value(0, Size(64))
+    state.header[Field('bit_length')] = Value(len(state.packet), Size(64))
+    state.header[Field('DRP')] = Value(0, Size(1))
+    state.header[Field('CTR')] = Value(0, Size(1))
+    return state
+
+
+def run(engine, policy_name, iterations, flow_cache_size):
+    policy = import_module(policy_name).main()
+
+    execute = engine.Execute(policy, flow_cache_size=flow_cache_size)
+    execute.start()
+
+    states = [new_state((i % 2) + 1) for i in range(iterations)]
+
+    beg_ts = time.time()
+    execute.put_batch(states)
+    execute.get_batch(len(states))
+    end_ts = time.time()
+
+    execute.stop()
+
+    return end_ts - beg_ts
+
+
+def main(iterations):
+    for policy_name in POLICIES:
+        print "Policy [%s] (%s packets):" % (policy_name, iterations)
+        for flow_cache_size in [0, flow_cache.FLOW_CACHE_SIZE]:
+            for engine_name, engine in ENGINES:
+                if flow_cache_size:
+                    engine_name += ' (flow cache)'
+                elapsed = run(engine, policy_name, iterations, flow_cache_size)
+                print "  %-30s %10.6f s  %10.2f us/packet" % (engine_name, elapsed, elapsed * 1e6 / iterations)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
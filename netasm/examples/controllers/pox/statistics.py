@@ -33,12 +33,18 @@
 
 from pox.core import core
 from pox.lib.util import dpidToStr
+from pox.lib.recoco import Timer
 
 from netasm.back_ends.soft_switch.api import *
 
 
 log = core.getLogger()
 
+# Note: the version of the last complete dump of each switch's table, so that a poll only gets the entries updated since
+_versions = {}
+# Note: the timer polling each switch, cancelled when the switch disconnects
+_timers = {}
+
 
 def _handle_VendorIn(event):
     in_msg = InMessage(event.ofp)
@@ -47,6 +53,18 @@ def _handle_VendorIn(event):
         print in_msg.table_name, in_msg.table_index, in_msg.table_entry
     elif in_msg.is_query_table_list:
         print in_msg.table_list
+    elif in_msg.is_dump_table:
+        for entry in in_msg.table_entries:
+            print in_msg.table_name, in_msg.table_version, entry
+        if in_msg.is_dump_complete:
+            _versions[event.dpid] = in_msg.table_version
+
+
+def _poll(connection, dpid):
+    msg = QueryMessage()
+
+    msg.dump_table('match_table', since=_versions.get(dpid))
+    connection.send(msg)
 
 
 def _handle_ConnectionUp(event):
@@ -57,17 +75,25 @@ def _handle_ConnectionUp(event):
 
     msg = QueryMessage()
 
-    msg.table_entry('match_table', 0)
-    event.connection.send(msg)
-
     msg.table_list()
     event.connection.send(msg)
 
+    if event.dpid in _timers:
+        _timers[event.dpid].cancel()
+    _timers[event.dpid] = Timer(1, _poll, args=[event.connection, event.dpid], recurring=True)
+
     log.info("netasm.examples.netasm.controller_assisted.table_based_simple (statistics) for %s", dpidToStr(event.dpid))
 
 
+def _handle_ConnectionDown(event):
+    if event.dpid in _timers:
+        _timers.pop(event.dpid).cancel()
+    _versions.pop(event.dpid, None)
+
+
 def launch():
     core.openflow.addListenerByName("ConnectionUp", _handle_ConnectionUp)
+    core.openflow.addListenerByName("ConnectionDown", _handle_ConnectionDown)
     core.openflow.addListenerByName("VendorIn", _handle_VendorIn)
 
     log.info("netasm.examples.netasm.controller_assisted.table_based_simple (statistics) running.")
\ No newline at end of file
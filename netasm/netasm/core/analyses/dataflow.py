@@ -0,0 +1,199 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        dataflow.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+from collections import deque
+
+# Note: this is the solver shared by the analyses. An analysis is a direction plus a transfer function, which gives
+#       the gen and kill sets of an instruction (out = gen | (in - kill), going forward, and in = gen | (out - kill),
+#       going backward). Sets are bitsets (ints) over an Index of the fields (or instructions) they hold, and the
+#       transfer functions of a basic block's instructions are composed into one for the whole block, so the worklist
+#       only ever runs over blocks. Blocks are visited in reverse-postorder (postorder, going backward) of the flow
+#       graph, and a block is only revisited when the sets flowing into it change.
+# Note: the transfer functions of the instructions (which only depend on the instruction, the argument fields and the
+#       exclude list) can be cached across runs of the same analysis, in a Cache, as the code is transformed. The
+#       cache's Index is kept as well, so the cached sets (bits) stay valid.
+# Note: the solver returns the in/out sets of every instruction as Sets, which read as {instruction: set()}, as the
+#       analyses did, and hand out the bitsets too (see Sets.bits). The sets are made on demand, once per distinct
+#       bitset, and are shared (frozen).
+
+FORWARD = 'forward'
+BACKWARD = 'backward'
+
+
+class Index:
+    def __init__(self):
+        self._bits = {}
+        self._elements = []
+        self._sets = {}
+
+    def bit(self, element):
+        bit = self._bits.get(element)
+        if bit is None:
+            bit = self._bits[element] = 1 << len(self._elements)
+            self._elements.append(element)
+        return bit
+
+    def bits(self, elements):
+        bits = 0
+        for element in elements:
+            bits |= self.bit(element)
+        return bits
+
+    def elements(self, bits):
+        elements = self._sets.get(bits)
+        if elements is None:
+            elements = []
+            _bits = bits
+            while _bits:
+                bit = _bits & -_bits
+                elements.append(self._elements[bit.bit_length() - 1])
+                _bits ^= bit
+            elements = self._sets[bits] = frozenset(elements)
+        return elements
+
+
+class Cache:
+    def __init__(self, index=None):
+        self.index = Index() if index is None else index
+        self.transfers = {}
+
+
+class Sets:
+    def __init__(self, index):
+        self.index = index
+        self._bits = {}
+
+    def bits(self, instruction):
+        return self._bits[instruction]
+
+    def __getitem__(self, instruction):
+        return self.index.elements(self._bits[instruction])
+
+    def get(self, instruction, default=None):
+        bits = self._bits.get(instruction)
+        if bits is None:
+            return default
+        return self.index.elements(bits)
+
+    def __contains__(self, instruction):
+        return instruction in self._bits
+
+    def __iter__(self):
+        return iter(self._bits)
+
+    def __len__(self):
+        return len(self._bits)
+
+    def iteritems(self):
+        for instruction, bits in self._bits.iteritems():
+            yield instruction, self.index.elements(bits)
+
+
+def _compose(transfers):
+    gen = 0
+    kill = 0
+    for _gen, _kill in transfers:
+        gen = _gen | (gen & ~_kill)
+        kill |= _kill
+    return gen, kill
+
+
+def solve(flow_graph, transfer, direction, index, cache=None):
+    ''' Transfer functions of the instructions (see Cache) and the blocks '''
+    transfers = [None] * len(flow_graph)
+    block_transfers = [None] * len(flow_graph)
+    for block, node in flow_graph.iteritems():
+        basic_block = node.basic_block if direction == FORWARD else node.basic_block[::-1]
+        if cache is None:
+            transfers[block] = [transfer(instruction) for instruction in basic_block]
+        else:
+            transfers[block] = []
+            for instruction in basic_block:
+                if instruction not in cache.transfers:
+                    cache.transfers[instruction] = transfer(instruction)
+                transfers[block].append(cache.transfers[instruction])
+        block_transfers[block] = _compose(transfers[block])
+
+    if direction == FORWARD:
+        order = flow_graph.reverse_postorder
+        sources = [node.predecessors for _, node in flow_graph.iteritems()]
+        targets = [node.successors for _, node in flow_graph.iteritems()]
+    else:
+        order = flow_graph.postorder
+        sources = [node.successors for _, node in flow_graph.iteritems()]
+        targets = [node.predecessors for _, node in flow_graph.iteritems()]
+
+    ''' Iterate over the worklist till a fixed-point is reached '''
+    block_ins = [0] * len(flow_graph)
+    block_outs = [0] * len(flow_graph)
+    worklist = deque(order)
+    pending = set(order)
+    while worklist:
+        block = worklist.popleft()
+        pending.discard(block)
+
+        _in = 0
+        for source in sources[block]:
+            _in |= block_outs[source]
+        block_ins[block] = _in
+
+        gen, kill = block_transfers[block]
+        _out = gen | (_in & ~kill)
+        if _out != block_outs[block]:
+            block_outs[block] = _out
+            for target in targets[block]:
+                if target not in pending:
+                    pending.add(target)
+                    worklist.append(target)
+
+    ''' Expand the sets of the blocks to their instructions '''
+    ins = Sets(index)
+    outs = Sets(index)
+    _ins = ins._bits
+    _outs = outs._bits
+    for block, node in flow_graph.iteritems():
+        basic_block = node.basic_block if direction == FORWARD else node.basic_block[::-1]
+        _in = block_ins[block]
+        for instruction, (gen, kill) in zip(basic_block, transfers[block]):
+            _out = gen | (_in & ~kill)
+            if direction == FORWARD:
+                _ins[instruction] = _in
+                _outs[instruction] = _out
+            else:
+                _outs[instruction] = _in
+                _ins[instruction] = _out
+            _in = _out
+
+    return ins, outs
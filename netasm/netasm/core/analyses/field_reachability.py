@@ -37,6 +37,7 @@ __author__ = 'shahbaz'
 
 from netasm.netasm.core.syntax import InstructionCollection as I, OperandCollection as O
 from netasm.netasm.core.graphs.control_flow_graph import Entry
+from netasm.netasm.core.analyses import dataflow as df
 
 
 class Use:
@@ -68,8 +69,6 @@ class Use:
             if isinstance(instruction.location, O.Location):
                 if isinstance(instruction.location.location.offset, O.Field):
                     operands |= {instruction.location.location.offset.field}
-                if isinstance(instruction.location.location.length, O.Field):
-                    operands |= {instruction.location.location.length.field}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.OP):
@@ -83,16 +82,12 @@ class Use:
             if isinstance(instruction.location, O.Location):
                 if isinstance(instruction.location.location.offset, O.Field):
                     operands |= {instruction.location.location.offset.field}
-                if isinstance(instruction.location.location.length, O.Field):
-                    operands |= {instruction.location.location.length.field}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.POP):
             if isinstance(instruction.location, O.Location):
                 if isinstance(instruction.location.location.offset, O.Field):
                     operands |= {instruction.location.location.offset.field}
-                if isinstance(instruction.location.location.length, O.Field):
-                    operands |= {instruction.location.location.length.field}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.BR):
@@ -199,48 +194,18 @@ class Kill:
         return operands
 
 
-# Propagate reachability information once at every node in the flow graph
-def _step(flow_graph, ins, outs, argument_fields, exclude_list):
-    use_ = Use.field
-    kill_ = Kill.field
+# Whether the instruction takes part in the analysis (i.e., whether adding or removing it can change the results)
+def affects(instruction, argument_fields, exclude_list):
+    return bool(Use.field(instruction, argument_fields, exclude_list) or
+                Kill.field(instruction, argument_fields, exclude_list))
 
-    for _, node in flow_graph.iteritems():
-        previous_instruction = None
 
-        for instruction in node.basic_block:
-            _out = []
-            if not previous_instruction:
-                for n in node.predecessors:
-                    last_instruction = flow_graph[n].basic_block[-1]
-                    _out.append(outs[last_instruction])
-            else:
-                _out.append(outs[previous_instruction])
-            previous_instruction = instruction
-
-            _in = set.union(set(), *_out)
-            _out = (use_(instruction, argument_fields, exclude_list) |
-                    (_in - kill_(instruction, argument_fields, exclude_list)))
-            ins[instruction] = _in
-            outs[instruction] = _out
-
-
-# Iterates until a fixed-point is reached
-def _solve(flow_graph, ins, outs, argument_fields, exclude_list):
-    _outs = outs.copy()
-    _step(flow_graph, ins, _outs, argument_fields, exclude_list)
-
-    if all(map(lambda i: outs[i] == _outs[i], outs.keys())):
-        return ins, outs
-    else:
-        return _solve(flow_graph, ins, _outs, argument_fields, exclude_list)
+# Compute field reachability in/out fields at every node in the control flow graph
+def analyse(flow_graph, argument_fields, exclude_list, cache=None):
+    index = df.Index() if cache is None else cache.index
 
+    def transfer(instruction):
+        return (index.bits(Use.field(instruction, argument_fields, exclude_list)),
+                index.bits(Kill.field(instruction, argument_fields, exclude_list)))
 
-# Compute field reachability in/out fields at every node in the control flow graph
-def analyse(flow_graph, argument_fields, exclude_list):
-    ins = {}
-    outs = {}
-    for _, node in flow_graph.iteritems():
-        for instruction in node.basic_block:
-            ins[instruction] = set()
-            outs[instruction] = set()
-    return _solve(flow_graph, ins, outs, argument_fields, exclude_list)
\ No newline at end of file
+    return df.solve(flow_graph, transfer, df.FORWARD, index, cache)
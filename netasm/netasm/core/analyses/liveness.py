@@ -36,6 +36,7 @@ __author__ = 'shahbaz'
 from netasm.netasm.core.syntax import InstructionCollection as I, OperandCollection as O
 from netasm.netasm.core.common import is_reserved_field
 from netasm.netasm.core.graphs.control_flow_graph import Exit
+from netasm.netasm.core.analyses import dataflow as df
 
 
 class Use:
@@ -63,8 +64,6 @@ class Use:
             if isinstance(instruction.location, O.Location):
                 if isinstance(instruction.location.location.offset, O.Field):
                     operands |= {instruction.location.location.offset.field}
-                if isinstance(instruction.location.location.length, O.Field):
-                    operands |= {instruction.location.location.length.field}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.OP):
@@ -76,16 +75,12 @@ class Use:
             if isinstance(instruction.location, O.Location):
                 if isinstance(instruction.location.location.offset, O.Field):
                     operands |= {instruction.location.location.offset.field}
-                if isinstance(instruction.location.location.length, O.Field):
-                    operands |= {instruction.location.location.length.field}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.POP):
             if isinstance(instruction.location, O.Location):
                 if isinstance(instruction.location.location.offset, O.Field):
                     operands |= {instruction.location.location.offset.field}
-                if isinstance(instruction.location.location.length, O.Field):
-                    operands |= {instruction.location.location.length.field}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.BR):
@@ -255,48 +250,18 @@ class Def():
         return operands
 
 
-# Propagate liveness information once at every node in the flow graph
-def _step(flow_graph, ins, outs, argument_fields, exclude_list):
-    use_ = Use.field
-    def_ = Def.field
+# Whether the instruction takes part in the analysis (i.e., whether adding or removing it can change the results)
+def affects(instruction, argument_fields, exclude_list):
+    return bool(Use.field(instruction, argument_fields, exclude_list) or
+                Def.field(instruction, argument_fields, exclude_list))
 
-    for _, node in flow_graph.iteritems():
-        next_instruction = None
 
-        for instruction in node.basic_block[::-1]:
-            _in = []
-            if not next_instruction:
-                for n in node.successors:
-                    first_instruction = flow_graph[n].basic_block[0]
-                    _in.append(ins[first_instruction])
-            else:
-                _in.append(ins[next_instruction])
-            next_instruction = instruction
-
-            _out = set.union(set(), *_in)
-            _in = (use_(instruction, argument_fields, exclude_list) |
-                   (_out - def_(instruction, argument_fields, exclude_list)))
-            ins[instruction] = _in
-            outs[instruction] = _out
-
-
-# Iterates until a fixed-point is reached
-def _solve(flow_graph, ins, outs, argument_fields, exclude_list):
-    _ins = ins.copy()
-    _step(flow_graph, _ins, outs, argument_fields, exclude_list)
-
-    if all(map(lambda l: ins[l] == _ins[l], ins.keys())):
-        return ins, outs
-    else:
-        return _solve(flow_graph, _ins, outs, argument_fields, exclude_list)
+# Compute the live-in/out fields/registers at every node in the flow graph
+def analyse(flow_graph, argument_fields, exclude_list, cache=None):
+    index = df.Index() if cache is None else cache.index
 
+    def transfer(instruction):
+        return (index.bits(Use.field(instruction, argument_fields, exclude_list)),
+                index.bits(Def.field(instruction, argument_fields, exclude_list)))
 
-# Compute the live-in/out fields/registers at every node in the flow graph
-def analyse(flow_graph, argument_fields, exclude_list):
-    ins = {}
-    outs = {}
-    for _, node in flow_graph.iteritems():
-        for instruction in node.basic_block:
-            ins[instruction] = set()
-            outs[instruction] = set()
-    return _solve(flow_graph, ins, outs, argument_fields, exclude_list)
\ No newline at end of file
+    return df.solve(flow_graph, transfer, df.BACKWARD, index, cache)
@@ -0,0 +1,96 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        manager.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+from netasm.netasm.core.syntax import InstructionCollection as I
+from netasm.netasm.core.graphs import control_flow_graph as cfg
+from netasm.netasm.core.analyses import dataflow as df
+
+# Note: the analyses of a code are cached, keyed by the analysis (module) and its exclude list, and are shared by the
+#       transformations run on the code. Transformations change the code in place, and the changes are picked up the
+#       next time an analysis is requested: only the results that the changes can affect are dropped (and computed
+#       again on request). Results stay valid when the instructions removed are transparent to an analysis (see the
+#       affects function of the analyses), i.e., their in and out sets are the same and so are everyone else's.
+#       Adding, moving or replacing instructions, or removing control-flow instructions, drops all the results.
+#       The results of a removed (transparent) instruction are left behind; they're just never looked up.
+# Note: the transfer functions of the instructions are cached too (see dataflow.Cache), and are kept when the results
+#       are dropped, so computing an analysis again only computes the transfer functions of the new instructions.
+# Note: the fields (and instructions) of a code are interned once, in an Index shared by all its analyses, so the
+#       bitsets of different analyses (see dataflow.Sets.bits) can be combined as they are.
+
+
+class Analyses:
+    def __init__(self, code):
+        self.code = code
+        self._instructions = list(code.instructions)
+        self._results = {}
+        self._caches = {}
+        self.index = df.Index()
+
+    def flow_graph(self):
+        return cfg.generate(self.code.instructions)
+
+    def analyse(self, analysis, exclude_list):
+        self.update()
+
+        key = (analysis, tuple(exclude_list), tuple(self.code.argument_fields))
+        if key not in self._results:
+            if key not in self._caches:
+                self._caches[key] = df.Cache(self.index)
+            self._results[key] = analysis.analyse(self.flow_graph(), self.code.argument_fields, exclude_list,
+                                                  self._caches[key])
+        return self._results[key]
+
+    def update(self):
+        instructions = self.code.instructions
+        if len(instructions) == len(self._instructions) and \
+                all(instruction is _instruction for instruction, _instruction in zip(instructions, self._instructions)):
+            return
+
+        ''' Find the instructions removed (the rest must be left as is) '''
+        instruction_ids = set(id(instruction) for instruction in instructions)
+        removed_list = [instruction for instruction in self._instructions if id(instruction) not in instruction_ids]
+        kept_list = [instruction for instruction in self._instructions if id(instruction) in instruction_ids]
+
+        if len(kept_list) != len(instructions) or \
+                any(instruction is not _instruction for instruction, _instruction in zip(instructions, kept_list)) or \
+                any(isinstance(instruction, (I.BR, I.JMP, I.LBL, I.HLT)) for instruction in removed_list):
+            self._results.clear()
+        else:
+            for key in self._results.keys():
+                analysis, exclude_list, argument_fields = key
+                if any(analysis.affects(instruction, argument_fields, exclude_list) for instruction in removed_list):
+                    del self._results[key]
+
+        self._instructions = list(instructions)
@@ -35,6 +35,7 @@ __author__ = 'shahbaz'
 
 from netasm.netasm.core.syntax import InstructionCollection as I, OperandCollection as O
 from netasm.netasm.core.common import is_reserved_field
+from netasm.netasm.core.analyses import dataflow as df
 
 
 class Gen:
@@ -107,132 +108,118 @@ class Kill:
         raise NotImplementedError
 
     @staticmethod
-    def field(flow_graph, instruction, argument_fields, exclude_list):
-
-        def defines(flow_graph, field, argument_fields):
-            instructions = set()
-
-            for _, node in flow_graph.iteritems():
-                for instruction in node.basic_block:
-                    if isinstance(instruction, I.ADD):
-                        if instruction.field.field == field:
-                            instructions |= {instruction}
-                    elif isinstance(instruction, I.LD):
-                        if isinstance(instruction.destination, O.Field):
-                            if instruction.destination.field == field:
-                                if not (is_reserved_field(field) or field in argument_fields):
-                                    instructions |= {instruction}
-                    elif isinstance(instruction, I.OP):
-                        if isinstance(instruction.destination, O.Field):
-                            if instruction.destination.field == field:
-                                if not (is_reserved_field(field) or field in argument_fields):
-                                    instructions |= {instruction}
-                    elif isinstance(instruction, I.LDt):
-                        if isinstance(instruction.destinations, O.Operands__):
-                            for operand in instruction.destinations:
-                                if isinstance(operand, O.Field):
-                                    if operand.field == field:
-                                        if not (is_reserved_field(field) or field in argument_fields):
-                                            instructions |= {instruction}
-                                            break
-                        else:
-                            raise RuntimeError()
-                    elif isinstance(instruction, I.LKt):
-                        if isinstance(instruction.index, O.Field):
-                            if instruction.index.field == field:
-                                if not (is_reserved_field(field) or field in argument_fields):
-                                    instructions |= {instruction}
-                    elif isinstance(instruction, I.CRC):
-                        if isinstance(instruction.destination, O.Field):
-                            if instruction.destination.field == field:
-                                if not (is_reserved_field(field) or field in argument_fields):
-                                    instructions |= {instruction}
-                    elif isinstance(instruction, I.HSH):
-                        if isinstance(instruction.destination, O.Field):
-                            if instruction.destination.field == field:
-                                if not (is_reserved_field(field) or field in argument_fields):
-                                    instructions |= {instruction}
-                    elif isinstance(instruction, I.CNC):
-                        if isinstance(instruction.codes, I.Codes):
-                            for code in instruction.codes:
-                                for _field in code.argument_fields:
-                                    if _field == field:
-                                        if not (is_reserved_field(field) or field in argument_fields):
-                                            instructions |= {instruction}
-                                            break
-                        else:
-                            raise RuntimeError()
-                    elif isinstance(instruction, I.ATM):
-                        if isinstance(instruction.code, I.Code):
-                            for _field in instruction.code.argument_fields:
-                                if _field == field:
-                                    if not (is_reserved_field(field) or field in argument_fields):
-                                        instructions |= {instruction}
-                                        break
-                        else:
-                            raise RuntimeError()
-                    elif isinstance(instruction, I.SEQ):
-                        if isinstance(instruction.code, I.Code):
-                            for _field in instruction.code.argument_fields:
-                                if _field == field:
-                                    if not (is_reserved_field(field) or field in argument_fields):
-                                        instructions |= {instruction}
-                                        break
-                        else:
-                            raise RuntimeError()
-                    elif isinstance(instruction, I.Instruction):
-                        pass
+    def definitions(flow_graph, argument_fields):
+        ''' Collect the instructions defining each field, in one pass over the flow graph '''
+        definitions = {}
+
+        def defines(field, instruction):
+            if not (is_reserved_field(field) or field in argument_fields):
+                definitions.setdefault(field, set()).add(instruction)
+
+        for _, node in flow_graph.iteritems():
+            for instruction in node.basic_block:
+                if isinstance(instruction, I.ADD):
+                    definitions.setdefault(instruction.field.field, set()).add(instruction)
+                elif isinstance(instruction, I.LD):
+                    if isinstance(instruction.destination, O.Field):
+                        defines(instruction.destination.field, instruction)
+                elif isinstance(instruction, I.OP):
+                    if isinstance(instruction.destination, O.Field):
+                        defines(instruction.destination.field, instruction)
+                elif isinstance(instruction, I.LDt):
+                    if isinstance(instruction.destinations, O.Operands__):
+                        for operand in instruction.destinations:
+                            if isinstance(operand, O.Field):
+                                defines(operand.field, instruction)
                     else:
                         raise RuntimeError()
+                elif isinstance(instruction, I.LKt):
+                    if isinstance(instruction.index, O.Field):
+                        defines(instruction.index.field, instruction)
+                elif isinstance(instruction, I.CRC):
+                    if isinstance(instruction.destination, O.Field):
+                        defines(instruction.destination.field, instruction)
+                elif isinstance(instruction, I.HSH):
+                    if isinstance(instruction.destination, O.Field):
+                        defines(instruction.destination.field, instruction)
+                elif isinstance(instruction, I.CNC):
+                    if isinstance(instruction.codes, I.Codes):
+                        for code in instruction.codes:
+                            for field in code.argument_fields:
+                                defines(field, instruction)
+                    else:
+                        raise RuntimeError()
+                elif isinstance(instruction, I.ATM):
+                    if isinstance(instruction.code, I.Code):
+                        for field in instruction.code.argument_fields:
+                            defines(field, instruction)
+                    else:
+                        raise RuntimeError()
+                elif isinstance(instruction, I.SEQ):
+                    if isinstance(instruction.code, I.Code):
+                        for field in instruction.code.argument_fields:
+                            defines(field, instruction)
+                    else:
+                        raise RuntimeError()
+                elif isinstance(instruction, I.Instruction):
+                    pass
+                else:
+                    raise RuntimeError()
+
+        return definitions
 
-            return instructions
+    @staticmethod
+    def field(definitions, instruction, argument_fields, exclude_list):
+
+        def defines(field):
+            return definitions.get(field, set())
 
         instructions = set()
 
         if any(map(lambda instruction_type: isinstance(instruction, instruction_type), exclude_list)):
             pass
         elif isinstance(instruction, I.ADD):
-            instructions |= defines(flow_graph, instruction.field.field, argument_fields) - {instruction}
+            instructions |= defines(instruction.field.field) - {instruction}
         elif isinstance(instruction, I.RMV):
-            instructions |= defines(flow_graph, instruction.field.field, argument_fields) - {instruction}
+            instructions |= defines(instruction.field.field) - {instruction}
         elif isinstance(instruction, I.LD):
             if isinstance(instruction.destination, O.Field):
-                instructions |= defines(flow_graph, instruction.destination.field, argument_fields) - {instruction}
+                instructions |= defines(instruction.destination.field) - {instruction}
         elif isinstance(instruction, I.OP):
             if isinstance(instruction.destination, O.Field):
-                instructions |= defines(flow_graph, instruction.destination.field, argument_fields) - {instruction}
+                instructions |= defines(instruction.destination.field) - {instruction}
         elif isinstance(instruction, I.LDt):
             if isinstance(instruction.destinations, O.Operands_):
                 for operand in instruction.destinations:
                     if isinstance(operand, O.Field):
-                        instructions |= defines(flow_graph, operand.field, argument_fields) - {instruction}
+                        instructions |= defines(operand.field) - {instruction}
                         # Note: a field can only be specified once in the destinations of LDt
         elif isinstance(instruction, I.LKt):
             if isinstance(instruction.index, O.Field):
-                instructions |= defines(flow_graph, instruction.index.field, argument_fields) - {instruction}
+                instructions |= defines(instruction.index.field) - {instruction}
         elif isinstance(instruction, I.CRC):
             if isinstance(instruction.destination, O.Field):
-                instructions |= defines(flow_graph, instruction.destination.field, argument_fields) - {instruction}
+                instructions |= defines(instruction.destination.field) - {instruction}
         elif isinstance(instruction, I.HSH):
             if isinstance(instruction.destination, O.Field):
-                instructions |= defines(flow_graph, instruction.destination.field, argument_fields) - {instruction}
+                instructions |= defines(instruction.destination.field) - {instruction}
         elif isinstance(instruction, I.CNC):
             if isinstance(instruction.codes, I.Codes):
                 for code in instruction.codes:
                     for field in code.argument_fields:
-                        instructions |= defines(flow_graph, field, argument_fields) - {instruction}
+                        instructions |= defines(field) - {instruction}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.ATM):
             if isinstance(instruction.code, I.Code):
                 for field in instruction.code.argument_fields:
-                    instructions |= defines(flow_graph, field, argument_fields) - {instruction}
+                    instructions |= defines(field) - {instruction}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.SEQ):
             if isinstance(instruction.code, I.Code):
                 for field in instruction.code.argument_fields:
-                    instructions |= defines(flow_graph, field, argument_fields) - {instruction}
+                    instructions |= defines(field) - {instruction}
             else:
                 raise RuntimeError()
         elif isinstance(instruction, I.Instruction):
@@ -243,48 +230,24 @@ class Kill:
         return instructions
 
 
-# Propagate reaching-definitions information once at every node in the flow graph
-def _step(flow_graph, ins, outs, argument_fields, exclude_list):
-    gen_ = Gen.field
-    kill_ = Kill.field
-
-    for _, node in flow_graph.iteritems():
-        previous_instruction = None
-
-        for instruction in node.basic_block:
-            _out = []
-            if not previous_instruction:
-                for n in node.predecessors:
-                    last_instruction = flow_graph[n].basic_block[-1]
-                    _out.append(outs[last_instruction])
-            else:
-                _out.append(outs[previous_instruction])
-            previous_instruction = instruction
+# Whether the instruction takes part in the analysis (i.e., whether adding or removing it can change the results)
+# Note: an instruction that isn't generated doesn't show up in the results, even if it is in the kill set of others.
+#       Besides the instructions that generate, only RMV kills definitions.
+def affects(instruction, argument_fields, exclude_list):
+    if any(map(lambda instruction_type: isinstance(instruction, instruction_type), exclude_list)):
+        return False
+    return bool(Gen.field(instruction, argument_fields, exclude_list)) or isinstance(instruction, I.RMV)
 
-            _in = set.union(set(), *_out)
-            _out = (gen_(instruction, argument_fields, exclude_list) |
-                    (_in - kill_(flow_graph, instruction, argument_fields, exclude_list)))
-            ins[instruction] = _in
-            outs[instruction] = _out
 
+# Compute reach-in/out fields/registers at every node in the flow graph
+# Note: the kill sets depend on all the definitions in the flow graph, so the transfer functions aren't cached (only
+#       the index is).
+def analyse(flow_graph, argument_fields, exclude_list, cache=None):
+    index = df.Index() if cache is None else cache.index
+    definitions = Kill.definitions(flow_graph, argument_fields)
 
-# Iterates until a fixed-point is reached
-def _solve(flow_graph, ins, outs, argument_fields, exclude_list):
-    _outs = outs.copy()
-    _step(flow_graph, ins, _outs, argument_fields, exclude_list)
-
-    if all(map(lambda i: outs[i] == _outs[i], outs.keys())):
-        return ins, outs
-    else:
-        return _solve(flow_graph, ins, _outs, argument_fields, exclude_list)
-
+    def transfer(instruction):
+        return (index.bits(Gen.field(instruction, argument_fields, exclude_list)),
+                index.bits(Kill.field(definitions, instruction, argument_fields, exclude_list)))
 
-# Compute reach-in/out fields/registers at every node in the flow graph
-def analyse(flow_graph, argument_fields, exclude_list):
-    ins = {}
-    outs = {}
-    for _, node in flow_graph.iteritems():
-        for instruction in node.basic_block:
-            ins[instruction] = set()
-            outs[instruction] = set()
-    return _solve(flow_graph, ins, outs, argument_fields, exclude_list)
\ No newline at end of file
+    return df.solve(flow_graph, transfer, df.FORWARD, index)
@@ -46,23 +46,25 @@ RESERVED_FIELDS = [Field('inport_bitmap'),
                    Field('bit_length')] + SPECIAL_FIELDS
 
 
+# Note: returns the (location, source) operands of the STs, as a location spans as many bits as its source (see
+#       execute_ST)
 def get_modified_locations(instructions):
-    modified_offsets = []
+    modified_locations = []
 
     for instruction in instructions:
         if isinstance(instruction, I.ST):
-            modified_offsets.append(instruction.location.location)
+            modified_locations.append((instruction.location, instruction.source))
         elif isinstance(instruction, I.ATM):
-            modified_offsets.extend(get_modified_locations(instruction.code.instructions))
+            modified_locations.extend(get_modified_locations(instruction.code.instructions))
         elif isinstance(instruction, I.SEQ):
-            modified_offsets.extend(get_modified_locations(instruction.code.instructions))
+            modified_locations.extend(get_modified_locations(instruction.code.instructions))
         elif isinstance(instruction, I.CNC):
             for code in instruction.codes:
-                modified_offsets.extend(get_modified_locations(code.instructions))
+                modified_locations.extend(get_modified_locations(code.instructions))
 
     # TODO: optimize by finding overlapping offset/length pairs and eliminate them
 
-    return modified_offsets
+    return modified_locations
 
 
 def get_modified_reserved_fields(instructions):
@@ -186,6 +188,44 @@ def get_instruction_at_label(instructions, label):
     raise TypeError("invalid label (%s)." % label)
 
 
+# Note: label indices map each label of an instructions list to the program counter of its LBL instruction, so that
+#       branch targets can be resolved without scanning the instructions (see get_pc_at_label)
+def get_label_indices(instructions):
+    label_indices = {}
+
+    for i in range(0, len(instructions)):
+        instruction = instructions[i]
+        if isinstance(instruction, I.LBL):
+            if instruction.label not in label_indices:
+                label_indices[instruction.label] = i
+
+    return label_indices
+
+
+# Note: code label indices hold the label indices of a code and of all its nested (CNC/ATM/SEQ) codes, keyed by the
+#       id of their instructions list
+def get_code_label_indices(code):
+    code_label_indices = {id(code.instructions): get_label_indices(code.instructions)}
+
+    for instruction in code.instructions:
+        if isinstance(instruction, I.ATM):
+            code_label_indices.update(get_code_label_indices(instruction.code))
+        elif isinstance(instruction, I.SEQ):
+            code_label_indices.update(get_code_label_indices(instruction.code))
+        elif isinstance(instruction, I.CNC):
+            for _code in instruction.codes:
+                code_label_indices.update(get_code_label_indices(_code))
+
+    return code_label_indices
+
+
+def get_pc_at_label(label_indices, label):
+    if label in label_indices:
+        return label_indices[label]
+
+    raise TypeError("invalid label (%s)." % label)
+
+
 def is_special_field(field):
     return True if field in SPECIAL_FIELDS else False
 
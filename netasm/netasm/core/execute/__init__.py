@@ -33,6 +33,12 @@
 
 __author__ = 'shahbaz'
 
+from array import array
+from binascii import hexlify, unhexlify
+from bisect import bisect_left, insort
+from struct import Struct
+import threading
+
 from bitstring import BitArray
 
 from netasm.netasm.core import syntax
@@ -45,8 +51,132 @@ class Header(dict):
         dict.__setitem__(self, field, value)
 
 
-class Packet(BitArray):
-    pass
+# Note: a packet is a bit-addressed view over a bytearray (the one it is given, if any; other data, e.g., a frame as a
+#       string, is copied into one), so frames go in and out of the engines without a conversion to and from bits
+#       (as with BitArray). Byte-aligned loads and stores of 8, 16, 32 and 64 bits go straight through struct (and
+#       other whole bytes through hexlify), only unaligned bit fields take the slow path of reading and writing the
+#       bytes around them. PUSH and POP insert and delete bytes in place.
+# Note: as with bitstring, a store past the end of the packet extends it (with zeros) and a load past the end reads
+#       only the bits that are there. Stored values are truncated to their size.
+_STRUCTS = {8: Struct('!B'), 16: Struct('!H'), 32: Struct('!I'), 64: Struct('!Q')}
+
+
+class Packet:
+    def __init__(self, data=None):
+        if data is None:
+            self.data = bytearray()
+            self._length = 0
+        elif isinstance(data, (int, long)):
+            ''' A packet of data zero bits (as with BitArray) '''
+            self.data = bytearray((data + 7) >> 3)
+            self._length = data
+        else:
+            if not isinstance(data, bytearray):
+                data = bytearray(data)
+            self.data = data
+            self._length = len(data) * 8
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def bytes(self):
+        return str(self.data)
+
+    def _resize(self, length):
+        size = (length + 7) >> 3
+        if size > len(self.data):
+            self.data.extend(bytearray(size - len(self.data)))
+        elif size < len(self.data):
+            del self.data[size:]
+        if length & 7:
+            ''' Keep the unused bits of the last byte zero '''
+            self.data[-1] &= (0xFF << (8 - (length & 7))) & 0xFF
+        self._length = length
+
+    def _load(self, offset, size):
+        end = offset + size
+        first, last = offset >> 3, (end + 7) >> 3
+        chunk = int(hexlify(self.data[first:last]), 16)
+        return (chunk >> ((last << 3) - end)) & ((1 << size) - 1)
+
+    def _store(self, offset, size, value):
+        end = offset + size
+        first, last = offset >> 3, (end + 7) >> 3
+        shift = (last << 3) - end
+        chunk = int(hexlify(self.data[first:last]), 16)
+        chunk = (chunk & ~(((1 << size) - 1) << shift)) | (value << shift)
+        self.data[first:last] = unhexlify('%0*x' % ((last - first) << 1, chunk))
+
+    def load(self, offset, size):
+        if offset + size > self._length:
+            size = self._length - offset
+        if size <= 0:
+            return 0
+
+        if not offset & 7:
+            _struct = _STRUCTS.get(size)
+            if _struct:
+                return int(_struct.unpack_from(self.data, offset >> 3)[0])
+            if not size & 7:
+                return int(hexlify(self.data[offset >> 3:(offset + size) >> 3]), 16)
+
+        return int(self._load(offset, size))
+
+    def store(self, offset, size, value):
+        if size <= 0:
+            return
+        value &= (1 << size) - 1
+        if offset + size > self._length:
+            self._resize(offset + size)
+
+        if not offset & 7:
+            _struct = _STRUCTS.get(size)
+            if _struct:
+                _struct.pack_into(self.data, offset >> 3, value)
+                return
+            if not size & 7:
+                self.data[offset >> 3:(offset + size) >> 3] = unhexlify('%0*x' % (size >> 2, value))
+                return
+
+        self._store(offset, size, value)
+
+    def insert(self, offset, size, value):
+        if offset > self._length:
+            raise RuntimeError()
+        if size <= 0:
+            return
+        value &= (1 << size) - 1
+
+        if not (offset | size | self._length) & 7:
+            self.data[offset >> 3:offset >> 3] = unhexlify('%0*x' % (size >> 2, value))
+            self._length += size
+        else:
+            ''' Shift the bits after offset along by size '''
+            tail_size = self._length - offset
+            tail = self.load(offset, tail_size)
+            self._resize(self._length + size)
+            self.store(offset, size, value)
+            self.store(offset + size, tail_size, tail)
+
+    def remove(self, offset, size):
+        if offset + size > self._length:
+            size = self._length - offset
+        if size <= 0:
+            return 0
+        value = self.load(offset, size)
+
+        if not (offset | size | self._length) & 7:
+            del self.data[offset >> 3:(offset + size) >> 3]
+            self._length -= size
+        else:
+            ''' Shift the bits after offset + size back by size '''
+            tail_size = self._length - (offset + size)
+            tail = self.load(offset + size, tail_size)
+            self.store(offset, tail_size, tail)
+            self._resize(self._length - size)
+
+        return value
 
 
 class Pattern(dict):
@@ -69,113 +199,567 @@ class SimplePattern(Pattern):
         return dict.__getitem__(self, field)
 
 
-class Patterns(list):
-    pass
+# Note: an exact index maps the values of the table entries to the (sorted) indices of the entries holding them, so
+#       that an exact-match lookup is O(1) and still returns the first (lowest index) match
+# Note: the index starts with the entries 0 to length - 1 all holding key, which costs nothing per entry: only the
+#       entries updated since are kept (in _keys and _indices), and the others are found as the ones from first on
+#       that aren't in _keys. An update with key None leaves the entry holding no key.
+class ExactIndex:
+    def __init__(self, length=0, key=None):
+        self._length = length
+        self._key = key
+        self._first = 0
+        self._keys = {}
+        self._indices = {}
+
+    def update(self, index, key):
+        old_key = self._keys.get(index)
+        if old_key is not None:
+            indices = self._indices[old_key]
+            del indices[bisect_left(indices, index)]
+            if not indices:
+                del self._indices[old_key]
+
+        self._keys[index] = key
+        if key is not None:
+            insort(self._indices.setdefault(key, []), index)
+
+        ''' Move past the entries no longer holding the initial key '''
+        while self._first < self._length and self._first in self._keys:
+            self._first += 1
+
+    def lookup(self, values):
+        key = tuple(values)
+        indices = self._indices.get(key)
+        index = indices[0] if indices else -1
+
+        if key == self._key and self._first < self._length and (index == -1 or self._first < index):
+            index = self._first
+        return index
+
+
+# Note: a tuple space index (for ternary, i.e. masked, lookups) groups the table entries by their masks. Each group is
+#       an exact index of the entries' values, looked up with the values masked by the group's masks, and the first
+#       match is the lowest index matched across groups. A lookup therefore costs one hash lookup per distinct set of
+#       masks, whatever the number of entries.
+class TupleSpaceIndex:
+    # Note: starts with the entries 0 to length - 1 all holding masks and key (kept as in ExactIndex, only the entries
+    #       updated since are in _masks)
+    def __init__(self, length=0, masks=None, key=None):
+        self._length = length
+        self._initial_masks = masks
+        self._masks = {}
+        self._groups = {masks: _TupleSpaceGroup(length, key)} if length else {}
+
+    def update(self, index, masks, key):
+        if index in self._masks:
+            old_masks = self._masks[index]
+        elif index < self._length:
+            old_masks = self._initial_masks
+        else:
+            old_masks = None
+
+        if old_masks is not None:
+            group = self._groups[old_masks]
+            group.update(index, None)
+            if group.is_empty():
+                del self._groups[old_masks]
+
+        self._masks[index] = masks
+        if masks not in self._groups:
+            self._groups[masks] = _TupleSpaceGroup()
+        self._groups[masks].update(index, key)
+
+    def lookup(self, values):
+        value = -1
+        for masks, group in self._groups.iteritems():
+            index = group.lookup(tuple([values[i] & masks[i] for i in range(0, len(masks))]))
+            if index != -1 and (value == -1 or index < value):
+                value = index
+        return value
+
+
+class _TupleSpaceGroup(ExactIndex):
+    def __init__(self, length=0, key=None):
+        ExactIndex.__init__(self, length, key)
+        self._count = length
+
+    def _holds(self, index):
+        if index in self._keys:
+            return self._keys[index] is not None
+        return index < self._length
+
+    def update(self, index, key):
+        self._count -= self._holds(index)
+        ExactIndex.update(self, index, key)
+        self._count += key is not None
+
+    def is_empty(self):
+        return not self._count
+
+
+# Note: besides the controller-facing add/del/query_entry, patterns expose the entry operations used by the table
+#       instructions (read_entry for LDt, write_entry for STt, increment_entry for INCt and lookup_entry for LKt).
+#       Values are passed as plain integers, in the order of the pattern's fields, so that the same operations can
+#       also be served by tables kept elsewhere (see multi_process.SharedPatterns). Patterns keep an index of their
+#       entries up to date on every update, for lookup_entry.
+# Note: array patterns keep a table's entries in columns, one array of fixed-width words per field (plus one per mask
+#       for match tables), sized from the table declaration. Fields wider than a word span several words per entry.
+#       Values (and masks) are stored at the field's width, so, e.g., a full mask reads back as -1 and an INCt wraps
+#       around. Allocating a table is a few array allocations, whatever its size.
+WORD_TYPECODE = 'L'
+WORD_BITS = array(WORD_TYPECODE).itemsize * 8
+WORD_MASK = (1 << WORD_BITS) - 1
+
+
+class ArrayPatterns:
+    def __init__(self, pattern, length):
+        self.fields = pattern.keys()
+        self._length = length
+        self._lock = self._new_lock()
+
+        self._sizes = []
+        self._limits = []
+        self._words = []
+        self._values = []
+        for field in self.fields:
+            size = int(self._size(pattern[field]))
+            words = (size + WORD_BITS - 1) // WORD_BITS
+            self._sizes.append(size)
+            self._limits.append((1 << size) - 1)
+            self._words.append(words)
+            self._values.append(self._new_column(array(WORD_TYPECODE, [0]) * (length * words)))
+
+        # Note: the version at which each entry was last updated (see dump_entries)
+        self._stamps = self._new_column(array(WORD_TYPECODE, [0]) * length)
+
+        self._index = None
+        self._version = 0
+
+    def __len__(self):
+        return self._length
+
+    def _new_lock(self):
+        return threading.Lock()
+
+    def _new_column(self, column):
+        return column
+
+    def _size(self, value):
+        raise NotImplementedError()
+
+    def _new_index(self):
+        raise NotImplementedError()
+
+    def _reindex(self, index):
+        raise NotImplementedError()
+
+    def _is_initial(self, index):
+        raise NotImplementedError()
+
+    def _matches(self, index, values):
+        raise NotImplementedError()
+
+    # Note: called, with the lock held, after an entry is updated
+    def _updated(self, index):
+        self._version += 1
+        self._stamps[index] = self._version
+        self._reindex(index)
+
+    # Note: called, with the lock held, after all the entries are updated (see copy_entries). The version moves past
+    #       both its own and the given one (e.g., of the patterns copied).
+    def _updated_all(self, version):
+        self._version = max(self._version, version) + 1
+        self._reindex_all()
+
+    # Note: the version of the entries changes whenever an entry does (see flow_cache)
+    def version(self):
+        return self._version
+
+    # Note: the entries still as they started are in the new index already (see ExactIndex)
+    def _reindex_all(self):
+        self._index = self._new_index()
+        for index in range(0, self._length):
+            if not self._is_initial(index):
+                self._reindex(index)
+
+    def _columns(self):
+        return [self._values]
+
+    def _check_index(self, index):
+        if not (0 <= index < self._length):
+            raise RuntimeError()
 
+    def _words_of(self, value, words):
+        return [(value >> (WORD_BITS * k)) & WORD_MASK for k in range(0, words)]
+
+    def _get(self, columns, i, index):
+        # Note: words may read back as longs; values are ints (where they fit) everywhere else
+        words = self._words[i]
+        if words == 1:
+            return int(columns[i][index])
+
+        value = 0
+        offset = index * words
+        for k in range(0, words):
+            value |= columns[i][offset + k] << (WORD_BITS * k)
+        return int(value)
+
+    def _set(self, columns, i, index, value):
+        value &= self._limits[i]
+
+        words = self._words[i]
+        if words == 1:
+            columns[i][index] = value
+            return
+
+        offset = index * words
+        for k in range(0, words):
+            columns[i][offset + k] = (value >> (WORD_BITS * k)) & WORD_MASK
+
+    # Note: whether the entry already holds the values (and masks), in which case writing it is skipped
+    def _is_entry(self, index, values, masks=None):
+        for i in range(0, len(values)):
+            if self._get(self._values, i, index) != values[i] & self._limits[i]:
+                return False
+            if masks is not None and self._get(self._masks, i, index) != int(masks[i]) & self._limits[i]:
+                return False
+        return True
+
+    def _field_index(self, field):
+        field = syntax.Field(field)
+        if field not in self.fields:
+            raise RuntimeError()
+        return self.fields.index(field)
+
+    def _scan(self, values):
+        for index in range(0, self._length):
+            if self._matches(index, values):
+                return index
+        return -1
+
+    def read_entry(self, index):
+        self._check_index(index)
+
+        return [self._get(self._values, i, index) for i in range(0, len(self.fields))]
+
+    # Note: patterns are compatible if they are of the same kind and have the same fields (of the same sizes),
+    #       whatever their lengths and the order of their fields
+    def is_compatible(self, patterns):
+        return dict(zip(self.fields, self._sizes)) == dict(zip(patterns.fields, patterns._sizes))
+
+    # Note: copies the entries of compatible patterns, e.g., of the tables of a policy being swapped out (see
+    #       single_process.migrate_tables). Entries past the length of the shorter of the two are left as they are.
+    #       The entries keep the versions they were updated at, and the version carries on from the patterns' (see
+    #       dump_entries), so a table's version only increases across swaps.
+    def copy_entries(self, patterns):
+        if not self.is_compatible(patterns):
+            raise RuntimeError()
 
-class MatchPatterns(Patterns):
-    def __init__(self, *args):
-        super(Patterns, self).__init__()
+        length = min(self._length, patterns._length)
+        with patterns._lock:
+            with self._lock:
+                for i in range(0, len(self.fields)):
+                    j = patterns.fields.index(self.fields[i])
+                    size = length * self._words[i]
+                    for columns, _columns in zip(self._columns(), patterns._columns()):
+                        columns[i][:size] = _columns[j][:size]
+                self._stamps[:length] = patterns._stamps[:length]
+                self._updated_all(patterns.version())
+
+    def lookup_entry(self, values):
+        if len(values) != len(self.fields):
+            raise RuntimeError()
 
-        for arg in args:
-            list.append(self, arg)
+        return self._index.lookup(values)
+
+    # Note: the values of the i-th of columns (copied from an entry on, see dump_entries) at indices
+    def _get_column(self, columns, i, indices):
+        if self._words[i] == 1:
+            column = columns[i]
+            return [int(column[index]) for index in indices]
+        return [self._get(columns, i, index) for index in indices]
+
+    def _get_dump_masks(self, columns, indices):
+        return None
+
+    # Note: returns the version of the entries, their fields and the entries from start to stop (the end, if None),
+    #       i.e., (index, values) or, for match patterns, (index, values, masks). The entries are copied at once, so
+    #       they are as they all were at that version. With since (the version of an earlier dump), only the entries
+    #       updated after it are returned; with non_zero, only those with a value other than 0 (e.g., the counters INCt
+    #       has incremented). A since past the version (i.e., not of a dump of these entries) is ignored.
+    def dump_entries(self, start=0, stop=None, since=None, non_zero=False):
+        stop = self._length if stop is None else min(stop, self._length)
+        if not (0 <= start <= stop):
+            raise RuntimeError()
 
-    def __setitem__(self, index, pattern):
-        list.__setitem__(self, index, pattern)
+        with self._lock:
+            version = int(self.version())
+            stamps = self._stamps[start:stop]
+            columns = [[column[i][start * self._words[i]:stop * self._words[i]] for i in range(0, len(self.fields))]
+                       for column in self._columns()]
 
-    def __getitem__(self, index):
-        return list.__getitem__(self, index)
+        indices = range(0, stop - start)
+        if since is not None and since <= version:
+            indices = [index for index in indices if stamps[index] > since]
 
-    def add_entry(self, index, entry):
-        if index > len(self):
-            raise RuntimeError()
+        values = zip(*[self._get_column(columns[0], i, indices) for i in range(0, len(self.fields))])
+        masks = self._get_dump_masks(columns, indices)
 
-        pattern = list.__getitem__(self, index)
+        entries = []
+        for k in range(0, len(indices)):
+            if non_zero and not any(values[k]):
+                continue
 
-        if len(entry) > 0:
-            for field, value in entry.iteritems():
-                if not (isinstance(value, tuple) and len(value) == 2):
-                    raise RuntimeError()
+            if masks is None:
+                entries.append((start + indices[k], list(values[k])))
+            else:
+                entries.append((start + indices[k], list(values[k]), list(masks[k])))
 
-                field = syntax.Field(field)
-                if field not in pattern:
-                    raise RuntimeError()
+        return version, [str(field) for field in self.fields], entries
 
-                pattern[field][0].value = value[0]
-                pattern[field] = (pattern[field][0], syntax.Mask(value[1]))
+    def _check_entry(self, entry):
+        raise NotImplementedError()
 
-    def del_entry(self, index):
-        if index > len(self):
+    def _add_entry(self, index, entry):
+        raise NotImplementedError()
+
+    def _del_entry(self, index):
+        raise NotImplementedError()
+
+    # Note: raises if the update can't be made (see update_entries), without making it
+    def check_update(self, operation, index, entry=None):
+        self._check_index(index)
+
+        if operation in ('add', 'mod'):
+            self._check_entry(entry)
+        elif operation != 'del' or entry is not None:
             raise RuntimeError()
 
-        pattern = list.__getitem__(self, index)
+    # Note: makes a list of (checked) updates at once, i.e., (operation, index, entry) where operation is 'add' (the
+    #       entry, with the fields not given as deleted), 'mod' (the fields given, with the others as they were) or
+    #       'del' (with no entry)
+    def update_entries(self, updates):
+        with self._lock:
+            for operation, index, entry in updates:
+                if operation != 'mod':
+                    self._del_entry(index)
+                if operation != 'del':
+                    self._add_entry(index, entry)
+                self._updated(index)
+
+
+class ArrayMatchPatterns(ArrayPatterns):
+    def __init__(self, pattern, length):
+        ArrayPatterns.__init__(self, pattern, length)
+
+        self._masks = []
+        for i in range(0, len(self.fields)):
+            self._masks.append(self._new_column(array(WORD_TYPECODE, self._words_of(self._limits[i], self._words[i])) *
+                                                length))
+
+        self._index = self._new_index()
+
+    def _size(self, (value, mask)):
+        return value.size
+
+    def _new_index(self):
+        return TupleSpaceIndex(self._length, tuple(self._limits), tuple([0] * len(self.fields)))
+
+    def _is_initial(self, index):
+        return self._is_entry(index, [0] * len(self.fields), self._limits)
+
+    def _reindex(self, index):
+        self._index.update(index,
+                           tuple([self._get(self._masks, i, index) for i in range(0, len(self.fields))]),
+                           tuple(self.read_entry(index)))
+
+    def _matches(self, index, values):
+        for i in range(0, len(values)):
+            if self._get(self._values, i, index) != (values[i] & self._get(self._masks, i, index)):
+                return False
+        return True
+
+    def _columns(self):
+        return [self._values, self._masks]
+
+    def is_compatible(self, patterns):
+        return isinstance(patterns, ArrayMatchPatterns) and ArrayPatterns.is_compatible(self, patterns)
+
+    def _get_mask(self, i, index):
+        mask = self._get(self._masks, i, index)
+        return -1 if mask == self._limits[i] else mask
+
+    def _get_dump_masks(self, columns, indices):
+        masks = []
+        for i in range(0, len(self.fields)):
+            limit = self._limits[i]
+            masks.append([-1 if mask == limit else mask for mask in self._get_column(columns[1], i, indices)])
+        return zip(*masks)
+
+    def _check_entry(self, entry):
+        for field, value in entry.iteritems():
+            if not (isinstance(value, tuple) and len(value) == 2):
+                raise RuntimeError()
+            if not (isinstance(value[0], (int, long)) and isinstance(value[1], (int, long))):
+                raise RuntimeError()
+
+            self._field_index(field)
+
+    def _add_entry(self, index, entry):
+        for field, (value, mask) in entry.iteritems():
+            i = self._field_index(field)
+            self._set(self._values, i, index, value)
+            self._set(self._masks, i, index, int(mask))
+
+    def _del_entry(self, index):
+        for i in range(0, len(self.fields)):
+            self._set(self._values, i, index, 0)
+            self._set(self._masks, i, index, -1)
+
+    def add_entry(self, index, entry):
+        self._check_index(index)
+        self._check_entry(entry)
+
+        with self._lock:
+            self._add_entry(index, entry)
+            self._updated(index)
 
-        for field, (value, mask) in pattern.iteritems():
-            value.value = 0
-            pattern[field] = (value, syntax.Mask(-1))
+    def del_entry(self, index):
+        self._check_index(index)
+
+        with self._lock:
+            self._del_entry(index)
+            self._updated(index)
 
     def query_entry(self, index):
-        pattern = list.__getitem__(self, index)
+        self._check_index(index)
 
         entry = {}
-        for field, (value, mask) in pattern.iteritems():
-            entry[str(field)] = {'value': (value.value, int(value.size)),
-                                 'mask': int(mask)}
+        with self._lock:
+            for i in range(0, len(self.fields)):
+                entry[str(self.fields[i])] = {'value': (self._get(self._values, i, index), self._sizes[i]),
+                                              'mask': self._get_mask(i, index)}
         return entry
 
+    def write_entry(self, index, values, masks=None):
+        if masks is None:
+            raise RuntimeError()
+        self._check_index(index)
 
-class SimplePatterns(Patterns):
-    def __init__(self, *args):
-        super(Patterns, self).__init__()
+        with self._lock:
+            if self._is_entry(index, values, masks):
+                return
 
-        for arg in args:
-            list.append(self, arg)
+            for i in range(0, len(values)):
+                self._set(self._values, i, index, values[i])
+                self._set(self._masks, i, index, int(masks[i]))
+            self._updated(index)
 
-    def __setitem__(self, index, pattern):
-        list.__setitem__(self, index, pattern)
+    def increment_entry(self, index):
+        raise RuntimeError()
 
-    def __getitem__(self, index):
-        return list.__getitem__(self, index)
 
-    def add_entry(self, index, entry):
-        if index > len(self):
-            raise RuntimeError()
+class ArraySimplePatterns(ArrayPatterns):
+    def __init__(self, pattern, length):
+        ArrayPatterns.__init__(self, pattern, length)
 
-        pattern = list.__getitem__(self, index)
+        self._index = self._new_index()
 
-        if len(entry) > 0:
-            for field, value in entry.iteritems():
-                field = syntax.Field(field)
-                if field not in pattern:
-                    raise RuntimeError()
+    def _size(self, value):
+        return value.size
 
-                pattern[field].value = value
+    def _new_index(self):
+        return ExactIndex(self._length, tuple([0] * len(self.fields)))
 
-    def del_entry(self, index):
-        if index > len(self):
-            raise RuntimeError()
+    def _is_initial(self, index):
+        return self._is_entry(index, [0] * len(self.fields))
+
+    def _reindex(self, index):
+        self._index.update(index, tuple(self.read_entry(index)))
+
+    def _matches(self, index, values):
+        for i in range(0, len(values)):
+            if self._get(self._values, i, index) != values[i]:
+                return False
+        return True
+
+    def is_compatible(self, patterns):
+        return isinstance(patterns, ArraySimplePatterns) and ArrayPatterns.is_compatible(self, patterns)
+
+    def _check_entry(self, entry):
+        for field, value in entry.iteritems():
+            if not isinstance(value, (int, long)):
+                raise RuntimeError()
+
+            self._field_index(field)
 
-        pattern = list.__getitem__(self, index)
+    def _add_entry(self, index, entry):
+        for field, value in entry.iteritems():
+            self._set(self._values, self._field_index(field), index, value)
 
-        for _, value in pattern.iteritems():
-            value.value = 0
+    def _del_entry(self, index):
+        for i in range(0, len(self.fields)):
+            self._set(self._values, i, index, 0)
+
+    def add_entry(self, index, entry):
+        self._check_index(index)
+        self._check_entry(entry)
+
+        with self._lock:
+            self._add_entry(index, entry)
+            self._updated(index)
+
+    def del_entry(self, index):
+        self._check_index(index)
+
+        with self._lock:
+            self._del_entry(index)
+            self._updated(index)
 
     def query_entry(self, index):
-        pattern = list.__getitem__(self, index)
+        self._check_index(index)
 
         entry = {}
-        for field, value in pattern.iteritems():
-            entry[str(field)] = {'value': (value.value, int(value.size))}
+        with self._lock:
+            for i in range(0, len(self.fields)):
+                entry[str(self.fields[i])] = {'value': (self._get(self._values, i, index), self._sizes[i])}
         return entry
 
+    def write_entry(self, index, values, masks=None):
+        if masks is not None:
+            raise RuntimeError()
+        self._check_index(index)
+
+        with self._lock:
+            if self._is_entry(index, values):
+                return
+
+            for i in range(0, len(values)):
+                self._set(self._values, i, index, values[i])
+            self._updated(index)
+
+    def increment_entry(self, index):
+        self._check_index(index)
+
+        with self._lock:
+            for i in range(0, len(self.fields)):
+                self._set(self._values, i, index, self._get(self._values, i, index) + 1)
+            self._updated(index)
+
 
+# Note: a state may carry an id and the port its packet came in on (i.e., ingress metadata), which the engines leave
+#       as they are, so the states can be told apart when they come out (see get_completed).
 class State:
-    def __init__(self, header, packet, reason=syntax.Reason('', ''), label=syntax.Label(''), extra=None):
+    def __init__(self, header, packet, reason=syntax.Reason('', ''), label=syntax.Label(''), extra=None,
+                 packet_id=None, in_port=None):
         self.header = header
         self.packet = packet
         self.reason = reason
         self.label = label
         self.extra = extra
+        self.packet_id = packet_id
+        self.in_port = in_port
 
 
 def execute_ID(state):
@@ -237,7 +821,7 @@ def execute_LD(state, destination, source):
         else:
             raise RuntimeError()
 
-        state.header[destination.field].value = int(state.packet[offset_value.value:(offset_value.value + size)].uint)
+        state.header[destination.field].value = state.packet.load(offset_value.value, size)
     else:
         raise RuntimeError()
 
@@ -265,7 +849,7 @@ def execute_ST(state, location, source):
         else:
             raise RuntimeError()
 
-        state.packet[offset_value.value:(offset_value.value + value.size)] = value.value
+        state.packet.store(offset_value.value, value.size, value.value)
     else:
         raise RuntimeError()
 
@@ -347,8 +931,7 @@ def execute_PUSH(state, location, source):
         else:
             raise RuntimeError()
 
-        state.packet.insert(BitArray(length=value.size), offset_value.value)
-        state.packet[offset_value.value:(offset_value.value + value.size)] = value.value
+        state.packet.insert(offset_value.value, value.size, value.value)
     else:
         raise RuntimeError()
 
@@ -374,8 +957,7 @@ def execute_POP(state, destination, location):
         else:
             raise RuntimeError()
 
-        state.header[destination.field].value = int(state.packet[offset_value.value:(offset_value.value + size)].uint)
-        del state.packet[offset_value.value:(offset_value.value + size)]
+        state.header[destination.field].value = state.packet.remove(offset_value.value, size)
     else:
         raise RuntimeError()
 
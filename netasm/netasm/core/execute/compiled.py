@@ -0,0 +1,508 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        compiled.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+# Note: this engine lowers a policy's code, once at load time, into a flat list of closures (one per instruction).
+#       Each closure has its operands, tables and branch targets already resolved and returns the program counter
+#       of the next instruction to run (or None on HLT). Executing a packet is then just a loop of calls through the
+#       list, without any per-instruction type dispatch.
+
+__author__ = 'shahbaz'
+
+import operator
+
+from netasm.netasm.core.syntax import InstructionCollection as I
+from netasm.netasm.core.common import get_reserved_fields, get_label_indices, get_pc_at_label
+from netasm.netasm.core.execute import *
+from netasm.netasm.core.execute import single_process
+from netasm.netasm.core.execute.single_process import BUDGET_EXCEEDED_REASON
+
+
+# TODO: add runtime errors' details.
+
+
+_ARITHMETIC_BITWISE_OPERATORS = {
+    syntax.OperatorCollection.Add: operator.add,
+    syntax.OperatorCollection.Sub: operator.sub,
+    syntax.OperatorCollection.Mul: operator.mul,
+    syntax.OperatorCollection.Div: operator.div,
+    syntax.OperatorCollection.And: operator.and_,
+    syntax.OperatorCollection.Or: operator.or_,
+    syntax.OperatorCollection.Xor: operator.xor}
+
+_COMPARISON_OPERATORS = {
+    syntax.OperatorCollection.Eq: operator.eq,
+    syntax.OperatorCollection.Neq: operator.ne,
+    syntax.OperatorCollection.Lt: operator.lt,
+    syntax.OperatorCollection.Gt: operator.gt,
+    syntax.OperatorCollection.Le: operator.le,
+    syntax.OperatorCollection.Ge: operator.ge}
+
+
+def _compile_Operand(operand):
+    if isinstance(operand, O.Value):
+        value = operand.value
+        return lambda header: value
+    elif isinstance(operand, O.Field):
+        field = operand.field
+        return lambda header: header[field]
+    else:
+        raise RuntimeError()
+
+
+def _compile_Offset(location):
+    if isinstance(location, O.Location):
+        return _compile_Operand(location.location.offset)
+    else:
+        raise RuntimeError()
+
+
+def _compile_ID(next_pc):
+    def _ID(state):
+        return next_pc
+
+    return _ID
+
+
+def _compile_DRP(next_pc, reason):
+    field = syntax.Field('DRP')
+
+    def _DRP(state):
+        state.reason = reason
+        state.header[field].value = 1
+        return next_pc
+
+    return _DRP
+
+
+def _compile_CTR(next_pc, reason):
+    field = syntax.Field('CTR')
+
+    def _CTR(state):
+        state.reason = reason
+        state.header[field].value = 1
+        return next_pc
+
+    return _CTR
+
+
+def _compile_ADD(next_pc, field, size):
+    field = field.field
+
+    def _ADD(state):
+        state.header[field] = syntax.Value(0, size)
+        return next_pc
+
+    return _ADD
+
+
+def _compile_RMV(next_pc, field):
+    field = field.field
+
+    def _RMV(state):
+        del state.header[field]
+        return next_pc
+
+    return _RMV
+
+
+def _compile_LD(next_pc, destination, source):
+    if isinstance(destination, O.Field):
+        destination = destination.field
+    else:
+        raise RuntimeError()
+
+    if isinstance(source, O.Value):
+        source_value = source.value.value
+
+        def _LD(state):
+            state.header[destination].value = source_value
+            return next_pc
+    elif isinstance(source, O.Field):
+        source_field = source.field
+
+        def _LD(state):
+            header = state.header
+            header[destination].value = header[source_field].value
+            return next_pc
+    elif isinstance(source, O.Location):
+        offset = source.location.offset
+        if isinstance(offset, O.Value):
+            offset_value = offset.value.value
+
+            def _LD(state):
+                value = state.header[destination]
+                value.value = state.packet.load(offset_value, value.size)
+                return next_pc
+        elif isinstance(offset, O.Field):
+            offset_field = offset.field
+
+            def _LD(state):
+                header = state.header
+                value = header[destination]
+                offset_value = header[offset_field].value
+                value.value = state.packet.load(offset_value, value.size)
+                return next_pc
+        else:
+            raise RuntimeError()
+    else:
+        raise RuntimeError()
+
+    return _LD
+
+
+def _compile_ST(next_pc, location, source):
+    read_source = _compile_Operand(source)
+    read_offset = _compile_Offset(location)
+
+    def _ST(state):
+        header = state.header
+        value = read_source(header)
+        offset_value = read_offset(header).value
+        state.packet.store(offset_value, value.size, value.value)
+        return next_pc
+
+    return _ST
+
+
+def _compile_OP(next_pc, destination, left_source, operator, right_source):
+    if isinstance(destination, O.Field):
+        destination = destination.field
+    else:
+        raise RuntimeError()
+
+    if operator in _ARITHMETIC_BITWISE_OPERATORS:
+        operate = _ARITHMETIC_BITWISE_OPERATORS[operator]
+    else:
+        raise RuntimeError()
+
+    read_left = _compile_Operand(left_source)
+    read_right = _compile_Operand(right_source)
+
+    def _OP(state):
+        header = state.header
+        left_value = read_left(header)
+        right_value = read_right(header)
+        header[destination] = syntax.Value(operate(left_value.value, right_value.value),
+                                           syntax.Size(left_value.size if left_value.size > right_value.size
+                                                       else right_value.size))
+        return next_pc
+
+    return _OP
+
+
+def _compile_PUSH(next_pc, location, source):
+    def _PUSH(state):
+        execute_PUSH(state, location, source)
+        return next_pc
+
+    return _PUSH
+
+
+def _compile_POP(next_pc, destination, location):
+    def _POP(state):
+        execute_POP(state, destination, location)
+        return next_pc
+
+    return _POP
+
+
+def _compile_BR(next_pc, left_source, operator, right_source, label_pc):
+    if operator in _COMPARISON_OPERATORS:
+        compare = _COMPARISON_OPERATORS[operator]
+    else:
+        raise RuntimeError()
+
+    if isinstance(left_source, O.Field) and isinstance(right_source, O.Value):
+        # Note: this is the most common form of branch (i.e., compare a field against a constant)
+        left_field = left_source.field
+        right_value = right_source.value.value
+
+        def _BR(state):
+            if compare(state.header[left_field].value, right_value):
+                return label_pc
+            return next_pc
+    else:
+        read_left = _compile_Operand(left_source)
+        read_right = _compile_Operand(right_source)
+
+        def _BR(state):
+            header = state.header
+            if compare(read_left(header).value, read_right(header).value):
+                return label_pc
+            return next_pc
+
+    return _BR
+
+
+def _compile_JMP(label_pc):
+    def _JMP(state):
+        return label_pc
+
+    return _JMP
+
+
+def _compile_LDt(next_pc, tables, destinations, table_id, index):
+    patterns = tables[table_id].patterns
+    read_index = _compile_Operand(index)
+
+    fields = []
+    for operand in destinations:
+        if isinstance(operand, O.Field):
+            fields.append(operand.field)
+        else:
+            raise RuntimeError()
+
+    def _LDt(state):
+        header = state.header
+        values = patterns.read_entry(read_index(header).value)
+        for i in range(0, len(fields)):
+            header[fields[i]].value = values[i]
+        return next_pc
+
+    return _LDt
+
+
+def _compile_STt(next_pc, tables, table_id, index, sources):
+    patterns = tables[table_id].patterns
+    read_index = _compile_Operand(index)
+
+    if isinstance(sources, O.Operands_):
+        read_sources = [_compile_Operand(operand) for operand in sources]
+
+        def _STt(state):
+            header = state.header
+            patterns.write_entry(read_index(header).value,
+                                 [read_source(header).value for read_source in read_sources])
+            return next_pc
+    elif isinstance(sources, O.OperandsMasks_):
+        read_sources = [_compile_Operand(operand) for operand, _ in sources]
+        masks = [mask for _, mask in sources]
+
+        def _STt(state):
+            header = state.header
+            patterns.write_entry(read_index(header).value,
+                                 [read_source(header).value for read_source in read_sources], masks)
+            return next_pc
+    else:
+        raise RuntimeError()
+
+    return _STt
+
+
+def _compile_INCt(next_pc, tables, table_id, index):
+    patterns = tables[table_id].patterns
+    read_index = _compile_Operand(index)
+
+    def _INCt(state):
+        patterns.increment_entry(read_index(state.header).value)
+        return next_pc
+
+    return _INCt
+
+
+def _compile_LKt(next_pc, tables, index, table_id, sources):
+    patterns = tables[table_id].patterns
+    read_sources = [_compile_Operand(source) for source in sources]
+
+    if isinstance(index, O.Field):
+        index = index.field
+    else:
+        raise RuntimeError()
+
+    def _LKt(state):
+        header = state.header
+        header[index].value = patterns.lookup_entry([read_source(header).value for read_source in read_sources])
+        return next_pc
+
+    return _LKt
+
+
+def _compile_CRC(next_pc, destination, sources):
+    def _CRC(state):
+        execute_CRC(state, destination, sources)
+        return next_pc
+
+    return _CRC
+
+
+def _compile_HSH(next_pc, destination, sources):
+    def _HSH(state):
+        execute_HSH(state, destination, sources)
+        return next_pc
+
+    return _HSH
+
+
+def _compile_HLT():
+    def _HLT(state):
+        return None
+
+    return _HLT
+
+
+def _compile_Group(next_pc, codes):
+    def _Group(state):
+        for code in codes:
+            state = code(state)
+        return next_pc
+
+    return _Group
+
+
+def _compile_Atomic(next_pc, code, atomic_lock):
+    def _Atomic(state):
+        atomic_lock.acquire()
+        try:
+            code(state)
+        finally:
+            atomic_lock.release()
+        return next_pc
+
+    return _Atomic
+
+
+def _compile_Instruction(instructions, label_indices, tables, atomic_lock, pc):
+    instruction = instructions[pc]
+    next_pc = pc + 1
+
+    if isinstance(instruction, I.ID):
+        return _compile_ID(next_pc)
+    elif isinstance(instruction, I.DRP):
+        return _compile_DRP(next_pc, instruction.reason)
+    elif isinstance(instruction, I.CTR):
+        return _compile_CTR(next_pc, instruction.reason)
+    elif isinstance(instruction, I.ADD):
+        return _compile_ADD(next_pc, instruction.field, instruction.size)
+    elif isinstance(instruction, I.RMV):
+        return _compile_RMV(next_pc, instruction.field)
+    elif isinstance(instruction, I.LD):
+        return _compile_LD(next_pc, instruction.destination, instruction.source)
+    elif isinstance(instruction, I.ST):
+        return _compile_ST(next_pc, instruction.location, instruction.source)
+    elif isinstance(instruction, I.OP):
+        return _compile_OP(next_pc, instruction.destination, instruction.left_source,
+                           instruction.operator, instruction.right_source)
+    elif isinstance(instruction, I.PUSH):
+        return _compile_PUSH(next_pc, instruction.location, instruction.field)
+    elif isinstance(instruction, I.POP):
+        return _compile_POP(next_pc, instruction.destination, instruction.location)
+    elif isinstance(instruction, I.BR):
+        label_pc = get_pc_at_label(label_indices, instruction.label)
+        return _compile_BR(next_pc, instruction.left_source, instruction.operator,
+                           instruction.right_source, label_pc)
+    elif isinstance(instruction, I.JMP):
+        label_pc = get_pc_at_label(label_indices, instruction.label)
+        return _compile_JMP(label_pc)
+    elif isinstance(instruction, I.LBL):
+        return _compile_ID(next_pc)
+    elif isinstance(instruction, I.LDt):
+        return _compile_LDt(next_pc, tables, instruction.destinations, instruction.table_id, instruction.index)
+    elif isinstance(instruction, I.STt):
+        return _compile_STt(next_pc, tables, instruction.table_id, instruction.index, instruction.sources)
+    elif isinstance(instruction, I.INCt):
+        return _compile_INCt(next_pc, tables, instruction.table_id, instruction.index)
+    elif isinstance(instruction, I.LKt):
+        return _compile_LKt(next_pc, tables, instruction.index, instruction.table_id, instruction.sources)
+    elif isinstance(instruction, I.CRC):
+        return _compile_CRC(next_pc, instruction.destination, instruction.sources)
+    elif isinstance(instruction, I.HSH):
+        return _compile_HSH(next_pc, instruction.destination, instruction.sources)
+    elif isinstance(instruction, I.HLT):
+        return _compile_HLT()
+    elif isinstance(instruction, I.CNC):
+        return _compile_Group(next_pc, [compile_Code(code, tables, atomic_lock) for code in instruction.codes])
+    elif isinstance(instruction, I.ATM):
+        if atomic_lock is None:
+            return _compile_Group(next_pc, [compile_Code(instruction.code, tables, atomic_lock)])
+        return _compile_Atomic(next_pc, compile_Code(instruction.code, tables, atomic_lock), atomic_lock)
+    elif isinstance(instruction, I.SEQ):
+        return _compile_Group(next_pc, [compile_Code(instruction.code, tables, atomic_lock)])
+    else:
+        raise RuntimeError()
+
+
+def compile_Instructions(instructions, tables, atomic_lock=None):
+    label_indices = get_label_indices(instructions)
+
+    program = []
+    for pc in range(0, len(instructions)):
+        program.append(_compile_Instruction(instructions, label_indices, tables, atomic_lock, pc))
+    return program
+
+
+def execute_Program(program, state):
+    pc = 0
+    if state.budget is None:
+        while pc is not None:
+            pc = program[pc](state)
+    else:
+        while pc is not None:
+            # Check the instruction budget (shared with the nested codes)
+            if state.budget <= 0:
+                return execute_DRP(state, BUDGET_EXCEEDED_REASON)
+            state.budget -= 1
+
+            pc = program[pc](state)
+    return state
+
+
+# Note: when several engines share the same tables (see multi_process.Worker), atomic_lock (a re-entrant lock) is held
+#       while an ATM code runs, so that its table updates are atomic with respect to the other engines
+def compile_Code(code, tables, atomic_lock=None):
+    program = compile_Instructions(code.instructions, tables, atomic_lock)
+    fields = list(code.argument_fields) + list(get_reserved_fields())
+
+    def _execute_Code(state):
+        # Save the current header
+        header = state.header
+
+        state.header = Header((field, header[field]) for field in fields)
+
+        # Execute program
+        state = execute_Program(program, state)
+
+        # Commit changes to the current header
+        _header = state.header
+        for field in fields:
+            header[field] = _header[field]
+
+        state.header = header
+
+        return state
+
+    return _execute_Code
+
+
+class Execute(single_process.Execute):
+    def _compile_Code(self, code, tables):
+        return compile_Code(code, tables)
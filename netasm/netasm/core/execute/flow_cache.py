@@ -0,0 +1,528 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        flow_cache.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import copy
+from binascii import hexlify
+
+from netasm.netasm.core.syntax import InstructionCollection as I
+from netasm.netasm.core.common import get_reserved_fields, get_label_indices, is_reserved_field
+from netasm.netasm.core.analyses import manager as am
+from netasm.netasm.core.analyses import liveness as li
+from netasm.netasm.core.execute import *
+
+
+# Note: a flow cache sits in front of a code's execution. It remembers, for each state a code
+#       has run on, the part of the state the code can read (its key) and what the code did with it (its result), so
+#       that a state with the same key gets the result without the code running. The key is the values (and sizes)
+#       of the header fields the code refers to and the first bytes of the packet, up to the furthest bit the code can
+#       load, store, push or pop (see get_location_extent). The result is the new values (and sizes) of these fields,
+#       the new first bytes of the packet (the rest of the packet is left as is), the reason and the label, and the
+#       table writes (STt and INCt) the code made, which are made again.
+# Note: a result also depends on the entries of the tables the code reads (LDt and LKt). The cache is cleared whenever
+#       they change (see ArrayPatterns.version), be it by the controller or by a code, and a result isn't kept if they
+#       changed while the code ran (e.g., by the code's own writes). A write that leaves an entry as it is doesn't
+#       change the table.
+# Note: codes whose packet accesses can't be bounded, i.e., at an offset held in a field, into (or from) a field not
+#       added by the code or popping in a loop, aren't cached. The cache is cleared when it is full.
+FLOW_CACHE_SIZE = 65536
+
+
+def _get_instructions_lists(instructions):
+    instructions_lists = [instructions]
+
+    for instruction in instructions:
+        if isinstance(instruction, I.ATM):
+            instructions_lists.extend(_get_instructions_lists(instruction.code.instructions))
+        elif isinstance(instruction, I.SEQ):
+            instructions_lists.extend(_get_instructions_lists(instruction.code.instructions))
+        elif isinstance(instruction, I.CNC):
+            for code in instruction.codes:
+                instructions_lists.extend(_get_instructions_lists(code.instructions))
+
+    return instructions_lists
+
+
+def _get_codes(code):
+    codes = [code]
+
+    for instruction in code.instructions:
+        if isinstance(instruction, (I.ATM, I.SEQ)):
+            codes.extend(_get_codes(instruction.code))
+        elif isinstance(instruction, I.CNC):
+            for _code in instruction.codes:
+                codes.extend(_get_codes(_code))
+
+    return codes
+
+
+def _get_fields(obj, fields):
+    if isinstance(obj, syntax.Field):
+        fields.add(obj)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _get_fields(item, fields)
+    elif isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            _get_fields(key, fields)
+            _get_fields(value, fields)
+    elif hasattr(obj, '__dict__'):
+        for value in vars(obj).itervalues():
+            _get_fields(value, fields)
+
+
+def get_referred_fields(instructions):
+    fields = set()
+    _get_fields(instructions, fields)
+    return fields
+
+
+def get_read_tables(instructions):
+    table_ids = set()
+
+    for _instructions in _get_instructions_lists(instructions):
+        for instruction in _instructions:
+            if isinstance(instruction, (I.LDt, I.LKt)):
+                table_ids.add(instruction.table_id)
+
+    return table_ids
+
+
+def get_written_tables(instructions):
+    table_ids = set()
+
+    for _instructions in _get_instructions_lists(instructions):
+        for instruction in _instructions:
+            if isinstance(instruction, (I.STt, I.INCt)):
+                table_ids.add(instruction.table_id)
+
+    return table_ids
+
+
+def _has_loop(instructions):
+    label_indices = get_label_indices(instructions)
+
+    for pc in range(0, len(instructions)):
+        instruction = instructions[pc]
+        if isinstance(instruction, (I.BR, I.JMP)):
+            if label_indices.get(instruction.label, pc + 1) <= pc:
+                return True
+
+    return False
+
+
+# Note: the extent (in bits) of the packet a code can access, or None if it can't be bounded. Each access is within the
+#       first (offset + size) bits of the packet as it is at that point, and only a POP brings later bits forward, so
+#       the code never gets past the extent of its accesses plus the bits it pops.
+def get_location_extent(instructions):
+    field_sizes = {}
+    for _instructions in _get_instructions_lists(instructions):
+        for instruction in _instructions:
+            if isinstance(instruction, I.ADD):
+                field = instruction.field.field
+                field_sizes[field] = max(field_sizes.get(field, 0), int(instruction.size))
+
+    def get_size(operand):
+        if isinstance(operand, O.Value):
+            return int(operand.value.size)
+        elif isinstance(operand, O.Field):
+            return field_sizes.get(operand.field)
+        else:
+            return None
+
+    extent = 0
+    popped = 0
+    has_pop = False
+    has_loop = False
+    for _instructions in _get_instructions_lists(instructions):
+        has_loop |= _has_loop(_instructions)
+
+        for instruction in _instructions:
+            if isinstance(instruction, I.LD) and isinstance(instruction.source, O.Location):
+                location, size = instruction.source, get_size(instruction.destination)
+            elif isinstance(instruction, I.ST):
+                location, size = instruction.location, get_size(instruction.source)
+            elif isinstance(instruction, I.PUSH):
+                location, size = instruction.location, get_size(instruction.field)
+            elif isinstance(instruction, I.POP):
+                location, size = instruction.location, get_size(instruction.destination)
+            else:
+                continue
+
+            offset = location.location.offset
+            if size is None or not isinstance(offset, O.Value):
+                return None
+
+            extent = max(extent, offset.value.value + size)
+            if isinstance(instruction, I.POP):
+                popped += size
+                has_pop = True
+
+    if has_pop and has_loop:
+        return None
+
+    return extent + popped
+
+
+# Note: what a code did on a run (see FlowCache._record): the fields it read (before writing them) and the fields it
+#       wrote, the bits of the packet it loaded and the edits it made to the packet, the tables it read (with their
+#       versions as they were then) and the writes it made to the tables
+# Note: the offsets of the packet that are only loaded into fields dead right after (see liveness), e.g., headers
+#       parsed but never looked at. The bits loaded from there don't change what the code does.
+def get_dead_load_offsets(code):
+    dead_offsets = set()
+    live_offsets = set()
+
+    for _code in _get_codes(code):
+        live_ins, live_outs = am.Analyses(_code).analyse(li, [I.ADD, I.RMV])
+
+        for instruction in _code.instructions:
+            if isinstance(instruction, I.LD) and isinstance(instruction.source, O.Location):
+                offset = instruction.source.location.offset
+                if not isinstance(offset, O.Value):
+                    continue
+
+                field = instruction.destination.field
+                if is_reserved_field(field) or field in _code.argument_fields or \
+                        field in live_outs.get(instruction, {field}):
+                    live_offsets.add(offset.value.value)
+                else:
+                    dead_offsets.add(offset.value.value)
+
+    return dead_offsets - live_offsets
+
+
+class _Recording:
+    def __init__(self):
+        self.read_fields = set()
+        self.written_fields = set()
+        self.loads = []
+        self.packet_edits = []
+        self.is_packet_moved = False
+        self.table_versions = {}
+        self.table_writes = []
+
+
+class _RecordingValue:
+    def __init__(self, value, field, recording):
+        self.__dict__['_value'] = value
+        self.__dict__['_field'] = field
+        self.__dict__['_recording'] = recording
+
+    def __getattr__(self, name):
+        if name == 'value' and self._field not in self._recording.written_fields:
+            self._recording.read_fields.add(self._field)
+        return getattr(self._value, name)
+
+    def __setattr__(self, name, value):
+        if name == 'value':
+            self._recording.written_fields.add(self._field)
+        setattr(self._value, name, value)
+
+
+class _RecordingPacket:
+    def __init__(self, packet, recording):
+        self._packet = packet
+        self._recording = recording
+
+    def __len__(self):
+        return len(self._packet)
+
+    def __getattr__(self, name):
+        return getattr(self._packet, name)
+
+    def load(self, offset, size):
+        self._recording.loads.append((offset, size))
+        return self._packet.load(offset, size)
+
+    def store(self, offset, size, value):
+        self._recording.packet_edits.append((Packet.store, (offset, size, value)))
+        self._packet.store(offset, size, value)
+
+    def insert(self, offset, size, value):
+        self._recording.packet_edits.append((Packet.insert, (offset, size, value)))
+        self._recording.is_packet_moved = True
+        self._packet.insert(offset, size, value)
+
+    def remove(self, offset, size):
+        self._recording.packet_edits.append((Packet.remove, (offset, size)))
+        self._recording.is_packet_moved = True
+        return self._packet.remove(offset, size)
+
+
+class _RecordingPatterns:
+    def __init__(self, patterns, flow_cache):
+        self._patterns = patterns
+        self._flow_cache = flow_cache
+
+    def _read(self):
+        recording = self._flow_cache.recording
+        if recording is not None and self._patterns not in recording.table_versions:
+            recording.table_versions[self._patterns] = self._patterns.version()
+
+    def read_entry(self, index):
+        self._read()
+        return self._patterns.read_entry(index)
+
+    def lookup_entry(self, values):
+        self._read()
+        return self._patterns.lookup_entry(values)
+
+    def write_entry(self, index, values, masks=None):
+        recording = self._flow_cache.recording
+        if recording is not None:
+            recording.table_writes.append((self._patterns.write_entry, (index, list(values), masks)))
+        self._patterns.write_entry(index, values, masks)
+
+    def increment_entry(self, index):
+        recording = self._flow_cache.recording
+        if recording is not None:
+            recording.table_writes.append((self._patterns.increment_entry, (index,)))
+        self._patterns.increment_entry(index)
+
+
+# Note: a flow cache has two tiers. Microflows are the exact-match results (see above), valid as long as the tables the
+#       code can read are as they were. Megaflows are wildcard results: on a miss, the code's run is recorded (see
+#       _Recording) and its result kept for every state that agrees with it on the fields and packet bits the run
+#       actually read, e.g., whatever its payload, the fields the run didn't branch on or the headers it loaded into
+#       dead fields (see get_dead_load_offsets). A megaflow is tagged with the versions of the tables the run read, and
+#       dropped when any of them has changed. Megaflows are grouped by the fields and packet bits they match on, and
+#       looked up group by group (as in TupleSpaceIndex).
+class FlowCache:
+    def __init__(self, code, tables, compile_code, extent, size=FLOW_CACHE_SIZE, counters=None, atomic_lock=None):
+        self._size = size
+        self._counters = counters if counters is not None else [0, 0, 0]
+        self._atomic_lock = atomic_lock
+        self._length = (extent + 7) >> 3
+        self._dead_offsets = get_dead_load_offsets(code)
+
+        read_table_ids = get_read_tables(code.instructions)
+        self._read_patterns = [tables[table_id].patterns for table_id in read_table_ids]
+
+        ''' Record the table reads and writes (see _RecordingPatterns) '''
+        self.recording = None
+        _tables = type(tables)(tables)
+        for table_id in read_table_ids | get_written_tables(code.instructions):
+            _tables[table_id] = copy.copy(tables[table_id])
+            _tables[table_id].patterns = _RecordingPatterns(tables[table_id].patterns, self)
+
+        self._execute_code = compile_code(code, _tables)
+
+        fields = set(code.argument_fields) | set(get_reserved_fields())
+        self._fields = sorted(fields & (get_referred_fields(code.instructions) | {syntax.Field('DRP'),
+                                                                                  syntax.Field('CTR')}))
+
+        self._microflows = {}
+        self._versions = None
+        self._megaflows = {}
+        self._megaflow_count = 0
+
+    def _is_current(self, table_versions):
+        for patterns, version in table_versions:
+            if patterns.version() != version:
+                return False
+        return True
+
+    # Note: makes the table writes of a result again, unless the tables it read have changed in the meantime
+    def _write_tables(self, table_writes, table_versions):
+        if table_writes and self._atomic_lock is not None:
+            with self._atomic_lock:
+                if not self._is_current(table_versions):
+                    return False
+                for write, arguments in table_writes:
+                    write(*arguments)
+        else:
+            for write, arguments in table_writes:
+                write(*arguments)
+        return True
+
+    def execute(self, state):
+        header = state.header
+        packet = state.packet
+        data = packet.data
+        if len(packet) != len(data) * 8:
+            return self._execute_code(state)
+
+        prefix = str(data[:self._length])
+        key = (tuple([(header[field].value, header[field].size) for field in self._fields]), prefix)
+        tail_length = max(len(data) - self._length, 0)
+
+        versions = tuple([patterns.version() for patterns in self._read_patterns])
+        if versions != self._versions:
+            self._microflows.clear()
+            self._versions = versions
+
+        ''' Lookup the microflows '''
+        microflow = self._microflows.get(key)
+        if microflow is not None:
+            values, _prefix, reason, label, table_writes = microflow
+
+            if self._write_tables(table_writes, zip(self._read_patterns, versions)):
+                self._counters[0] += 1
+
+                for field, value in zip(self._fields, values):
+                    header[field] = syntax.Value(value.value, value.size)
+                if _prefix is not None:
+                    data[:self._length] = _prefix
+                    state.packet = Packet(data)
+                state.reason = reason
+                state.label = label
+                return state
+
+        ''' Lookup the megaflows, or else run the code '''
+        table_writes = self._execute_megaflow(state, key)
+        if table_writes is not None:
+            self._counters[2] += 1
+        else:
+            self._counters[1] += 1
+            state, table_writes = self._record(state, key)
+
+        ''' Keep the microflow, if the tables read are as they were and the packet is still whole bytes '''
+        packet = state.packet
+        if tuple([patterns.version() for patterns in self._read_patterns]) == versions and not len(packet) & 7:
+            if len(self._microflows) >= self._size:
+                self._microflows.clear()
+
+            header = state.header
+            data = packet.data
+            _prefix = str(data[:len(data) - tail_length])
+            self._microflows[key] = ([syntax.Value(header[field].value, header[field].size) for field in self._fields],
+                                     None if _prefix == prefix else _prefix,
+                                     state.reason, state.label, table_writes)
+
+        return state
+
+    def _get_packet_value(self, prefix):
+        if not prefix:
+            return 0
+        return int(hexlify(prefix), 16) << (8 * (self._length - len(prefix)))
+
+    def _execute_megaflow(self, state, key):
+        if not self._megaflows:
+            return None
+
+        values = dict(zip(self._fields, key[0]))
+        packet_value = self._get_packet_value(key[1])
+
+        for (fields, packet_mask), megaflows in self._megaflows.iteritems():
+            megaflow_key = (tuple([values[field] for field in fields]), packet_value & packet_mask, len(key[1]))
+            megaflow = megaflows.get(megaflow_key)
+            if megaflow is None:
+                continue
+
+            written_values, packet_edits, reason, label, table_writes, table_versions = megaflow
+            if not (self._is_current(table_versions) and self._write_tables(table_writes, table_versions)):
+                del megaflows[megaflow_key]
+                self._megaflow_count -= 1
+                continue
+
+            header = state.header
+            for field, value in written_values:
+                header[field] = syntax.Value(value.value, value.size)
+            for edit, arguments in packet_edits:
+                edit(state.packet, *arguments)
+            state.reason = reason
+            state.label = label
+            return table_writes
+
+        return None
+
+    def _record(self, state, key):
+        recording = self.recording = _Recording()
+
+        header = state.header
+        _values = {}
+        for field in self._fields:
+            _values[field] = header[field]
+            header[field] = _RecordingValue(header[field], field, recording)
+        packet = state.packet
+        state.packet = _RecordingPacket(packet, recording)
+
+        try:
+            state = self._execute_code(state)
+        finally:
+            self.recording = None
+
+            for field in self._fields:
+                if isinstance(header[field], _RecordingValue):
+                    header[field] = _values[field]
+                else:
+                    recording.written_fields.add(field)
+            state.packet = packet
+
+        ''' Keep the megaflow, if the tables read are as they were '''
+        table_versions = recording.table_versions.items()
+        if self._is_current(table_versions):
+            if self._megaflow_count >= self._size:
+                self._megaflows.clear()
+                self._megaflow_count = 0
+
+            bits = self._length * 8
+            if recording.is_packet_moved:
+                packet_mask = (1 << bits) - 1
+            else:
+                packet_mask = 0
+                for offset, size in recording.loads:
+                    if offset in self._dead_offsets:
+                        continue
+                    end = min(offset + size, bits)
+                    if offset < end:
+                        packet_mask |= ((1 << (end - offset)) - 1) << (bits - end)
+
+            fields = tuple(sorted(recording.read_fields))
+            values = dict(zip(self._fields, key[0]))
+            megaflow_key = (tuple([values[field] for field in fields]),
+                            self._get_packet_value(key[1]) & packet_mask, len(key[1]))
+
+            megaflows = self._megaflows.setdefault((fields, packet_mask), {})
+            if megaflow_key not in megaflows:
+                self._megaflow_count += 1
+            megaflows[megaflow_key] = ([(field, syntax.Value(header[field].value, header[field].size))
+                                        for field in sorted(recording.written_fields)],
+                                       recording.packet_edits, state.reason, state.label,
+                                       recording.table_writes, table_versions)
+
+        return state, recording.table_writes
+
+
+# Note: returns compile_code(code, tables) (i.e., a function that executes the code on a state) with a flow cache of
+#       size microflows and megaflows in front of it. Hits on microflows, misses and hits on megaflows are counted in
+#       counters[0], counters[1] and counters[2]. When several engines share the tables (see multi_process.Worker),
+#       the table writes of a hit are made holding atomic_lock.
+def cache_Code(code, tables, compile_code, size=FLOW_CACHE_SIZE, counters=None, atomic_lock=None):
+    extent = get_location_extent(code.instructions)
+    if not size or extent is None:
+        return compile_code(code, tables)
+
+    return FlowCache(code, tables, compile_code, extent, size, counters, atomic_lock).execute
@@ -33,259 +33,132 @@
 
 __author__ = 'shahbaz'
 
-from copy import deepcopy
+from collections import deque
+from ctypes import c_ulong, memmove
 from functools import partial
-from multiprocessing import Process
+from multiprocessing import Process, Lock, RLock, Event, cpu_count
+from multiprocessing.sharedctypes import RawArray, RawValue
 
 from multiprocessing.queues import SimpleQueue as Queue
+import threading
 
 from netasm.netasm.core.syntax import InstructionCollection as I, Policy
 import netasm.netasm.core.graphs.control_flow_graph as cfg
 from netasm.netasm.core.common import get_modified_fields, get_reserved_fields, get_modified_reserved_fields, \
     get_modified_locations
 from netasm.netasm.core.execute import *
+from netasm.netasm.core.execute import single_process, compiled, flow_cache
+from netasm.netasm.core.execute.single_process import execute_LDt, execute_STt, execute_INCt, execute_LKt, \
+    swap_tables, migrate_tables, update_tables
+from netasm.netasm.core.utilities.queues import Admission, TAIL_DROP
 
 
 # TODO: add runtime errors' details.
 
 
-class Table(Process):
-    def __init__(self, patterns):
-        super(Table, self).__init__()
+# Note: shared patterns are array patterns (see ArrayPatterns) whose columns are in shared memory, so that every
+#       process (forked after the table is declared) reads and updates the entries directly. Updates hold the table's
+#       (inter-process) lock, so an STt writes its entry, and an INCt increments it, atomically.
+# Note: each process keeps its own index of the entries (see ExactIndex and TupleSpaceIndex). Updates append the
+#       updated entry's index to a shared log, which a process replays (or, if it has fallen too far behind, rebuilds
+#       its index) before a lookup. Indexed matches are verified against the entry, as it may be being updated.
+TABLE_LOG_LENGTH = 4096
 
-        self.patterns = patterns
-        self.input_interface = Queue()
-        self.output_interfaces = {'': Queue()}
 
-    def stop(self):
-        self.input_interface.put(None)
-        self.join()
+class SharedPatterns:
+    def _new_lock(self):
+        return Lock()
 
-    def run(self):
-        while True:
-            try:
-                data = self.input_interface.get()
+    def _new_column(self, column):
+        shared_column = RawArray(c_ulong, len(column))
+        if len(column) > 0:
+            memmove(shared_column, column.buffer_info()[0], len(column) * column.itemsize)
+        return shared_column
 
-                if data is None:
-                    return
+    def _new_log(self):
+        self._log = RawArray(c_ulong, TABLE_LOG_LENGTH)
+        self._log_count = RawValue(c_ulong, 0)
+        self._synced = 0
 
-                operation, items = data
-
-                if operation == 'add_entry':
-                    index, entry = items
-                    self.patterns.add_entry(index, entry)
-                elif operation == 'del_entry':
-                    index = items
-                    self.patterns.del_entry(index)
-                elif operation == 'query_entry':
-                    index = items
-                    entry = self.patterns.query_entry(index)
-                    self.output_interfaces[''].put(entry)
-                elif operation == 'write':
-                    index, pattern = items
-                    self.patterns[index] = pattern
-                elif operation == 'read':
-                    index, instruction_id = items
-                    pattern = self.patterns[index]
-                    self.output_interfaces[instruction_id].put(pattern)
-                elif operation == 'lookup':
-                    values, instruction_id = items
-                    value = -1
-                    if isinstance(self.patterns, MatchPatterns):
-                        for i in range(0, len(self.patterns)):
-                            pattern_list = self.patterns[i].values()
-
-                            if len(pattern_list) != len(values):
-                                raise RuntimeError()
-
-                            if all(map((lambda (value, mask), source: value.value == (source.value & mask)),
-                                       pattern_list, values)):
-                                value = i
-                                break
-                    elif isinstance(self.patterns, SimplePatterns):
-                        for i in range(0, len(self.patterns)):
-                            pattern_list = self.patterns[i].values()
-
-                            if all(map((lambda value, source: value.value == source.value),
-                                       pattern_list, values)):
-                                value = i
-                                break
-                    else:
-                        raise RuntimeError()
-                    self.output_interfaces[instruction_id].put(value)
-                else:
-                    raise RuntimeError()
-            except KeyboardInterrupt:
-                break
+    def _updated(self, index):
+        count = self._log_count.value
+        self._log[count % TABLE_LOG_LENGTH] = index
+        self._log_count.value = count + 1
+        self._stamps[index] = count + 1
 
+    # Note: every process rebuilds its index (see _sync) once the log has moved on by more than its length
+    def _updated_all(self, version):
+        self._log_count.value = max(self._log_count.value, version) + TABLE_LOG_LENGTH + 1
 
-class Tables(dict):
-    def __setitem__(self, table_id, table):
-        dict.__setitem__(self, table_id, table)
+    def version(self):
+        return self._log_count.value
 
-class ExecuteDecls:
-    def __init__(self, decls):
-        # Declare tables
-        self.tables = Tables()
-        for table_id, table in decls.table_decls.iteritems():
-            # generate pattern
-            if isinstance(table.table_fields, syntax.TableFieldsCollection.SimpleFields):
-                pattern = SimplePattern()
-                for field, size in table.table_fields.iteritems():
-                    pattern[field] = syntax.Value(0, size)
-
-                # generate list of patterns
-                patterns = SimplePatterns()
-                for i in range(0, table.size):
-                    patterns.insert(i, deepcopy(pattern))
-            elif isinstance(table.table_fields, syntax.TableFieldsCollection.MatchFields):
-                pattern = MatchPattern()
-                for field, (size, _) in table.table_fields.iteritems():
-                    pattern[field] = (syntax.Value(0, size), syntax.Mask(-1))
+    def _sync(self):
+        count = int(self._log_count.value)
+        if count == self._synced:
+            return
 
-                # generate list of patterns
-                patterns = MatchPatterns()
-                for i in range(0, table.size):
-                    patterns.insert(i, deepcopy(pattern))
-            else:
-                raise RuntimeError()
+        if count - self._synced > TABLE_LOG_LENGTH:
+            self._reindex_all()
+        else:
+            for c in range(self._synced, count):
+                self._reindex(int(self._log[c % TABLE_LOG_LENGTH]))
 
-            self.tables[table_id] = Table(patterns)
+            ''' Rebuild if the log wrapped around while being replayed '''
+            if self._log_count.value - self._synced > TABLE_LOG_LENGTH:
+                self._reindex_all()
 
+        self._synced = count
 
-def execute_LDt(state, table_interface, instruction, destinations, index):
-    index_value = None
-    ''' Lookup index '''
-    if isinstance(index, O.Value):
-        index_value = index.value
-    elif isinstance(index, O.Field):
-        index_value = state.header[index.field]
-    else:
-        raise RuntimeError()
+    def lookup_entry(self, values):
+        if len(values) != len(self.fields):
+            raise RuntimeError()
 
-    ''' Lookup table pattern '''
-    table_interface.put(('read', (index_value.value, id(instruction))))
-    pattern = table_interface.get()
-    pattern_list = pattern.values()
+        self._sync()
 
-    for i in range(0, len(destinations)):
-        operand = destinations[i]
+        index = self._index.lookup(values)
+        if index != -1 and not self._matches(index, values):
+            return self._scan(values)
 
-        if isinstance(operand, O.Field):
-            state.header[operand.field].value = pattern_list[i].value
-        else:
-            raise RuntimeError()
+        return index
 
-    state.label = syntax.Label('')
-    return state
 
+class SharedMatchPatterns(SharedPatterns, ArrayMatchPatterns):
+    def __init__(self, pattern, length):
+        ArrayMatchPatterns.__init__(self, pattern, length)
+        self._new_log()
 
-# TODO: type system to ensure destinations and patterns must have the same order
 
+class SharedSimplePatterns(SharedPatterns, ArraySimplePatterns):
+    def __init__(self, pattern, length):
+        ArraySimplePatterns.__init__(self, pattern, length)
+        self._new_log()
 
-def execute_STt(state, table_interface, instruction, index, sources):
-    index_value = None
-    ''' Lookup index '''
-    if isinstance(index, O.Value):
-        index_value = index.value
-    elif isinstance(index, O.Field):
-        index_value = state.header[index.field]
-    else:
-        raise RuntimeError()
 
-    ''' Lookup table pattern '''
-    table_interface.put(('read', (index_value.value, id(instruction))))
-    pattern = table_interface.get()
-    pattern_list = pattern.keys()
+class ExecuteDecls:
+    def __init__(self, decls):
+        # Declare tables
+        self.tables = single_process.Tables()
+        for table_id, table in decls.table_decls.iteritems():
+            # generate pattern
+            if isinstance(table.table_fields, syntax.TableFieldsCollection.SimpleFields):
+                pattern = SimplePattern()
+                for field, size in table.table_fields.iteritems():
+                    pattern[field] = syntax.Value(0, size)
 
-    if isinstance(sources, O.Operands_):
-        for i in range(0, len(sources)):
-            field = pattern_list[i]
-            operand = sources[i]
+                # generate shared patterns
+                patterns = SharedSimplePatterns(pattern, table.size)
+            elif isinstance(table.table_fields, syntax.TableFieldsCollection.MatchFields):
+                pattern = MatchPattern()
+                for field, (size, _) in table.table_fields.iteritems():
+                    pattern[field] = (syntax.Value(0, size), syntax.Mask(-1))
 
-            if isinstance(operand, O.Value):
-                pattern[field].value = operand.value.value
-            elif isinstance(operand, O.Field):
-                pattern[field].value = state.header[operand.field].value
+                # generate shared patterns
+                patterns = SharedMatchPatterns(pattern, table.size)
             else:
                 raise RuntimeError()
-    elif isinstance(sources, O.OperandsMasks_):
-        for i in range(0, len(sources)):
-            field = pattern_list[i]
-            operand, mask = sources[i]
-
-            if isinstance(operand, O.Value):
-                pattern[field][0].value = operand.value.value
-                pattern[field] = (pattern[field][0], mask)
-            elif isinstance(operand, O.Field):
-                pattern[field][0].value = state.header[operand.field].value
-                pattern[field] = (pattern[field][0], mask)
-            else:
-                raise RuntimeError()
-    else:
-        raise RuntimeError()
-
-    ''' Write back into the table '''
-    table_interface.put(('write', (index_value.value, pattern)))
-
-    state.label = syntax.Label('')
-    return state
-
-
-# TODO: type system to ensure destinations and patterns must have the same order
-
-
-def execute_INCt(state, table_interface, instruction, index):
-    index_value = None
-    ''' Lookup index '''
-    if isinstance(index, O.Value):
-        index_value = index.value
-    elif isinstance(index, O.Field):
-        index_value = state.header[index.field]
-    else:
-        raise RuntimeError()
-
-    ''' Lookup table pattern '''
-    table_interface.put(('read', (index_value.value, id(instruction))))
-    pattern = table_interface.get()
 
-    for field in pattern:
-        pattern[field].value += 1
-
-    ''' Write back into the table '''
-    table_interface.put(('write', (index_value.value, pattern)))
-
-    state.label = syntax.Label('')
-    return state
-
-
-def execute_LKt(state, table_interface, instruction, index, sources):
-    values = []
-    ''' Read sources values '''
-    for source in sources:
-        if isinstance(source, O.Value):
-            values.append(source.value)
-        elif isinstance(source, O.Field):
-            values.append(state.header[source.field])
-        else:
-            raise RuntimeError()
-
-    ''' Lookup table index '''
-    table_interface.put(('lookup', (values, id(instruction))))
-    value = table_interface.get()
-
-    ''' Lookup index '''
-    if isinstance(index, O.Field):
-        state.header[index.field].value = value
-    else:
-        raise RuntimeError()
-
-    state.label = syntax.Label('')
-    return state
-
-
-# TODO: 1) type system to ensure destinations and patterns must have the same order
-# TODO: 2) look into the -1 assignment issue
+            self.tables[table_id] = single_process.Table(patterns)
 
 
 class GroupProcess():
@@ -501,31 +374,25 @@ class GroupProcess():
                         state.header[field] = _state.header[field]
                     for field in self._modified_reserved_fields[i]:
                         state.header[field] = _state.header[field]
-                    for location in self._modified_locations[i]:
-                        offset_value = location.offset.value
-                        length_value = location.length.value
-                        state.header.packet[offset_value.value:(offset_value.value + length_value.value)] = \
-                            _state.packet[offset_value.value:(offset_value.value + length_value.value)]
+                    for location, source in self._modified_locations[i]:
+                        offset = location.location.offset
+                        if isinstance(offset, O.Value):
+                            offset_value = offset.value
+                        else:
+                            offset_value = _state.header[offset.field]
+                        if isinstance(source, O.Value):
+                            size = source.value.size
+                        else:
+                            size = _state.header[source.field].size
+                        state.packet.store(offset_value.value, size, _state.packet.load(offset_value.value, size))
 
                 self.output_interfaces[state.label].put(state)
             except KeyboardInterrupt:
                 break
 
 
-class TableInterface:
-    def __init__(self):
-        self.input_interface = Queue()
-        self.output_interface = None
-
-    def put(self, data):
-        self.output_interface.put(data)
-
-    def get(self):
-        return self.input_interface.get()
-
-
 class PrimitiveProcess(Process):
-    def __init__(self, instruction):
+    def __init__(self, instruction, tables):
         super(PrimitiveProcess, self).__init__()
         # self.daemon = True
 
@@ -581,31 +448,27 @@ class PrimitiveProcess(Process):
         elif isinstance(self._instruction, I.LBL):
             self._run = execute_LBL
         elif isinstance(self._instruction, I.LDt):
-            self.table_interface = TableInterface()
             self._run = partial(execute_LDt,
-                                table_interface=self.table_interface,
-                                instruction=self._instruction,
+                                tables=tables,
                                 destinations=self._instruction.destinations,
+                                table_id=self._instruction.table_id,
                                 index=self._instruction.index)
         elif isinstance(self._instruction, I.STt):
-            self.table_interface = TableInterface()
             self._run = partial(execute_STt,
-                                table_interface=self.table_interface,
-                                instruction=self._instruction,
+                                tables=tables,
+                                table_id=self._instruction.table_id,
                                 index=self._instruction.index,
                                 sources=self._instruction.sources)
         elif isinstance(self._instruction, I.INCt):
-            self.table_interface = TableInterface()
             self._run = partial(execute_INCt,
-                                table_interface=self.table_interface,
-                                instruction=self._instruction,
+                                tables=tables,
+                                table_id=self._instruction.table_id,
                                 index=self._instruction.index)
         elif isinstance(self._instruction, I.LKt):
-            self.table_interface = TableInterface()
             self._run = partial(execute_LKt,
-                                table_interface=self.table_interface,
-                                instruction=self._instruction,
+                                tables=tables,
                                 index=self._instruction.index,
+                                table_id=self._instruction.table_id,
                                 sources=self._instruction.sources)
         elif isinstance(self._instruction, I.CRC):
             self._run = partial(execute_CRC,
@@ -658,8 +521,8 @@ class Pipeline:
         flow_graph = cfg.generate(self.instructions)
 
         ''' Setting connections with in basic blocks '''
-        for label, node in flow_graph.iteritems():
-            if label == syntax.Label('$entry') or label == syntax.Label('$exit'):
+        for block, node in flow_graph.iteritems():
+            if block == cfg.ENTRY or block == cfg.EXIT:
                 continue
             next_instruction = None
             for instruction in node.basic_block[::-1]:
@@ -667,7 +530,7 @@ class Pipeline:
                         isinstance(instruction, I.CNC)):
                     self._instructions[instruction] = GroupProcess(instruction, self.tables)
                 else:
-                    self._instructions[instruction] = PrimitiveProcess(instruction)
+                    self._instructions[instruction] = PrimitiveProcess(instruction, self.tables)
 
                 if next_instruction:
                     self._instructions[instruction].output_interfaces[syntax.Label('')] = \
@@ -676,24 +539,25 @@ class Pipeline:
                 next_instruction = instruction
 
         ''' Setting up connections across basic blocks '''
-        for label, node in flow_graph.iteritems():
+        for block, node in flow_graph.iteritems():
             last_instruction = node.basic_block[-1]
-            for successor_label in node.successors:
-                first_instruction = flow_graph[successor_label].basic_block[0]
+            for i, successor in enumerate(node.successors):
+                first_instruction = flow_graph[successor].basic_block[0]
 
-                if label == syntax.Label('$entry'):
+                if block == cfg.ENTRY:
                     # if successor_label == Label('$exit'):
                     # self.input_interface = self.output_interface
                     # else:
                     self._input_interface = self._instructions[first_instruction].input_interface
                     # Note: this should always be no more than one
                 else:
-                    if successor_label == syntax.Label('$exit'):
+                    if successor == cfg.EXIT:
                         self._instructions[last_instruction].output_interfaces[
                             syntax.Label('')] = self._output_interface
                     else:
                         if isinstance(last_instruction, I.BR) or isinstance(last_instruction, I.JMP):
-                            if last_instruction.label == successor_label:
+                            ''' The taken block is the second successor of BR, and the only one of JMP '''
+                            if isinstance(last_instruction, I.JMP) or i == 1:
                                 self._instructions[last_instruction].output_interfaces[last_instruction.label] = \
                                     self._instructions[first_instruction].input_interface
                             else:
@@ -703,29 +567,6 @@ class Pipeline:
                             self._instructions[last_instruction].output_interfaces[syntax.Label('')] = \
                                 self._instructions[first_instruction].input_interface
 
-        ''' Connect tables with instructions '''
-        for instruction in self._instructions:
-            if isinstance(instruction, I.LDt):
-                table = self.tables[instruction.table_id]
-                self._instructions[instruction].table_interface.output_interface = table.input_interface
-                table.output_interfaces[id(instruction)] = \
-                    self._instructions[instruction].table_interface.input_interface
-            elif isinstance(instruction, I.STt):
-                table = self.tables[instruction.table_id]
-                self._instructions[instruction].table_interface.output_interface = table.input_interface
-                table.output_interfaces[id(instruction)] = \
-                    self._instructions[instruction].table_interface.input_interface
-            elif isinstance(instruction, I.INCt):
-                table = self.tables[instruction.table_id]
-                self._instructions[instruction].table_interface.output_interface = table.input_interface
-                table.output_interfaces[id(instruction)] = \
-                    self._instructions[instruction].table_interface.input_interface
-            elif isinstance(instruction, I.LKt):
-                table = self.tables[instruction.table_id]
-                self._instructions[instruction].table_interface.output_interface = table.input_interface
-                table.output_interfaces[id(instruction)] = \
-                    self._instructions[instruction].table_interface.input_interface
-
         self._is_setup = True
 
     def start(self):
@@ -782,42 +623,412 @@ class ExecuteInstructions:
     def get(self):
         return self._pipeline.get()
 
+    # Note: states still travel through the instruction pipeline one at a time
+    def put_batch(self, states):
+        for state in states:
+            self.put(state)
+
+    def get_batch(self, n):
+        states = []
+        for _ in range(0, n):
+            states.append(self.get())
+        return states
 
+    def get_completed(self):
+        return [self.get()]
+
+
+# Note: a worker runs the whole (compiled) code on the batches of states it receives, in order, and puts them, with its
+#       id, on the output interface it shares with the other workers. Its tables are table interfaces to the shared
+#       table processes. A worker given a ready event (see ExecuteWorkers.swap) only starts running states once it is
+#       set. Each worker has its own flow cache (see flow_cache), whose hits and misses it counts in shared memory.
+class Worker(Process):
+    def __init__(self, worker_id, code, tables, atomic_lock, output_interface, ready=None,
+                 flow_cache_size=flow_cache.FLOW_CACHE_SIZE):
+        super(Worker, self).__init__()
+
+        self.worker_id = worker_id
+        self._code = code
+        self._tables = tables
+        self._atomic_lock = atomic_lock
+        self._ready = ready
+        self._flow_cache_size = flow_cache_size
+        self.flow_cache_counters = RawArray(c_ulong, 3)
+        # Note: held while running a batch of states (see ExecuteWorkers.isolate)
+        self.batch_lock = Lock()
+        self.input_interface = Queue()
+        self.output_interface = output_interface
+
+    def stop(self):
+        self.input_interface.put(None)
+        self.join()
+
+    def run(self):
+        execute_code = flow_cache.cache_Code(self._code, self._tables,
+                                             partial(compiled.compile_Code, atomic_lock=self._atomic_lock),
+                                             self._flow_cache_size, self.flow_cache_counters, self._atomic_lock)
+
+        if self._ready is not None:
+            self._ready.wait()
+
+        while True:
+            try:
+                states = self.input_interface.get()
+
+                if states is None:
+                    return
+
+                with self.batch_lock:
+                    for i in range(0, len(states)):
+                        states[i] = execute_code(states[i])
+
+                self.output_interface.put((self.worker_id, states))
+            except KeyboardInterrupt:
+                break
+
+
+# Note: packets of the same flow (see flow_key) always go to the same worker, which keeps their order
+FLOW_KEY_LENGTH = 14
+
+
+def flow_key(state):
+    return (state.header[syntax.Field('inport_bitmap')].value,
+            str(state.packet.data[:FLOW_KEY_LENGTH]))
+
+
+# Note: with ordered=False, states are got in the order the workers return them rather than the order they were put,
+#       so a slow flow doesn't hold up the others; the states of a flow still keep their order.
+# Note: a worker holds at most queue_capacity states (put but not yet returned) at a time; the states put beyond that
+#       are dropped as per drop_policy (see Admission), and never returned.
+class ExecuteWorkers:
+    def __init__(self, code, tables, workers, flow_key, max_instructions, flow_cache_size, ordered=True,
+                 queue_capacity=None, drop_policy=TAIL_DROP):
+        self.code = code
+        self.tables = tables
+
+        self._flow_key = flow_key
+        self._max_instructions = max_instructions
+        self._atomic_lock = RLock()
+        self._ordered = ordered
+        # Note: the admission of the workers (by position, so it carries over a swap) and the states each worker (by
+        #       id) holds
+        self._admissions = [Admission(queue_capacity, drop_policy) for _ in range(0, workers)]
+        self._depths = {}
+        self._depths_lock = threading.Lock()
+
+        self._workers_count = workers
+        self._flow_cache_size = flow_cache_size
+        self._output_interface = Queue()
+        # Note: the states each worker (by id) has returned but not yet got. Workers are added (see swap) while states
+        #       are got, so it's only iterated over a copy.
+        self._output_states = {}
+        # Note: the ids of the retired workers whose states haven't all been got yet (see _forget_drained)
+        self._retired_worker_ids = set()
+        self._next_worker_id = 0
+        self._workers = self._new_workers(self.code, self.tables)
+        # Note: the workers swapped out but not yet retired (see swap)
+        self._retiring_workers = []
+
+        # Note: the ids of the workers the states were sent to, in order (if ordered)
+        self._worker_outputs = deque()
+
+        self._lock = threading.Lock()
+        self._retire_threads = []
+
+    def _new_workers(self, code, tables, ready=None):
+        workers = []
+        for i in range(0, self._workers_count):
+            worker_id = self._next_worker_id
+            self._next_worker_id += 1
+            with self._depths_lock:
+                self._output_states[worker_id] = deque()
+                self._depths[worker_id] = 0
+            workers.append(Worker(worker_id, code, tables, self._atomic_lock, self._output_interface, ready,
+                                  self._flow_cache_size))
+        return workers
+
+    def query_flow_cache(self):
+        with self._lock:
+            counters = [worker.flow_cache_counters for worker in self._workers + self._retiring_workers]
+
+        return {'hits': sum([int(_counters[0]) for _counters in counters]),
+                'wildcard_hits': sum([int(_counters[2]) for _counters in counters]),
+                'misses': sum([int(_counters[1]) for _counters in counters])}
+
+    def query_queues(self):
+        with self._depths_lock:
+            return [('worker %s' % i, admission.stats(self._depths[worker.worker_id]))
+                    for i, (worker, admission) in enumerate(zip(self._workers, self._admissions))]
+
+    # Note: calls update with every worker (including the ones being retired) between two batches of states, so no
+    #       state sees the tables partly updated
+    def isolate(self, update):
+        with self._lock:
+            batch_locks = [worker.batch_lock for worker in self._workers + self._retiring_workers]
+
+        for batch_lock in batch_locks:
+            batch_lock.acquire()
+        try:
+            update()
+        finally:
+            for batch_lock in batch_locks:
+                batch_lock.release()
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        for thread in self._retire_threads:
+            thread.join()
+        self._retire_threads = []
+
+        for worker in self._workers:
+            worker.stop()
+
+        self._output_interface.put(None)
+
+    # Note: the new workers are started (and compile the new code) alongside the old ones, and get the states from the
+    #       next batch on. They only start running them, though, once the old workers have run their last states and
+    #       migrate has been called (see Worker), so no state is dropped and the states of a flow stay in order.
+    def swap(self, code, tables, migrate):
+        ready = Event()
+        workers = self._new_workers(code, tables, ready)
+        for worker in workers:
+            worker.start()
+
+        with self._lock:
+            old_workers = self._workers
+            self.code = code
+            self.tables = tables
+            self._workers = workers
+            self._retiring_workers.extend(old_workers)
+
+        thread = threading.Thread(target=self._retire, args=(old_workers, migrate, ready))
+        thread.start()
+        self._retire_threads = [_thread for _thread in self._retire_threads if _thread.is_alive()]
+        self._retire_threads.append(thread)
+
+    def _retire(self, workers, migrate, ready):
+        for worker in workers:
+            worker.stop()
+
+        migrate()
+        ready.set()
+
+        with self._lock:
+            for worker in workers:
+                self._retiring_workers.remove(worker)
+
+        with self._depths_lock:
+            self._retired_worker_ids.update([worker.worker_id for worker in workers])
+            self._forget_drained()
+
+    # Note: forgets the retired workers all of whose states have been got (called holding _depths_lock)
+    def _forget_drained(self):
+        for worker_id in list(self._retired_worker_ids):
+            if not self._depths[worker_id] and not self._output_states[worker_id]:
+                del self._depths[worker_id]
+                del self._output_states[worker_id]
+                self._retired_worker_ids.remove(worker_id)
+
+    def put(self, state):
+        self.put_batch([state])
+
+    def get(self):
+        return self.get_batch(1)[0]
+
+    def put_batch(self, states):
+        with self._lock:
+            batches = {}
+            for state in states:
+                i = hash(self._flow_key(state)) % len(self._workers)
+                worker_id = self._workers[i].worker_id
+                with self._depths_lock:
+                    if not self._admissions[i].admit(self._depths[worker_id]):
+                        continue
+                    self._depths[worker_id] += 1
+
+                setattr(state, 'budget', self._max_instructions)
+                if self._ordered:
+                    self._worker_outputs.append(worker_id)
+                batches.setdefault(i, []).append(state)
+
+            for i, batch in batches.iteritems():
+                self._workers[i].input_interface.put(batch)
+
+    # Note: returns False once the workers are stopped
+    def _get_output(self):
+        output = self._output_interface.get()
+        if output is None:
+            self._output_interface.put(None)
+            return False
+
+        worker_id, states = output
+        with self._depths_lock:
+            self._depths[worker_id] -= len(states)
+            self._output_states[worker_id].extend(states)
+        return True
+
+    def _get_state(self, output_states):
+        state = output_states.popleft()
+        del state.budget
+        if not output_states and self._retired_worker_ids:
+            with self._depths_lock:
+                self._forget_drained()
+        return state
+
+    # Note: blocks until n states are available; states are returned in the order they were put (if ordered)
+    def get_batch(self, n):
+        states = []
+        if self._ordered:
+            for _ in range(0, n):
+                output_states = self._output_states[self._worker_outputs.popleft()]
+                while not output_states:
+                    if not self._get_output():
+                        raise RuntimeError()
+
+                states.append(self._get_state(output_states))
+        else:
+            while len(states) < n:
+                _states = self.get_completed(n - len(states))
+                if not _states:
+                    raise RuntimeError()
+                states.extend(_states)
+        return states
+
+    # Note: blocks until some states are available and returns them (up to n), or returns an empty list once the
+    #       workers are stopped. If ordered, only the states up to the first one not yet returned are available.
+    def get_completed(self, n=None):
+        states = []
+
+        if self._ordered:
+            while n is None or len(states) < n:
+                output_states = self._output_states[self._worker_outputs[0]] if self._worker_outputs else None
+                if not output_states:
+                    if states and self._output_interface.empty():
+                        break
+                    if not self._get_output():
+                        break
+                    continue
+
+                self._worker_outputs.popleft()
+                states.append(self._get_state(output_states))
+        else:
+            while not any(self._output_states.values()) or not self._output_interface.empty():
+                if not self._get_output():
+                    break
+
+            for output_states in self._output_states.values():
+                while output_states and (n is None or len(states) < n):
+                    states.append(self._get_state(output_states))
+
+        return states
+
+
+# Note: by default, packets are sharded across a pool of workers (one per core) that each run the whole code. With
+#       pipelined=True, every instruction runs in its own process instead (max_instructions, swap, the flow cache,
+#       queue_capacity and update_table_entries are then not supported).
+# Note: a policy is swapped (see swap) without stopping the execution: states put before the swap run on the old
+#       policy and the ones put after it on the new one (see ExecuteWorkers.swap). The entries of the tables the two
+#       policies share are migrated as in single_process (see swap_tables).
 class Execute:
-    def __init__(self, policy):
+    def __init__(self, policy, workers=None, flow_key=flow_key, pipelined=False, max_instructions=None,
+                 flow_cache_size=flow_cache.FLOW_CACHE_SIZE, ordered=True, queue_capacity=None, drop_policy=TAIL_DROP):
         self._execute_decls = ExecuteDecls(policy.decls)
         self._tables = self._execute_decls.tables
+        self._tables_lock = threading.Lock()
 
-        self._execute_instructions = ExecuteInstructions(policy.code.instructions, self._tables)
+        self._pipelined = pipelined
+        if pipelined:
+            self._execute_instructions = ExecuteInstructions(policy.code.instructions, self._tables)
+        else:
+            self._execute_instructions = ExecuteWorkers(policy.code, self._tables, workers or cpu_count(),
+                                                        flow_key, max_instructions, flow_cache_size, ordered,
+                                                        queue_capacity, drop_policy)
         self.put = self._execute_instructions.put
         self.get = self._execute_instructions.get
+        self.put_batch = self._execute_instructions.put_batch
+        self.get_batch = self._execute_instructions.get_batch
+        self.get_completed = self._execute_instructions.get_completed
 
     def start(self):
         self._execute_instructions.start()
 
-        ''' Start tables '''
-        for table in self._tables:
-            self._tables[table].start()
-
     def stop(self):
         self._execute_instructions.stop()
 
-        ''' Stop tables '''
-        for table in self._tables:
-            self._tables[table].stop()
+    def swap(self, policy):
+        if self._pipelined:
+            raise RuntimeError()
+
+        tables = ExecuteDecls(policy.decls).tables
+
+        with self._tables_lock:
+            old_tables = self._execute_instructions.tables
+            self._tables, table_ids = swap_tables(self._tables, old_tables, tables)
+
+            def migrate():
+                with self._tables_lock:
+                    migrate_tables(self._tables, old_tables, tables, table_ids)
 
+            self._execute_instructions.swap(policy.code, tables, migrate)
+
+    # Note: tables are in shared memory (see SharedPatterns), so entries are accessed directly
     def add_table_entry(self, id, index, entry):
-        self._tables[id].input_interface.put(('add_entry', (index, entry)))
+        with self._tables_lock:
+            if id in self._tables:
+                self._tables[id].patterns.add_entry(index, entry)
+            else:
+                raise RuntimeError("No such table")
 
     def del_table_entry(self, id, index):
-        self._tables[id].input_interface.put(('del_entry', index))
+        with self._tables_lock:
+            if id in self._tables:
+                self._tables[id].patterns.del_entry(index)
+            else:
+                raise RuntimeError("No such table")
+
+    # Note: the updates are made all or none (see update_tables), and with the workers held between batches (see
+    #       ExecuteWorkers.isolate)
+    def update_table_entries(self, updates):
+        if self._pipelined:
+            raise RuntimeError()
+
+        with self._tables_lock:
+            self._execute_instructions.isolate(partial(update_tables, self._tables, updates))
 
     def query_table_entry(self, id, index):
-        self._tables[id].input_interface.put(('query_entry', index))
-        return self._tables[id].output_interfaces[''].get()
+        with self._tables_lock:
+            if id in self._tables:
+                return self._tables[id].patterns.query_entry(index)
+            else:
+                raise RuntimeError("No such table")
+
+    # Note: see ArrayPatterns.dump_entries
+    def dump_table_entries(self, id, start=0, stop=None, since=None, non_zero=False):
+        with self._tables_lock:
+            if id in self._tables:
+                patterns = self._tables[id].patterns
+            else:
+                raise RuntimeError("No such table")
+        return patterns.dump_entries(start, stop, since, non_zero)
+
+    def query_flow_cache(self):
+        if self._pipelined:
+            raise RuntimeError()
+
+        return self._execute_instructions.query_flow_cache()
+
+    def query_queues(self):
+        if self._pipelined:
+            raise RuntimeError()
+
+        return self._execute_instructions.query_queues()
 
     def query_table_list(self):
         list = []
-        for t in self._tables.keys():
-            list.append(str(t))
-        return list
\ No newline at end of file
+        with self._tables_lock:
+            for t in self._tables.keys():
+                list.append(str(t))
+        return list
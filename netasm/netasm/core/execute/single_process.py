@@ -33,14 +33,16 @@
 
 __author__ = 'shahbaz'
 
-from copy import deepcopy
+from collections import deque
 from Queue import Queue
 from threading import Thread, Lock
 
 from netasm.netasm.core.syntax import InstructionCollection as I, Policy
-from netasm.netasm.core.common import get_reserved_fields, get_instruction_at_label as get_label
+from netasm.netasm.core.common import get_reserved_fields, get_code_label_indices, get_pc_at_label
 from netasm.netasm.core.utilities.profile import time_usage, do_cprofile
 from netasm.netasm.core.execute import *
+from netasm.netasm.core.execute import flow_cache
+from netasm.netasm.core.utilities.queues import BoundedQueue, TAIL_DROP
 
 
 # TODO: add runtime errors' details.
@@ -49,6 +51,11 @@ from netasm.netasm.core.execute import *
 lock = Lock()
 
 
+# Note: a packet whose execution runs more instructions than its budget (see Execute's max_instructions) is dropped
+#       with this reason
+BUDGET_EXCEEDED_REASON = syntax.Reason('budget', 'instruction budget exceeded')
+
+
 class Table:
     def __init__(self, patterns):
         self.patterns = patterns
@@ -70,25 +77,67 @@ class ExecuteDecls:
                 for field, size in table.table_fields.iteritems():
                     pattern[field] = syntax.Value(0, size)
 
-                # generate list of patterns
-                patterns = SimplePatterns()
-                for i in range(0, table.size):
-                    patterns.insert(i, deepcopy(pattern))
+                # generate array patterns
+                patterns = ArraySimplePatterns(pattern, table.size)
             elif isinstance(table.table_fields, syntax.TableFieldsCollection.MatchFields):
                 pattern = MatchPattern()
                 for field, (size, _) in table.table_fields.iteritems():
                     pattern[field] = (syntax.Value(0, size), syntax.Mask(-1))
 
-                # generate list of patterns
-                patterns = MatchPatterns()
-                for i in range(0, table.size):
-                    patterns.insert(i, deepcopy(pattern))
+                # generate array patterns
+                patterns = ArrayMatchPatterns(pattern, table.size)
             else:
                 raise RuntimeError()
 
             self.tables[table_id] = Table(patterns)
 
 
+# Note: when a policy is swapped (see Execute.swap), the entries of the tables it shares with the new policy, i.e., of
+#       the same id and of compatible patterns (see ArrayPatterns.is_compatible), are migrated to the new tables once
+#       the old policy has run its last states. Till then, the controller adds, deletes and queries the entries of these
+#       tables in the old tables, and of the others in the new ones, i.e., in the tables returned by swap_tables (which
+#       migrate_tables then updates in place).
+def get_compatible_table_ids(tables, new_tables):
+    table_ids = []
+    for table_id, table in new_tables.iteritems():
+        if table_id in tables and table.patterns.is_compatible(tables[table_id].patterns):
+            table_ids.append(table_id)
+    return table_ids
+
+
+def swap_tables(tables, old_tables, new_tables):
+    table_ids = get_compatible_table_ids(old_tables, new_tables)
+
+    _tables = Tables()
+    for table_id, table in new_tables.iteritems():
+        _tables[table_id] = tables[table_id] if table_id in table_ids else table
+    return _tables, table_ids
+
+
+def migrate_tables(tables, old_tables, new_tables, table_ids):
+    for table_id in table_ids:
+        new_tables[table_id].patterns.copy_entries(old_tables[table_id].patterns)
+        if tables.get(table_id) is old_tables[table_id]:
+            tables[table_id] = new_tables[table_id]
+
+
+# Note: makes a list of updates, i.e., (operation, table id, index) or (operation, table id, index, entry) (see
+#       ArrayPatterns.update_entries), all or none of them: every update is checked before any is made
+def update_tables(tables, updates):
+    table_updates = {}
+    for update in updates:
+        operation, table_id, index = update[:3]
+        entry = update[3] if len(update) > 3 else None
+
+        if table_id not in tables:
+            raise RuntimeError("No such table")
+        tables[table_id].patterns.check_update(operation, index, entry)
+        table_updates.setdefault(table_id, []).append((operation, index, entry))
+
+    for table_id, _updates in table_updates.iteritems():
+        tables[table_id].patterns.update_entries(_updates)
+
+
 def execute_LDt(state, tables, destinations, table_id, index):
     index_value = None
     ''' Lookup index '''
@@ -102,15 +151,14 @@ def execute_LDt(state, tables, destinations, table_id, index):
     ''' Lookup table '''
     patterns = tables[table_id].patterns
 
-    ''' Lookup pattern '''
-    pattern = patterns[index_value.value]
-    pattern_list = pattern.values()
+    ''' Read pattern '''
+    values = patterns.read_entry(index_value.value)
 
     for i in range(0, len(destinations)):
         operand = destinations[i]
 
         if isinstance(operand, O.Field):
-            state.header[operand.field].value = pattern_list[i].value
+            state.header[operand.field].value = values[i]
         else:
             raise RuntimeError()
 
@@ -134,37 +182,32 @@ def execute_STt(state, tables, table_id, index, sources):
     ''' Lookup table '''
     patterns = tables[table_id].patterns
 
-    ''' Lookup pattern '''
-    pattern = patterns[index_value.value]
-    pattern_list = pattern.keys()
-
+    values = []
+    masks = None
     if isinstance(sources, O.Operands_):
-        for i in range(0, len(sources)):
-            field = pattern_list[i]
-            operand = sources[i]
-
+        for operand in sources:
             if isinstance(operand, O.Value):
-                pattern[field].value = operand.value.value
+                values.append(operand.value.value)
             elif isinstance(operand, O.Field):
-                pattern[field].value = state.header[operand.field].value
+                values.append(state.header[operand.field].value)
             else:
                 raise RuntimeError()
     elif isinstance(sources, O.OperandsMasks_):
-        for i in range(0, len(sources)):
-            field = pattern_list[i]
-            operand, mask = sources[i]
-
+        masks = []
+        for operand, mask in sources:
             if isinstance(operand, O.Value):
-                pattern[field][0].value = operand.value.value
-                pattern[field] = (pattern[field][0], mask)
+                values.append(operand.value.value)
             elif isinstance(operand, O.Field):
-                pattern[field][0].value = state.header[operand.field].value
-                pattern[field] = (pattern[field][0], mask)
+                values.append(state.header[operand.field].value)
             else:
                 raise RuntimeError()
+            masks.append(mask)
     else:
         raise RuntimeError()
 
+    ''' Write pattern '''
+    patterns.write_entry(index_value.value, values, masks)
+
     state.label = syntax.Label('')
     return state
 
@@ -185,11 +228,8 @@ def execute_INCt(state, tables, table_id, index):
     ''' Lookup table '''
     patterns = tables[table_id].patterns
 
-    ''' Lookup pattern '''
-    pattern = patterns[index_value.value]
-
-    for field in pattern:
-        pattern[field].value += 1
+    ''' Increment pattern '''
+    patterns.increment_entry(index_value.value)
 
     state.label = syntax.Label('')
     return state
@@ -200,37 +240,16 @@ def execute_LKt(state, tables, index, table_id, sources):
     ''' Read sources values '''
     for source in sources:
         if isinstance(source, O.Value):
-            values.append(source.value)
+            values.append(source.value.value)
         elif isinstance(source, O.Field):
-            values.append(state.header[source.field])
+            values.append(state.header[source.field].value)
         else:
             raise RuntimeError()
 
     ''' Lookup table '''
     patterns = tables[table_id].patterns
 
-    value = -1
-    if isinstance(patterns, MatchPatterns):
-        for i in range(0, len(patterns)):
-            pattern_list = patterns[i].values()
-
-            if len(pattern_list) != len(values):
-                raise RuntimeError()
-
-            if all(map((lambda (value, mask), source: value.value == (source.value & mask)),
-                       pattern_list, values)):
-                value = i
-                break
-    elif isinstance(patterns, SimplePatterns):
-        for i in range(0, len(patterns)):
-            pattern_list = patterns[i].values()
-
-            if all(map((lambda value, source: value.value == source.value),
-                       pattern_list, values)):
-                value = i
-                break
-    else:
-        raise RuntimeError()
+    value = patterns.lookup_entry(values)
 
     ''' Lookup index '''
     if isinstance(index, O.Field):
@@ -246,21 +265,21 @@ def execute_LKt(state, tables, index, table_id, sources):
 # TODO: 2) look into the -1 assignment issue
 
 
-def _execute_CNC(state, tables, codes):
+def _execute_CNC(state, tables, codes, code_label_indices):
     for code in codes:
-        state = _execute_Code(code, tables, state)
+        state = _execute_Code(code, tables, state, code_label_indices)
     return state
 
 
-def _execute_ATM(state, tables, code):
-    return _execute_Code(code, tables, state)
+def _execute_ATM(state, tables, code, code_label_indices):
+    return _execute_Code(code, tables, state, code_label_indices)
 
 
-def _execute_SEQ(state, tables, code):
-    return _execute_Code(code, tables, state)
+def _execute_SEQ(state, tables, code, code_label_indices):
+    return _execute_Code(code, tables, state, code_label_indices)
 
 
-def _next_Instruction(instructions, tables, state):
+def _next_Instruction(instructions, label_indices, code_label_indices, tables, state):
     # Read instruction at program counter
     instruction = instructions[state.pc]
 
@@ -305,37 +324,50 @@ def _next_Instruction(instructions, tables, state):
     elif isinstance(instruction, I.HSH):
         state = execute_HSH(state, instruction.destination, instruction.sources)
     elif isinstance(instruction, I.CNC):
-        state = _execute_CNC(state, tables, instruction.codes)
+        state = _execute_CNC(state, tables, instruction.codes, code_label_indices)
     elif isinstance(instruction, I.ATM):
-        state = _execute_ATM(state, tables, instruction.code)
+        state = _execute_ATM(state, tables, instruction.code, code_label_indices)
     elif isinstance(instruction, I.SEQ):
-        state = _execute_SEQ(state, tables, instruction.code)
+        state = _execute_SEQ(state, tables, instruction.code, code_label_indices)
     else:
         raise RuntimeError()
 
     if state.label == syntax.Label(''):
         state.pc += 1
     else:
-        state.pc, _ = get_label(instructions, state.label)
+        state.pc = get_pc_at_label(label_indices, state.label)
 
     return state
 
 
-def _execute_Instructions(instructions, tables, state):
-    # Read instruction at program counter
-    instruction = instructions[state.pc]
+def _execute_Instructions(instructions, label_indices, code_label_indices, tables, state):
+    while True:
+        # Check the instruction budget (shared with the nested codes)
+        if state.budget is not None:
+            if state.budget <= 0:
+                state = execute_DRP(state, BUDGET_EXCEEDED_REASON)
+                break
+            state.budget -= 1
 
-    # Check if HLT instruction
-    if isinstance(instruction, I.HLT):
-        state = execute_HLT(state)
-    else:
-        state = _next_Instruction(instructions, tables, state)
-        state = _execute_Instructions(instructions, tables, state)
+        # Read instruction at program counter
+        instruction = instructions[state.pc]
+
+        # Check if HLT instruction
+        if isinstance(instruction, I.HLT):
+            state = execute_HLT(state)
+            break
+
+        state = _next_Instruction(instructions, label_indices, code_label_indices, tables, state)
 
     return state
 
 
-def _execute_Code(code, tables, state):
+# Note: code_label_indices should be computed once per policy (see get_code_label_indices) and passed in; it is only
+#       computed here if missing. The state must carry the 'pc' and 'budget' attributes (see Execute.put).
+def _execute_Code(code, tables, state, code_label_indices=None):
+    if code_label_indices is None:
+        code_label_indices = get_code_label_indices(code)
+
     # Save the current header and pc
     pc = state.pc
     header = state.header
@@ -348,7 +380,8 @@ def _execute_Code(code, tables, state):
         state.header[field] = header[field]
 
     # Execute instructions
-    state = _execute_Instructions(code.instructions, tables, state)
+    state = _execute_Instructions(code.instructions, code_label_indices[id(code.instructions)], code_label_indices,
+                                  tables, state)
 
     # Commit changes to the current header
     for field in code.argument_fields:
@@ -364,84 +397,235 @@ def _execute_Code(code, tables, state):
 
 # Execute code with timing usage
 @time_usage
-def _execute_Code__time_usage(code, tables, state):
-    return _execute_Code(code, tables, state)
+def _execute_Code__time_usage(code, tables, state, code_label_indices=None):
+    return _execute_Code(code, tables, state, code_label_indices)
 
 
 # Execute code with profiling information
 @do_cprofile
-def _execute_Code__cprofile(code, tables, state):
-    return _execute_Code(code, tables, state)
+def _execute_Code__cprofile(code, tables, state, code_label_indices=None):
+    return _execute_Code(code, tables, state, code_label_indices)
 
 
 execute = _execute_Code
 
 
-class Execute(Thread):
+# Note: a policy prepared to be swapped in, i.e., its tables declared and its code ready to run (see Execute._compile)
+class Swap:
     def __init__(self, policy):
+        self.tables = ExecuteDecls(policy.decls).tables
+        self.code = policy.code
+
+
+# Note: the code runs behind a flow cache (see flow_cache) of flow_cache_size results (0 disables it)
+# Note: at most queue_capacity states wait to run at a time; the states put beyond that are dropped as per drop_policy
+#       (see BoundedQueue), and never returned. States always run, and are returned, in the order they were put, so
+#       ordered (see multi_process.ExecuteWorkers) makes no difference here.
+class Execute(Thread):
+    def __init__(self, policy, max_instructions=None, flow_cache_size=flow_cache.FLOW_CACHE_SIZE, ordered=True,
+                 queue_capacity=None, drop_policy=TAIL_DROP):
         super(Execute, self).__init__()
 
+        self._max_instructions = max_instructions
+        self._flow_cache_size = flow_cache_size
+        self._flow_cache_counters = [0, 0, 0]
+
         self._execute_decls = ExecuteDecls(policy.decls)
         self._tables = self._execute_decls.tables
         self._code = policy.code
-        self._input_interface = Queue()
+        self._execute_code = self._compile(self._code, self._tables)
+        # Note: the tables the controller's entry operations go to and those of the last policy swapped in (see swap)
+        self._control_tables = Tables(self._tables)
+        self._swap_tables = self._tables
+        # Note: both interfaces carry batches (lists) of states
+        self._input_interface = BoundedQueue(queue_capacity, drop_policy)
         self._output_interface = Queue()
+        self._output_states = deque()
 
     def put(self, state):
-        setattr(state, 'pc', 0)
-        self._input_interface.put(state)
+        self.put_batch([state])
 
     def get(self):
-        state = self._output_interface.get()
+        return self.get_batch(1)[0]
+
+    def put_batch(self, states):
+        for state in states:
+            setattr(state, 'pc', 0)
+            setattr(state, 'budget', self._max_instructions)
+        self._input_interface.offer(list(states))
+
+    # Note: blocks until n states are available; states are returned in the order they were put
+    def get_batch(self, n):
+        while len(self._output_states) < n:
+            self._output_states.extend(self._output_interface.get())
+
+        states = []
+        for _ in range(0, n):
+            states.append(self._get_state())
+        return states
+
+    # Note: blocks until some states are available and returns all of them (in the order they were put), or returns an
+    #       empty list once the execution is stopped
+    def get_completed(self):
+        if not self._output_states:
+            states = self._output_interface.get()
+            if states is None:
+                self._output_interface.put(None)
+                return []
+            self._output_states.extend(states)
+
+        while not self._output_interface.empty():
+            states = self._output_interface.get()
+            if states is None:
+                self._output_interface.put(None)
+                break
+            self._output_states.extend(states)
+
+        states = []
+        while self._output_states:
+            states.append(self._get_state())
+        return states
+
+    def _get_state(self):
+        state = self._output_states.popleft()
         del state.pc
+        del state.budget
         return state
 
     def stop(self):
         self._input_interface.put(None)
         self.join()
+        self._output_interface.put(None)
+
+    # Note: the swap is queued along with the states, so the states put before it run on the old policy and the ones
+    #       put after it on the new one. The old tables' entries are migrated (see migrate_tables) at that point.
+    def swap(self, policy):
+        swap = self._prepare(policy)
+
+        lock.acquire()
+        try:
+            self._control_tables, swap.table_ids = swap_tables(self._control_tables, self._swap_tables, swap.tables)
+            self._swap_tables = swap.tables
+            self._input_interface.put(swap)
+        finally:
+            lock.release()
+
+    def _prepare(self, policy):
+        swap = Swap(policy)
+        swap.execute_code = self._compile(swap.code, swap.tables)
+        return swap
+
+    def _swap(self, swap):
+        migrate_tables(self._control_tables, self._tables, swap.tables, swap.table_ids)
+
+        self._tables = swap.tables
+        self._code = swap.code
+        self._execute_code = swap.execute_code
+
+    def _compile(self, code, tables):
+        return flow_cache.cache_Code(code, tables, self._compile_Code, self._flow_cache_size,
+                                     self._flow_cache_counters)
+
+    def _compile_Code(self, code, tables):
+        code_label_indices = get_code_label_indices(code)
+
+        def _execute_Code(state):
+            return execute(code, tables, state, code_label_indices)
+
+        return _execute_Code
+
+    def _execute(self, state):
+        return self._execute_code(state)
 
     def run(self):
         while True:
             try:
-                state = self._input_interface.get()
+                states = self._input_interface.get()
 
-                if state is None:
+                if states is None:
                     return
 
-                state = execute(self._code, self._tables, state)
-                self._output_interface.put(state)
+                if isinstance(states, Swap):
+                    lock.acquire()
+                    try:
+                        self._swap(states)
+                    finally:
+                        lock.release()
+                    continue
+
+                lock.acquire()
+                try:
+                    for i in range(0, len(states)):
+                        states[i] = self._execute(states[i])
+                finally:
+                    lock.release()
+
+                self._output_interface.put(states)
             except KeyboardInterrupt:
                 break
 
     def add_table_entry(self, id, index, entry):
         lock.acquire()
-        if id in self._tables:
-            self._tables[id].patterns.add_entry(index, entry)
-        else:
-            raise RuntimeError("No such table")
-        lock.release()
+        try:
+            if id in self._control_tables:
+                self._control_tables[id].patterns.add_entry(index, entry)
+            else:
+                raise RuntimeError("No such table")
+        finally:
+            lock.release()
 
     def del_table_entry(self, id, index):
         lock.acquire()
-        if id in self._tables:
-            self._tables[id].patterns.del_entry(index)
-        else:
-            raise RuntimeError("No such table")
-        lock.release()
+        try:
+            if id in self._control_tables:
+                self._control_tables[id].patterns.del_entry(index)
+            else:
+                raise RuntimeError("No such table")
+        finally:
+            lock.release()
+
+    # Note: the updates are made between batches of states, so no state sees some of them and not the others
+    def update_table_entries(self, updates):
+        lock.acquire()
+        try:
+            update_tables(self._control_tables, updates)
+        finally:
+            lock.release()
 
     def query_table_entry(self, id, index):
         lock.acquire()
-        if id in self._tables:
-            entry = self._tables[id].patterns.query_entry(index)
-        else:
-            raise RuntimeError("No such table")
-        lock.release()
+        try:
+            if id in self._control_tables:
+                entry = self._control_tables[id].patterns.query_entry(index)
+            else:
+                raise RuntimeError("No such table")
+        finally:
+            lock.release()
         return entry
 
+    # Note: see ArrayPatterns.dump_entries
+    def dump_table_entries(self, id, start=0, stop=None, since=None, non_zero=False):
+        lock.acquire()
+        try:
+            if id in self._control_tables:
+                patterns = self._control_tables[id].patterns
+            else:
+                raise RuntimeError("No such table")
+        finally:
+            lock.release()
+        return patterns.dump_entries(start, stop, since, non_zero)
+
+    def query_queues(self):
+        return [('engine', self._input_interface.stats())]
+
+    def query_flow_cache(self):
+        return {'hits': self._flow_cache_counters[0], 'wildcard_hits': self._flow_cache_counters[2],
+                'misses': self._flow_cache_counters[1]}
+
     def query_table_list(self):
         list = []
         lock.acquire()
-        for t in self._tables.keys():
+        for t in self._control_tables.keys():
             list.append(str(t))
         lock.release()
         return list
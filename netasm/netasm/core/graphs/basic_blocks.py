@@ -34,48 +34,46 @@
 __author__ = 'shahbaz'
 
 from netasm.netasm.core.syntax import InstructionCollection as I
-from netasm.netasm.core.common import get_instruction_at_label
+from netasm.netasm.core.common import get_label_indices, get_pc_at_label
 
 
-def _find_leaders(instructions):
+# Note: leaders are the indices of the instructions that start a basic block; branch targets are resolved through
+#       the label indices (see get_label_indices), instead of scanning the instructions for every branch
+def find_leaders(instructions):
     leaders_set = set()
+    label_indices = get_label_indices(instructions)
 
     for i in range(0, len(instructions)):
         instruction = instructions[i]
 
         ''' The first instruction is always a leader '''
         if not leaders_set:
-            leaders_set |= {instruction}
+            leaders_set |= {i}
 
         if (isinstance(instruction, I.BR) or
                 isinstance(instruction, I.JMP)):
             ''' The instruction following BR/JMP is a leader '''
             if (i + 1) < len(instructions):
-                leaders_set |= {instructions[i + 1]}
+                leaders_set |= {i + 1}
             else:
                 raise RuntimeError
 
             ''' The target instruction of BR/JMP is a leader '''
-            j, _ = get_instruction_at_label(instructions, instruction.label)
+            j = get_pc_at_label(label_indices, instruction.label)
             if (j + 1) < len(instructions):
-                leaders_set |= {instructions[j + 1]}
+                leaders_set |= {j + 1}
             else:
                 raise RuntimeError
 
-    return leaders_set
+    return sorted(leaders_set)
 
 
 def generate(instructions):
-    leaders = _find_leaders(instructions)
+    leaders = find_leaders(instructions)
 
-    basic_block_list = None
     basic_blocks_list = []
 
-    for instruction in instructions:
-        if instruction in leaders:
-            basic_block_list = [instruction]
-            basic_blocks_list.append(basic_block_list)
-        else:
-            basic_block_list.append(instruction)
+    for start, end in zip(leaders, leaders[1:] + [len(instructions)]):
+        basic_blocks_list.append(list(instructions[start:end]))
 
-    return basic_blocks_list
\ No newline at end of file
+    return basic_blocks_list
@@ -33,10 +33,10 @@
 
 __author__ = 'shahbaz'
 
-import uuid
+from weakref import ref
 
-from netasm.netasm.core import syntax as syntax
 from netasm.netasm.core.syntax import InstructionCollection as I
+from netasm.netasm.core.common import get_label_indices
 from netasm.netasm.core.graphs import basic_blocks as bb
 
 
@@ -47,28 +47,6 @@ class Node:
         self.successors = successors
 
 
-def _next_label(instruction):
-    if isinstance(instruction, I.LBL):
-        return instruction.label
-    elif isinstance(instruction, I.Instruction):
-        return syntax.Label('$' + str(uuid.uuid1().hex))
-    else:
-        raise RuntimeError
-
-
-def _successors(instruction, next_label):
-    if isinstance(instruction, I.BR):
-        return [next_label, instruction.label]
-    elif isinstance(instruction, I.JMP):
-        return [instruction.label]
-    elif isinstance(instruction, I.HLT):
-        return []
-    elif isinstance(instruction, I.Instruction):
-        return [next_label]
-    else:
-        raise RuntimeError
-
-
 class Entry(I.Instruction):
     pass
 
@@ -77,47 +55,186 @@ class Exit(I.Instruction):
     pass
 
 
+# Note: blocks are numbered with integers: the entry and exit blocks first, then the basic blocks in the order of the
+#       instructions. The successors of a BR block are its not-taken (fall-through) block and then its taken block.
+#       LBL instructions are left out of the blocks, and a block that only held labels is left out of the graph (the
+#       edges into it go to the block it falls through to).
+# Note: a flow graph (and its blocks, traversal orders and dominator tree) is immutable, so that it can be cached (see
+#       generate) and shared by all the analyses and transformations of the same instructions.
+ENTRY = 0
+EXIT = 1
+
+
+class ControlFlowGraph:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+        ''' Traversal orders (unreachable blocks are visited after the reachable ones, in postorder) '''
+        reachable_postorder = _postorder(nodes, [ENTRY], set())
+        self.postorder = reachable_postorder + _postorder(nodes, range(len(nodes)), set(reachable_postorder))
+        self.reverse_postorder = self.postorder[::-1]
+
+        ''' Dominator tree (unreachable blocks have no immediate dominator) '''
+        self.immediate_dominators = _immediate_dominators(nodes, reachable_postorder[::-1])
+
+    def __getitem__(self, index):
+        return self.nodes[index]
+
+    def __iter__(self):
+        return iter(xrange(len(self.nodes)))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, index):
+        return isinstance(index, (int, long)) and 0 <= index < len(self.nodes)
+
+    def iteritems(self):
+        return enumerate(self.nodes)
+
+    def dominates(self, dominator, index):
+        while index is not None:
+            if index == dominator:
+                return True
+            if index == ENTRY:
+                return False
+            index = self.immediate_dominators[index]
+        return False
+
+
+def _postorder(nodes, roots, visited):
+    order = []
+
+    for root in roots:
+        if root in visited:
+            continue
+        visited.add(root)
+        stack = [(root, iter(nodes[root].successors))]
+        while stack:
+            index, successors = stack[-1]
+            for successor in successors:
+                if successor not in visited:
+                    visited.add(successor)
+                    stack.append((successor, iter(nodes[successor].successors)))
+                    break
+            else:
+                stack.pop()
+                order.append(index)
+
+    return order
+
+
+# Note: see Cooper, Harvey and Kennedy, "A Simple, Fast Dominance Algorithm"
+def _immediate_dominators(nodes, reverse_postorder):
+    order = dict((index, i) for i, index in enumerate(reverse_postorder))
+    immediate_dominators = [None] * len(nodes)
+    immediate_dominators[ENTRY] = ENTRY
+
+    def intersect(index, _index):
+        while index != _index:
+            while order[index] > order[_index]:
+                index = immediate_dominators[index]
+            while order[_index] > order[index]:
+                _index = immediate_dominators[_index]
+        return index
+
+    changed = True
+    while changed:
+        changed = False
+        for index in reverse_postorder[1:]:
+            immediate_dominator = None
+            for predecessor in nodes[index].predecessors:
+                if immediate_dominators[predecessor] is not None:
+                    if immediate_dominator is None:
+                        immediate_dominator = predecessor
+                    else:
+                        immediate_dominator = intersect(predecessor, immediate_dominator)
+            if immediate_dominators[index] != immediate_dominator:
+                immediate_dominators[index] = immediate_dominator
+                changed = True
+
+    return immediate_dominators
+
+
+def _generate(instructions):
+    leaders = bb.find_leaders(instructions)
+    label_indices = get_label_indices(instructions)
+
+    ''' Basic blocks (in the order of the instructions) and their successors; None is the exit block '''
+    blocks = []
+    block_successors = []
+    block_at_leader = dict((leader, i) for i, leader in enumerate(leaders))
+    ends = leaders[1:] + [len(instructions)]
+    for i in range(len(leaders)):
+        next_block = i + 1 if (i + 1) < len(leaders) else None
+        instruction = instructions[ends[i] - 1]
+        if isinstance(instruction, I.BR):
+            successors = [next_block, block_at_leader[label_indices[instruction.label] + 1]]
+        elif isinstance(instruction, I.JMP):
+            successors = [block_at_leader[label_indices[instruction.label] + 1]]
+        elif isinstance(instruction, I.HLT):
+            successors = [None]
+        else:
+            successors = [next_block]
+        blocks.append(tuple(instruction for instruction in instructions[leaders[i]:ends[i]]
+                            if not isinstance(instruction, I.LBL)))
+        block_successors.append(successors)
+
+    ''' Number the blocks, bypassing the ones that only held labels '''
+    indices = {None: EXIT}
+    for i in range(len(blocks)):
+        if blocks[i]:
+            indices[i] = len(indices) + 1
+
+    def index_of(i):
+        while i is not None and not blocks[i]:
+            i = block_successors[i][0]
+        return indices[i]
+
+    successors_list = [[index_of(0 if blocks else None)], []]
+    basic_blocks = [(Entry(),), (Exit(),)]
+    for i in range(len(blocks)):
+        if blocks[i]:
+            successors_list.append([index_of(successor) for successor in block_successors[i]])
+            basic_blocks.append(blocks[i])
+
+    predecessors_list = [[] for _ in basic_blocks]
+    for index in range(len(basic_blocks)):
+        for successor in successors_list[index]:
+            if index not in predecessors_list[successor]:
+                predecessors_list[successor].append(index)
+
+    return ControlFlowGraph([Node(basic_blocks[index], tuple(predecessors_list[index]), tuple(successors_list[index]))
+                             for index in range(len(basic_blocks))])
+
+
+# Note: flow graphs are cached per instructions list (e.g., a code's instructions), and only generated again once the
+#       list changes, i.e., once instructions are added, removed or replaced. Instructions themselves are not expected
+#       to change (in ways that change the flow graph) while in a list.
+_flow_graphs = {}
+
+
+def _evict(key, reference):
+    if key in _flow_graphs and _flow_graphs[key][0] is reference:
+        del _flow_graphs[key]
+
+
 def generate(instructions):
-    flow_graph = {}
-
-    basic_blocks = bb.generate(instructions)
-
-    entry_label = syntax.Label('$entry')
-    first_label = current_label = syntax.Label('$' + str(uuid.uuid1().hex))
-    exit_label = syntax.Label('$exit')
-    last_label = None
-
-    flow_graph[entry_label] = Node([Entry()], [], [first_label])
-    flow_graph[exit_label] = Node([Exit()], [], [])
-
-    for basic_block in basic_blocks:
-        instruction = basic_block[-1]
-        next_label = _next_label(instruction)
-        flow_graph[current_label] = Node(basic_block, [], _successors(instruction, next_label))
-        if isinstance(instruction, I.HLT):
-            last_label = current_label
-        current_label = next_label
-
-    flow_graph[last_label].successors.append(exit_label)
-
-    # Remove redundant label instructions
-    label_list = []
-    for label, node in flow_graph.iteritems():
-        instruction_list = []
-        for instruction in node.basic_block:
-            if isinstance(instruction, I.LBL):
-                instruction_list.append(instruction)
-        for instruction in instruction_list:
-            node.basic_block.remove(instruction)
-        if len(node.basic_block) == 0:
-            label_list.append(label)
-    for label in label_list:
-        del flow_graph[label]
-
-    for label, node in flow_graph.iteritems():
-        for successor_label in node.successors:
-            flow_graph[successor_label].predecessors.append(label)
+    key = id(instructions)
+    instruction_ids = tuple(id(instruction) for instruction in instructions)
 
-    return flow_graph
+    if key in _flow_graphs:
+        reference, _instruction_ids, flow_graph = _flow_graphs[key]
+        if reference() is instructions and _instruction_ids == instruction_ids:
+            return flow_graph
+
+    flow_graph = _generate(instructions)
 
-    # TODO: work on the graph traversals (reverse-post-order and vice versa)
\ No newline at end of file
+    try:
+        reference = ref(instructions, lambda reference: _evict(key, reference))
+    except TypeError:
+        ''' Lists that can't be weakly referenced (e.g., plain lists) are not cached '''
+        return flow_graph
+    _flow_graphs[key] = (reference, instruction_ids, flow_graph)
+
+    return flow_graph
@@ -33,45 +33,165 @@
 
 __author__ = 'shahbaz'
 
+import time
+import threading
+from collections import OrderedDict
+from multiprocessing import Pool
+
 from netasm.netasm.core.utilities.profile import time_usage
+from netasm.netasm.core.utilities import serialize
 from netasm.netasm.core.syntax import InstructionCollection as I
+from netasm.netasm.core.analyses import manager as am
 from netasm.netasm.core.transformations import dead_code_elimination as dce
 from netasm.netasm.core.transformations import redundant_code_elimination as rce
 from netasm.netasm.core.transformations import add_code_motion as acm
 from netasm.netasm.core.transformations import rmv_code_motion as rcm
 # from netasm.netasm.core.transformations import rmv_code_insertion as rci
 
+# Note: the passes are run in order on each code, sharing the code's analyses (see analyses.manager), so a pass only
+#       computes the analyses that the passes before it changed. The time spent in each pass, over all the codes of a
+#       policy (and all the processes, when optimizing in parallel), is kept in timings (in seconds).
+PASSES = [('add_code_motion', acm.transform),
+          ('rmv_code_motion', rcm.transform),
+          ('dead_code_elimination', dce.transform),
+          ('redundant_code_elimination', rce.transform),
+          # ('rmv_code_insertion', rci.transform),
+          ]
 
-def _optimize_Code(code):
-    code = acm.transform(code)
-    code = rcm.transform(code)
-    code = dce.transform(code)
-    code = rce.transform(code)
-    # code = rci.transform(code)
 
-    return code
+class PassManager:
+    def __init__(self, passes=None):
+        self.passes = PASSES if passes is None else passes
+        self.timings = OrderedDict((name, 0.0) for name, _ in self.passes)
+
+    def run(self, code):
+        analyses = am.Analyses(code)
+        for name, transform in self.passes:
+            start_time = time.time()
+            code = transform(code, analyses)
+            self.timings[name] += time.time() - start_time
+
+        return code
+
+    def key(self, code):
+        return tuple(name for name, _ in self.passes), serialize.digest(code)
+
+    def report(self):
+        return ", ".join("%s=%fs" % (name, timing) for name, timing in self.timings.iteritems())
+
+
+# Note: optimized codes are cached by the passes and the digest (see utilities.serialize) of the code before
+#       optimization (see PassManager.key), so a code (or sub-code) that hasn't changed since it was last optimized,
+#       e.g., when a policy is loaded again, isn't optimized again. The cache keeps the codes serialized, and hands out
+#       a new copy on each hit.
+# Note: policies may be optimized from several threads at once (e.g., the datapath's and the controller's), so the
+#       cache is only accessed holding _optimized_codes_lock. The processes of a pool are forked with a lock of their
+#       own (see _init_worker), as the lock may be held by another thread when they are.
+CACHE_SIZE = 1024
+_optimized_codes = OrderedDict()
+_optimized_codes_lock = threading.Lock()
+
+
+def _get_optimized_code(key):
+    with _optimized_codes_lock:
+        data = _optimized_codes.pop(key, None)
+        if data is not None:
+            _optimized_codes[key] = data
+        return data
+
+
+def _set_optimized_code(key, data):
+    with _optimized_codes_lock:
+        _optimized_codes.pop(key, None)
+        _optimized_codes[key] = data
+        while len(_optimized_codes) > CACHE_SIZE:
+            _optimized_codes.popitem(last=False)
+
+
+def _is_optimized_code(key):
+    with _optimized_codes_lock:
+        return key in _optimized_codes
+
+
+def _init_worker():
+    global _optimized_codes_lock
+    _optimized_codes_lock = threading.Lock()
 
 
-def optimize_Code(code):
+def _optimize_Code__worker(arguments):
+    data, passes = arguments
+    pass_manager = PassManager(passes)
+    code = optimize_Code(serialize.loads(data), pass_manager)
+    return serialize.dumps(code), pass_manager.timings
+
+
+# Note: the sub-codes (of CNC, ATM and SEQ instructions) of a code have their own argument fields and are optimized
+#       independently of each other. With processes, the sub-codes missing from the cache are optimized in parallel,
+#       in a pool of that many processes (and their own sub-codes in the same process), and put back in order, so the
+#       result is the same as optimizing them one after the other.
+def _optimize_Codes(codes, pass_manager, processes):
+    keys = [pass_manager.key(code) for code in codes]
+
+    ''' Optimize the (distinct) codes missing from the cache in parallel '''
+    missing_codes = OrderedDict((key, code) for key, code in zip(keys, codes) if not _is_optimized_code(key))
+    if processes and len(missing_codes) > 1:
+        pool = Pool(processes, _init_worker)
+        try:
+            results = pool.map(_optimize_Code__worker,
+                               [(serialize.dumps(code), pass_manager.passes) for code in missing_codes.values()])
+        finally:
+            pool.terminate()
+        for key, (data, timings) in zip(missing_codes.keys(), results):
+            _set_optimized_code(key, data)
+            for name, timing in timings.iteritems():
+                pass_manager.timings[name] += timing
+
+    ''' Get the optimized codes, from the cache or by optimizing them here '''
+    return [_optimize_Code(code, key, pass_manager, None) for key, code in zip(keys, codes)]
+
+
+def _optimize_Code(code, key, pass_manager, processes):
+    data = _get_optimized_code(key)
+    if data is not None:
+        return serialize.loads(data)
+
+    codes = []
+    for instruction in code.instructions:
+        if isinstance(instruction, I.CNC):
+            codes.extend(instruction.codes)
+        elif isinstance(instruction, I.ATM):
+            codes.append(instruction.code)
+        elif isinstance(instruction, I.SEQ):
+            codes.append(instruction.code)
+
+    codes = iter(_optimize_Codes(codes, pass_manager, processes))
+
     for instruction in code.instructions:
         if isinstance(instruction, I.CNC):
-            codes = I.Codes()
-            for _code in instruction.codes:
-                codes.append(optimize_Code(_code))
-            instruction.codes = codes
+            instruction.codes = I.Codes(*[next(codes) for _ in instruction.codes])
         elif isinstance(instruction, I.ATM):
-            instruction.code = optimize_Code(instruction.code)
+            instruction.code = next(codes)
         elif isinstance(instruction, I.SEQ):
-            instruction.code = optimize_Code(instruction.code)
+            instruction.code = next(codes)
+
+    code = pass_manager.run(code)
+    _set_optimized_code(key, serialize.dumps(code))
+    return code
+
 
-    return _optimize_Code(code)
+def optimize_Code(code, pass_manager=None, processes=None):
+    pass_manager = pass_manager or PassManager()
+    return _optimize_Code(code, pass_manager.key(code), pass_manager, processes)
 
 
-def optimize_Policy(policy):
-    policy.code = optimize_Code(policy.code)
+def optimize_Policy(policy, pass_manager=None, processes=None):
+    policy.code = optimize_Code(policy.code, pass_manager, processes)
     return policy
 
 
+# Note: returns the time spent in each pass (see PassManager.timings) along with the policy, for the caller to report
 @time_usage
-def optimize_Policy__time_usage(policy):
-    return optimize_Policy(policy)
\ No newline at end of file
+def optimize_Policy__time_usage(policy, processes=None):
+    pass_manager = PassManager()
+    policy = optimize_Policy(policy, pass_manager, processes)
+    return policy, pass_manager.timings
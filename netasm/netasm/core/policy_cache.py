@@ -0,0 +1,177 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        policy_cache.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import errno
+import hmac
+import logging
+import os
+from collections import OrderedDict
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+
+from netasm.netasm.core.utilities import serialize
+from netasm.netasm.core import type_check, cost, optimize
+
+# Note: policies are compiled (i.e., type checked, costed and optimized) once, and the results are cached by the digest
+#       (see utilities.serialize) of the policy, the number of ports and the optimization passes. So loading a policy
+#       that was compiled before, e.g., when the same policy is set again or after reconnecting to the controller,
+#       only builds the policy and looks it up. Entries are kept in memory (evicting the least recently used), and, if
+#       a directory is given, on disk as well, where they outlive the process.
+# Note: the executable form of a policy (see execute) is bound to the tables of its executor, so it isn't cached;
+#       a new copy of the optimized policy is handed out, on each hit, to build the executor from.
+# Note: entries on disk are pickles, so they are signed (HMAC) with a key kept in the directory, and an entry whose
+#       signature doesn't check out is never unpickled. The directory is made readable and writable by its owner only.
+CACHE_SIZE = 64
+KEY_FILE = '.key'
+KEY_SIZE = 32
+SIGNATURE_SIZE = sha256().digest_size
+
+log = logging.getLogger(__name__)
+
+
+class CompiledPolicy:
+    def __init__(self, key, type_error, data=None, original_cost=None, optimized_cost=None, optimize_time=None):
+        self.key = key
+        self.type_error = type_error
+        self.data = data
+        self.original_cost = original_cost
+        self.optimized_cost = optimized_cost
+        self.optimize_time = optimize_time
+
+    @property
+    def policy(self):
+        return serialize.loads(self.data) if self.data is not None else None
+
+
+class PolicyCache:
+    def __init__(self, ports, size=CACHE_SIZE, directory=None, processes=None):
+        self.ports = ports
+        self.size = size
+        self.directory = directory
+        self.processes = processes
+        self._compiled_policies = OrderedDict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.policy')
+
+    def _key(self):
+        path = os.path.join(self.directory, KEY_FILE)
+        if not os.path.exists(path):
+            ''' Publish a new key (temporary files are private to the owner), unless another process just did '''
+            with NamedTemporaryFile('wb', dir=self.directory, delete=False) as _file:
+                _file.write(os.urandom(KEY_SIZE))
+            try:
+                os.link(_file.name, path)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+            finally:
+                os.remove(_file.name)
+
+        with open(path, 'rb') as _file:
+            return _file.read()
+
+    def _sign(self, data):
+        return hmac.new(self._key(), data, sha256).digest()
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+
+        ''' Unreadable, tampered with or stale entries are compiled again '''
+        try:
+            with open(self._path(key), 'rb') as _file:
+                data = _file.read()
+            if not hmac.compare_digest(data[:SIGNATURE_SIZE], self._sign(data[SIGNATURE_SIZE:])):
+                log.warn("Ignoring cached policy %s: bad signature", self._path(key))
+                return None
+            compiled_policy = serialize.loads(data[SIGNATURE_SIZE:])
+        except Exception, e:
+            log.error("Can't load cached policy %s: %s", self._path(key), e)
+            return None
+
+        if not (isinstance(compiled_policy, CompiledPolicy) and compiled_policy.key == key):
+            log.warn("Ignoring cached policy %s: not the entry for this key", self._path(key))
+            return None
+        return compiled_policy
+
+    def _store(self, compiled_policy):
+        if self.directory is None:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0700)
+
+        ''' Write to a temporary file first, so readers never see a partial entry '''
+        data = serialize.dumps(compiled_policy)
+        with NamedTemporaryFile('wb', dir=self.directory, delete=False) as _file:
+            _file.write(self._sign(data) + data)
+        os.rename(_file.name, self._path(compiled_policy.key))
+
+    def _add(self, compiled_policy):
+        self._compiled_policies[compiled_policy.key] = compiled_policy
+        while len(self._compiled_policies) > self.size:
+            self._compiled_policies.popitem(last=False)
+
+    def get(self, policy):
+        key = serialize.digest((self.ports, [name for name, _ in optimize.PASSES], policy))
+
+        ''' Look up memory first, then disk '''
+        compiled_policy = self._compiled_policies.pop(key, None)
+        if compiled_policy is None:
+            compiled_policy = self._load(key)
+        if compiled_policy is not None:
+            self._add(compiled_policy)
+            return compiled_policy, True
+
+        compiled_policy = self._compile(key, policy)
+        self._add(compiled_policy)
+        self._store(compiled_policy)
+        return compiled_policy, False
+
+    def _compile(self, key, policy):
+        try:
+            type_check.type_check_Policy(policy, self.ports)
+        except Exception, e:
+            return CompiledPolicy(key, e.message or str(e))
+
+        original_cost = cost.cost_Policy(policy)
+        pass_manager = optimize.PassManager()
+        policy = optimize.optimize_Policy(policy, pass_manager, self.processes)
+        optimized_cost = cost.cost_Policy(policy)
+
+        return CompiledPolicy(key, None, serialize.dumps(policy), original_cost, optimized_cost, pass_manager.report())
+
+    def clear(self):
+        self._compiled_policies.clear()
@@ -35,7 +35,7 @@ __author__ = 'shahbaz'
 
 from netasm.netasm.core.syntax import InstructionCollection as I, OperandCollection as O
 from netasm.netasm.core.common import is_reserved_field
-from netasm.netasm.core.graphs import control_flow_graph as cfg
+from netasm.netasm.core.analyses import manager as am
 from netasm.netasm.core.analyses import field_reachability as fr
 from netasm.netasm.core.analyses import reaching_definitions as rd
 
@@ -52,18 +52,17 @@ def get_field_size(reach_def_in, field):
     raise RuntimeError()
 
 
-def _transform(code, exclude_list):
+def _transform(code, analyses, exclude_list):
     instructions = code.instructions
 
     ''' Generate flow graph '''
-    flow_graph = cfg.generate(instructions)
+    flow_graph = analyses.flow_graph()
 
     ''' Get reaching definitions information (for I.ADD only) '''
-    reach_def_ins, reach_def_outs = rd.analyse(flow_graph, code.argument_fields,
-                                               [I.LD, I.OP, I.LDt, I.LKt, I.CRC, I.HSH, I.CNC, I.ATM, I.SEQ])
+    reach_def_ins, reach_def_outs = analyses.analyse(rd, [I.LD, I.OP, I.LDt, I.LKt, I.CRC, I.HSH, I.CNC, I.ATM, I.SEQ])
 
     ''' Get field reachability information '''
-    reach_ins, reach_outs = fr.analyse(flow_graph, code.argument_fields, exclude_list)
+    reach_ins, reach_outs = analyses.analyse(fr, exclude_list)
 
     ''' Cherry-pick dead instructions '''
     instruction_dict = {}
@@ -105,14 +104,6 @@ def _transform(code, exclude_list):
                             instruction_dict[instruction].append(I.ADD(
                                 O.Field(instruction.location.location.offset.field),
                                 get_field_size(reach_def_ins[instruction], instruction.location.location.offset.field)))
-                    if isinstance(instruction.location.location.length, O.Field):
-                        if is_reserved_or_argument_field(instruction.location.location.length.field,
-                                                         code.argument_fields):
-                            pass
-                        elif not (instruction.location.location.length.field in reach_ins[instruction]):
-                            instruction_dict[instruction].append(I.ADD(
-                                O.Field(instruction.location.location.length.field),
-                                get_field_size(reach_def_ins[instruction], instruction.location.location.length.field)))
                 else:
                     raise RuntimeError("invalid %s of location (%s). Should be %s."
                                        % (type(instruction.location), instruction.location, O.Location))
@@ -154,14 +145,6 @@ def _transform(code, exclude_list):
                             instruction_dict[instruction].append(I.ADD(
                                 O.Field(instruction.location.location.offset.field),
                                 get_field_size(reach_def_ins[instruction], instruction.location.location.offset.field)))
-                    if isinstance(instruction.location.location.length, O.Field):
-                        if is_reserved_or_argument_field(instruction.location.location.length.field,
-                                                         code.argument_fields):
-                            pass
-                        elif not (instruction.location.location.length.field in reach_ins[instruction]):
-                            instruction_dict[instruction].append(I.ADD(
-                                O.Field(instruction.location.location.length.field),
-                                get_field_size(reach_def_ins[instruction], instruction.location.location.length.field)))
                 else:
                     raise RuntimeError("invalid %s of location (%s). Should be %s."
                                        % (type(instruction.location), instruction.location, O.Location))
@@ -178,14 +161,6 @@ def _transform(code, exclude_list):
                             instruction_dict[instruction].append(I.ADD(
                                 O.Field(instruction.location.location.offset.field),
                                 get_field_size(reach_def_ins[instruction], instruction.location.location.offset.field)))
-                    if isinstance(instruction.location.location.length, O.Field):
-                        if is_reserved_or_argument_field(instruction.location.location.length.field,
-                                                         code.argument_fields):
-                            pass
-                        elif not (instruction.location.location.length.field in reach_ins[instruction]):
-                            instruction_dict[instruction].append(I.ADD(
-                                O.Field(instruction.location.location.length.field),
-                                get_field_size(reach_def_ins[instruction], instruction.location.location.length.field)))
                 else:
                     raise RuntimeError("invalid %s of location (%s). Should be %s."
                                        % (type(instruction.location), instruction.location, O.Location))
@@ -399,7 +374,7 @@ def _transform(code, exclude_list):
             instructions.insert(index + i, _instructions[i])
 
 
-def transform(code):
-    _transform(code, [I.ADD])
+def transform(code, analyses=None):
+    _transform(code, analyses or am.Analyses(code), [I.ADD])
 
     return code
\ No newline at end of file
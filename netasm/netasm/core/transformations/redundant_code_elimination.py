@@ -33,11 +33,9 @@
 
 __author__ = 'shahbaz'
 
-from copy import copy
-
 from netasm.netasm.core.syntax import InstructionCollection as I
 from netasm.netasm.core.common import is_reserved_field, get_add_instruction_count, get_rmv_instruction_count
-from netasm.netasm.core.graphs import control_flow_graph as cfg
+from netasm.netasm.core.analyses import manager as am
 from netasm.netasm.core.analyses import field_usability as fu
 from netasm.netasm.core.analyses import field_reachability as fr
 
@@ -47,14 +45,14 @@ def is_reserved_or_argument_field(field, argument_fields):
 
 
 # Transform using field reachability analysis for removing redundant ADD instructions
-def _phase_0(code):
+def _phase_0(code, analyses):
     instructions = code.instructions
 
     ''' Generate flow graph '''
-    flow_graph = cfg.generate(instructions)
+    flow_graph = analyses.flow_graph()
 
     ''' Get reachability information '''
-    reach_ins, reach_outs = fr.analyse(flow_graph, code.argument_fields, [])
+    reach_ins, reach_outs = analyses.analyse(fr, [])
 
     ''' Cherry-pick dead instructions '''
     instruction_list = []
@@ -73,16 +71,18 @@ def _phase_0(code):
     for instruction in instruction_list:
         instructions.remove(instruction)
 
+    return bool(instruction_list)
+
 
 # Transform using field usability analysis for removing redundant RMV instructions
-def _phase_1(code):
+def _phase_1(code, analyses):
     instructions = code.instructions
 
     ''' Generate flow graph '''
-    flow_graph = cfg.generate(instructions)
+    flow_graph = analyses.flow_graph()
 
     ''' Get usability information '''
-    use_ins, use_outs = fu.analyse(flow_graph, code.argument_fields, [])
+    use_ins, use_outs = analyses.analyse(fu, [])
 
     ''' Cherry-pick dead instructions '''
     instruction_list = []
@@ -101,14 +101,16 @@ def _phase_1(code):
     for instruction in instruction_list:
         instructions.remove(instruction)
 
+    return bool(instruction_list)
 
-def transform(code):
-    while True:
-        ''' Iterate till fixed-point is reached '''
-        instructions = copy(code.instructions)
 
-        _phase_0(code)
-        _phase_1(code)
+def transform(code, analyses=None):
+    analyses = analyses or am.Analyses(code)
+
+    while True:
+        ''' Iterate till fixed-point is reached (i.e., till no more instructions are removed) '''
+        changed = _phase_0(code, analyses)
+        changed = _phase_1(code, analyses) or changed
 
-        if set(instructions) == set(code.instructions):
+        if not changed:
             return code
\ No newline at end of file
@@ -35,7 +35,7 @@ __author__ = 'shahbaz'
 
 from netasm.netasm.core.syntax import InstructionCollection as I, OperandCollection as O
 from netasm.netasm.core.common import is_reserved_field
-from netasm.netasm.core.graphs import control_flow_graph as cfg
+from netasm.netasm.core.analyses import manager as am
 from netasm.netasm.core.analyses import field_usability as fu
 
 
@@ -43,14 +43,14 @@ def is_reserved_or_argument_field(field, argument_fields):
     return is_reserved_field(field) or (field in argument_fields)
 
 
-def _transform(code, exclude_list):
+def _transform(code, analyses, exclude_list):
     instructions = code.instructions
 
     ''' Generate flow graph '''
-    flow_graph = cfg.generate(instructions)
+    flow_graph = analyses.flow_graph()
 
     ''' Get usability information '''
-    use_ins, use_outs = fu.analyse(flow_graph, code.argument_fields, exclude_list)
+    use_ins, use_outs = analyses.analyse(fu, exclude_list)
 
     ''' Cherry-pick dead instructions '''
     instruction_dict = {}
@@ -85,13 +85,6 @@ def _transform(code, exclude_list):
                         elif not (instruction.location.location.offset.field in use_outs[instruction]):
                             instruction_dict[instruction].append(I.RMV(
                                 O.Field(instruction.location.location.offset.field)))
-                    if isinstance(instruction.location.location.length, O.Field):
-                        if is_reserved_or_argument_field(instruction.location.location.length.field,
-                                                         code.argument_fields):
-                            pass
-                        elif not (instruction.location.location.length.field in use_outs[instruction]):
-                            instruction_dict[instruction].append(I.RMV(
-                                O.Field(instruction.location.location.length.field)))
                 else:
                     raise RuntimeError("invalid %s of locations (%s). Should be %s."
                                        % (type(instruction.location), instruction.location, O.Location))
@@ -126,13 +119,6 @@ def _transform(code, exclude_list):
                         elif not (instruction.location.location.offset.field in use_outs[instruction]):
                             instruction_dict[instruction].append(I.RMV(
                                 O.Field(instruction.location.location.offset.field)))
-                    if isinstance(instruction.location.location.length, O.Field):
-                        if is_reserved_or_argument_field(instruction.location.location.length.field,
-                                                         code.argument_fields):
-                            pass
-                        elif not (instruction.location.location.length.field in use_outs[instruction]):
-                            instruction_dict[instruction].append(I.RMV(
-                                O.Field(instruction.location.location.length.field)))
                 else:
                     raise RuntimeError("invalid %s of locations (%s). Should be %s."
                                        % (type(instruction.location), instruction.location, O.Location))
@@ -148,13 +134,6 @@ def _transform(code, exclude_list):
                         elif not (instruction.location.location.offset.field in use_outs[instruction]):
                             instruction_dict[instruction].append(I.RMV(
                                 O.Field(instruction.location.location.offset.field)))
-                    if isinstance(instruction.location.location.length, O.Field):
-                        if is_reserved_or_argument_field(instruction.location.location.length.field,
-                                                         code.argument_fields):
-                            pass
-                        elif not (instruction.location.location.length.field in use_outs[instruction]):
-                            instruction_dict[instruction].append(I.RMV(
-                                O.Field(instruction.location.location.length.field)))
                 else:
                     raise RuntimeError("invalid %s of locations (%s). Should be %s."
                                        % (type(instruction.location), instruction.location, O.Location))
@@ -334,7 +313,7 @@ def _transform(code, exclude_list):
             instructions.insert(index + i + 1, _instructions[i])
 
 
-def transform(code):
-    _transform(code, [])
+def transform(code, analyses=None):
+    _transform(code, analyses or am.Analyses(code), [])
 
     return code
\ No newline at end of file
@@ -34,10 +34,11 @@
 __author__ = 'shahbaz'
 
 from netasm.netasm.core.syntax import InstructionCollection as I
+from netasm.netasm.core.analyses import manager as am
 from netasm.netasm.core.transformations.rmv_code_insertion import _transform
 
 
-def transform(code):
-    _transform(code, [I.RMV])
+def transform(code, analyses=None):
+    _transform(code, analyses or am.Analyses(code), [I.RMV])
 
     return code
\ No newline at end of file
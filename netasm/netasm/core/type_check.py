@@ -35,14 +35,14 @@
 
 __author__ = 'shahbaz'
 
-from copy import deepcopy
+from heapq import heappush, heappop
 
 from bitstring import BitArray
 
 from netasm.netasm.core import syntax
 from netasm.netasm.core.syntax import OperandCollection as O, OperatorCollection as Op, InstructionCollection as I
-from netasm.netasm.core.common import is_reserved_field, is_special_field, get_reserved_fields, \
-    get_instruction_at_label as get_label
+from netasm.netasm.core.common import is_reserved_field, is_special_field, get_reserved_fields
+from netasm.netasm.core.graphs import control_flow_graph as cfg
 from netasm.netasm.core.utilities.profile import time_usage
 
 labels = None
@@ -289,7 +289,7 @@ def type_check_CTR(context, reason):
 
 def type_check_ADD(context, field, size):
     if not is_reserved_field(field.field):
-        if field.field not in context.header:
+        if field.field not in context.header and field.field not in context.partial_fields:
             context.header[field.field] = size
         else:
             raise TypeError("field (%s) is already present in the header." % str(field.field))
@@ -817,10 +817,7 @@ def type_check_Decls(decls):
     return tables
 
 
-def next_Instruction(instructions, tables, context):
-    # Read instruction at program counter
-    instruction = instructions[context.pc]
-
+def type_check_Instruction(instruction, tables, context):
     if isinstance(instruction, I.ID):
         type_check_ID(context)
     elif isinstance(instruction, I.DRP):
@@ -874,65 +871,107 @@ def next_Instruction(instructions, tables, context):
         type_check_ATM(context, tables, instruction.code)
     elif isinstance(instruction, I.SEQ):
         type_check_SEQ(context, tables, instruction.code)
+    elif isinstance(instruction, I.HLT):
+        type_check_HLT(context)
+    elif isinstance(instruction, cfg.Entry) or isinstance(instruction, cfg.Exit):
+        pass
     else:
         raise TypeError("invalid %s of instruction (%s). Should be %s."
                         % (type(instruction), instruction, I.Instruction))
 
 
-def type_check_Instruction(instructions, tables, context):
-    # Read instruction at program counter
-    instruction = instructions[context.pc]
-
-    # Check if HLT instruction
-    if isinstance(instruction, I.HLT):
-        type_check_HLT(context)
-    else:
-        next_Instruction(instructions, tables, context)
-
-        if len(context.labels) == 1:
-            if context.labels[0] == syntax.Label(''):
-                context.pc += 1
-            else:
-                context.pc, _ = get_label(instructions, context.labels[0])
-            type_check_Instruction(instructions, tables, context)
-        elif len(context.labels) == 2:
-            if context.labels[0] != '':
-                pass
-            else:
-                raise TypeError("taken-branch label (%s) can't be empty."
-                                % (context.labels[0]))
-            if context.labels[1] == '':
-                pass
-            else:
-                raise TypeError("not-taken-branch label (%s) must be empty."
-                                % (context.labels[1]))
+# Note: instructions are type checked by abstract interpretation over their control-flow graph (see
+#       graphs/control_flow_graph.py), rather than path by path. A header type is a header (of field sizes) plus the
+#       partial fields, i.e., the fields present on some but not all of the paths into a block, which can neither be
+#       used nor added again. The header types reaching a block are joined, and a (block, header type) pair is only
+#       checked once, so checking runs to a fixed-point in time linear in the blocks (times the joins).
+# Note: header types whose fields differ in size are not joined, but checked separately, so that joining never
+#       reports an error that checking each path wouldn't have.
+def _is_joinable(header, _header):
+    for field, size in header.iteritems():
+        if field in _header and _header[field] != size:
+            return False
+    return True
+
+
+def _join((header, partial_fields), (_header, _partial_fields)):
+    joined_header = Header()
+    for field, size in header.iteritems():
+        if field in _header and _header[field] == size:
+            dict.__setitem__(joined_header, field, size)
+
+    partial_fields = (partial_fields | _partial_fields |
+                      frozenset(field for field in header.keys() + _header.keys() if field not in joined_header))
+
+    return joined_header, partial_fields
+
+
+def type_check_Instructions(instructions, tables, context):
+    flow_graph = cfg.generate(instructions)
+
+    ''' Visit blocks in reverse-postorder, so that the header types reaching a block are joined before checking it '''
+    order = dict((block, i) for i, block in enumerate(flow_graph.reverse_postorder))
+
+    header_types = {cfg.ENTRY: [(context.header, context.partial_fields)]}
+    checked = set()
+    exit_header_type = None
+
+    worklist = [(order[cfg.ENTRY], cfg.ENTRY)]
+    pending = {cfg.ENTRY}
+    while worklist:
+        _, block = heappop(worklist)
+        pending.discard(block)
+        node = flow_graph[block]
+
+        for header, partial_fields in list(header_types[block]):
+            key = (block, frozenset(header.iteritems()), partial_fields)
+            if key in checked:
+                continue
+            checked.add(key)
+
+            context.header = Header(header)
+            context.partial_fields = partial_fields
+            for instruction in node.basic_block:
+                type_check_Instruction(instruction, tables, context)
+            header_type = (context.header, context.partial_fields)
+
+            if isinstance(node.basic_block[-1], I.HLT):
+                if exit_header_type is None:
+                    exit_header_type = header_type
+                else:
+                    exit_header_type = _join(exit_header_type, header_type)
+
+            ''' Join the header type with the ones already reaching the successors '''
+            for successor in node.successors:
+                successor_header_types = header_types.setdefault(successor, [])
+                for i in range(len(successor_header_types)):
+                    if _is_joinable(successor_header_types[i][0], header_type[0]):
+                        successor_header_types[i] = _join(successor_header_types[i], header_type)
+                        break
+                else:
+                    successor_header_types.append(header_type)
 
-            # type check taken-branch
-            contextT = deepcopy(context)
-            contextT.pc, _ = get_label(instructions, context.labels[0])
-            type_check_Instruction(instructions, tables, contextT)
+                if successor not in pending:
+                    pending.add(successor)
+                    heappush(worklist, (order[successor], successor))
 
-            # type check not-taken-branch
-            context.pc += 1
-            type_check_Instruction(instructions, tables, context)
-        else:
-            raise TypeError("invalid labels (%s) count."
-                            % context.labels)
+    if exit_header_type is not None:
+        context.header, context.partial_fields = exit_header_type
 
 
 def type_check_Code(code, tables, context):
-    pc = context.pc
     header = context.header
+    partial_fields = context.partial_fields
 
-    context.pc = 0
     context.header = Header()
+    context.partial_fields = frozenset()
     for field in code.argument_fields:
         context.header[field] = header[field]
     for field in get_reserved_fields():
         context.header[field] = header[field]
 
     # Type check instructions
-    type_check_Instruction(code.instructions, tables, context)
+    type_check_Instructions(code.instructions, tables, context)
 
     # Commit changes to the current header
     for field in code.argument_fields:
@@ -940,8 +979,8 @@ def type_check_Code(code, tables, context):
     for field in get_reserved_fields():
         header[field] = context.header[field]
 
-    context.pc = pc
     context.header = header
+    context.partial_fields = partial_fields
 
 
 def type_check_Policy(policy, ports):
@@ -962,7 +1001,7 @@ def type_check_Policy(policy, ports):
     context.header[syntax.Field('bit_length')] = syntax.Size(ports)
     context.header[syntax.Field('DRP')] = syntax.Size(1)
     context.header[syntax.Field('CTR')] = syntax.Size(1)
-    setattr(context, 'pc', 0)
+    setattr(context, 'partial_fields', frozenset())
 
     ''' Type check declarations '''
     tables = type_check_Decls(policy.decls)
@@ -971,7 +1010,7 @@ def type_check_Policy(policy, ports):
     type_check_Code(policy.code, tables, context)
 
     ''' Remove local context attributes '''
-    del context.pc
+    del context.partial_fields
 
 
 @time_usage
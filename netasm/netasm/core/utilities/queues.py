@@ -0,0 +1,118 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        queues.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+from Queue import Queue
+from random import random
+
+TAIL_DROP = 'tail-drop'
+RANDOM_EARLY_DROP = 'random-early-drop'
+
+DROP_POLICIES = (TAIL_DROP, RANDOM_EARLY_DROP)
+
+
+# Note: admission control for a queue of (at most) capacity items, None being unbounded. With tail drop, an item is
+#       only dropped when the queue is full. With random early drop, an item is also dropped, once the queue is
+#       min_depth deep (half full, by default), with a probability that grows linearly with the depth, up to 1 when
+#       it is full. The items dropped are counted, and so is the deepest the queue has been (its high watermark).
+class Admission:
+    def __init__(self, capacity=None, policy=TAIL_DROP, min_depth=None):
+        if policy not in DROP_POLICIES:
+            raise RuntimeError("Invalid drop policy: %s" % (policy, ))
+
+        self.capacity = capacity
+        self.policy = policy
+        if min_depth is None and capacity is not None:
+            min_depth = capacity // 2
+        self.min_depth = min_depth
+
+        self.drops = 0
+        self.high_watermark = 0
+
+    def admit(self, depth):
+        if self.capacity is not None:
+            if depth >= self.capacity:
+                self.drops += 1
+                return False
+            if self.policy == RANDOM_EARLY_DROP and depth >= self.min_depth:
+                if random() < (depth - self.min_depth + 1.0) / (self.capacity - self.min_depth + 1):
+                    self.drops += 1
+                    return False
+
+        if depth >= self.high_watermark:
+            self.high_watermark = depth + 1
+        return True
+
+    def stats(self, depth):
+        return {'depth': depth, 'drops': self.drops, 'high_watermark': self.high_watermark}
+
+
+# Note: a (thread) queue of batches (lists) of items, bounded in items (see Admission). Batches are offered without
+#       blocking, and only the items admitted are queued. Anything else put (e.g., None to signal to quit) is always
+#       queued, and doesn't count.
+class BoundedQueue(Queue):
+    def __init__(self, capacity=None, policy=TAIL_DROP, min_depth=None):
+        Queue.__init__(self)
+
+        self.admission = Admission(capacity, policy, min_depth)
+        self.depth = 0
+
+    def _put(self, item):
+        self.queue.append(item)
+        if isinstance(item, list):
+            self.depth += len(item)
+
+    def _get(self):
+        item = self.queue.popleft()
+        if isinstance(item, list):
+            self.depth -= len(item)
+        return item
+
+    # Note: returns the number of items dropped
+    def offer(self, items):
+        with self.mutex:
+            admitted = []
+            for item in items:
+                if self.admission.admit(self.depth + len(admitted)):
+                    admitted.append(item)
+
+            if admitted:
+                self._put(admitted)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+
+        return len(items) - len(admitted)
+
+    def stats(self):
+        return self.admission.stats(self.depth)
@@ -0,0 +1,97 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        serialize.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+from cStringIO import StringIO
+from cPickle import Pickler, Unpickler, HIGHEST_PROTOCOL
+from hashlib import sha1
+from types import ClassType
+
+from netasm.netasm.core import syntax
+
+# Note: the classes of the syntax are mostly defined inside collections (e.g., InstructionCollection.LD), which pickle
+#       can't find by name, and operators (and match/table types) are singletons, which must stay the same objects.
+#       Here, both are pickled by their path in the syntax module instead (as persistent ids), so policies, codes and
+#       instructions can be sent across processes and stored.
+
+
+def _syntax_paths(namespace, prefix):
+    paths = {}
+    for name, value in vars(namespace).items():
+        if isinstance(value, (type, ClassType)) and getattr(value, '__module__', None) == syntax.__name__:
+            paths[id(value)] = (prefix + name, value)
+            paths.update(_syntax_paths(value, prefix + name + '.'))
+        elif isinstance(getattr(value, '__class__', None), ClassType) and \
+                getattr(value.__class__, '__module__', None) == syntax.__name__:
+            paths[id(value)] = (prefix + name, value)
+    return paths
+
+
+_paths = dict((key, path) for key, (path, _) in _syntax_paths(syntax, '').iteritems())
+_objects = dict(_syntax_paths(syntax, '').itervalues())
+
+
+def dumps(obj):
+    _file = StringIO()
+    pickler = Pickler(_file, HIGHEST_PROTOCOL)
+    pickler.persistent_id = lambda value: _paths.get(id(value))
+    pickler.dump(obj)
+    return _file.getvalue()
+
+
+def loads(data):
+    unpickler = Unpickler(StringIO(data))
+    unpickler.persistent_load = lambda path: _objects[path]
+    return unpickler.load()
+
+
+# Note: the digest only depends on the structure of the object (i.e., the classes and the values of its parts), so
+#       equal objects built separately (e.g., when a policy is loaded again) have the same digest.
+def _structure(value):
+    if id(value) in _paths:
+        return _paths[id(value)]
+    elif isinstance(value, (basestring, int, long, float, bool)) or value is None:
+        return _paths.get(id(value.__class__), value.__class__.__name__), value
+    elif isinstance(value, (list, tuple)):
+        return _paths.get(id(value.__class__), value.__class__.__name__), [_structure(_value) for _value in value]
+    elif isinstance(value, dict):
+        return _paths.get(id(value.__class__), value.__class__.__name__), \
+            sorted((_structure(key), _structure(_value)) for key, _value in value.iteritems())
+    else:
+        return _paths.get(id(value.__class__), value.__class__.__name__), \
+            sorted((key, _structure(_value)) for key, _value in vars(value).iteritems())
+
+
+def digest(obj):
+    return sha1(repr(_structure(obj))).hexdigest()
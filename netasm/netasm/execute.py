@@ -34,4 +34,5 @@
 __author__ = 'shahbaz'
 
 # from netasm.netasm.core.execute.single_process import *
+# from netasm.netasm.core.execute.compiled import *
 from netasm.netasm.core.execute.multi_process import *
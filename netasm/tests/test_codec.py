@@ -0,0 +1,91 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        test_codec.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import unittest
+
+from netasm.back_ends.soft_switch import codec
+
+
+class CodecTest(unittest.TestCase):
+    def _round_trip(self, message):
+        decoded = codec.decode(codec.encode(message))
+        self.assertEqual(decoded, message)
+        return decoded
+
+    def test_dump_table_query(self):
+        self._round_trip({'type': 'query', 'operation': 'dump-table', 'data': ('match_table', 0, None, None, False)})
+        self._round_trip({'type': 'query', 'operation': 'dump-table', 'data': ('match_table', 2, 10, 7, True)})
+
+    def test_dump_table_reply(self):
+        ''' Packed entries, of match and of simple tables '''
+        self._round_trip({'type': 'in', 'operation': 'dump-table',
+                          'data': ('match_table', 5, ['eth_src', 'eth_dst'],
+                                   [(0, [1, 2], [-1, 0]), (3, [4, 5], [-1, -1])], True)})
+        self._round_trip({'type': 'in', 'operation': 'dump-table',
+                          'data': ('params_table', 1, ['outport_bitmap'], [(0, [1]), (1, [2])], False)})
+
+        ''' Typed entries, of values too wide to pack, and no entries at all '''
+        self._round_trip({'type': 'in', 'operation': 'dump-table',
+                          'data': ('wide_table', 2, ['value'], [(0, [1 << 100])], True)})
+        self._round_trip({'type': 'in', 'operation': 'dump-table', 'data': ('empty_table', 0, ['value'], [], True)})
+
+    def test_dump_table_reply_split(self):
+        entries = [(i, [i, i + 1]) for i in range(0, 10000)]
+        lists = codec.split_entries('match_table', 3, ['a', 'b'], entries)
+        self.assertTrue(len(lists) > 1)
+        self.assertEqual(sum(lists, []), entries)
+
+        for i, _entries in enumerate(lists):
+            data = codec.encode({'type': 'in', 'operation': 'dump-table',
+                                 'data': ('match_table', 3, ['a', 'b'], _entries, i == len(lists) - 1)})
+            self.assertTrue(len(data) - codec._HEADER.size <= codec.MAX_BODY_SIZE)
+
+    def test_other_operations(self):
+        self._round_trip({'type': 'in', 'operation': 'packet-in', 'data': (2, 'abc\x00', ('MATCH_TABLE_MISS', ''))})
+        self._round_trip({'type': 'out', 'operation': 'packet-out', 'data': ([1, 3], 'abc')})
+        self._round_trip({'type': 'out', 'operation': 'packet-out', 'data': ([1], None)})
+        self._round_trip({'type': 'out', 'operation': 'add-table-entry',
+                          'data': ('match_table', 0, {'eth_src': (1, -1)})})
+        self._round_trip({'type': 'query', 'operation': 'query-table-list', 'data': None})
+
+    def test_textual(self):
+        message = {'type': 'query', 'operation': 'dump-table', 'data': ('match_table', 0, None, None, False)}
+        data = codec.encode(message, textual=True)
+        self.assertTrue(codec.is_textual(data))
+        self.assertEqual(codec.decode(data), message)
+
+
+if __name__ == '__main__':
+    unittest.main()
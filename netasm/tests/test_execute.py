@@ -0,0 +1,215 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        test_execute.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import random
+import unittest
+from importlib import import_module
+
+from netasm.netasm.core.syntax import Field, Value, Size, TableId
+from netasm.netasm.core.execute import State, Header, Packet
+from netasm.netasm.core.execute import single_process, compiled, multi_process
+from netasm.netasm.core.utilities.queues import Admission, BoundedQueue, TAIL_DROP, RANDOM_EARLY_DROP
+
+
+def get_bits(packet):
+    bits = []
+    for byte in bytearray(packet.bytes):
+        bits.extend([(byte >> (7 - k)) & 1 for k in range(0, 8)])
+    return bits[:len(packet)]
+
+
+def to_value(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bit
+    return value
+
+
+def to_bits(value, size):
+    return [(value >> (size - 1 - k)) & 1 for k in range(0, size)]
+
+
+# Note: packets are checked against a plain list of bits, over random loads, stores, inserts and removes, at offsets
+#       and of sizes both byte-aligned and not
+class PacketTest(unittest.TestCase):
+    def test_new(self):
+        self.assertEqual(len(Packet()), 0)
+        self.assertEqual(Packet(12).bytes, '\x00\x00')
+        self.assertEqual(len(Packet(12)), 12)
+        self.assertEqual(Packet('\x01\x02').load(8, 8), 2)
+
+        data = bytearray('\x01\x02')
+        self.assertTrue(Packet(data).data is data)
+
+    def test_operations(self):
+        random.seed(3)
+        packet = Packet('\xde\xad\xbe\xef')
+        bits = get_bits(packet)
+
+        for _ in range(0, 3000):
+            operation = random.choice(['load', 'store', 'insert', 'remove'])
+            offset = random.choice([0, 8, 16, random.randrange(0, len(bits) + 1)])
+            size = random.choice([1, 4, 8, 16, 24, 32, 64, random.randrange(1, 80)])
+            value = random.getrandbits(size + 4)
+
+            if operation == 'load':
+                _size = min(size, len(bits) - offset)
+                expected = to_value(bits[offset:offset + _size]) if _size > 0 else 0
+                self.assertEqual(packet.load(offset, size), expected)
+            elif operation == 'store':
+                packet.store(offset, size, value)
+                if offset + size > len(bits):
+                    bits.extend([0] * (offset + size - len(bits)))
+                bits[offset:offset + size] = to_bits(value, size)
+            elif operation == 'insert':
+                offset = min(offset, len(bits))
+                packet.insert(offset, size, value)
+                bits[offset:offset] = to_bits(value, size)
+            else:
+                _size = min(size, len(bits) - offset)
+                expected = to_value(bits[offset:offset + _size]) if _size > 0 else 0
+                self.assertEqual(packet.remove(offset, size), expected)
+                del bits[offset:offset + size]
+
+            self.assertEqual(len(packet), len(bits))
+            self.assertEqual(get_bits(packet), bits)
+
+            ''' Keep the packet from growing without bound '''
+            if len(bits) > 512:
+                packet.remove(0, len(bits) - 256)
+                del bits[:len(bits) - 256]
+
+    def test_insert_past_end(self):
+        self.assertRaises(RuntimeError, Packet('\x00').insert, 9, 8, 0)
+
+
+class QueuesTest(unittest.TestCase):
+    def test_tail_drop(self):
+        admission = Admission(3)
+        self.assertEqual([admission.admit(depth) for depth in [0, 1, 2, 3, 4]], [True, True, True, False, False])
+        self.assertEqual(admission.stats(2), {'depth': 2, 'drops': 2, 'high_watermark': 3})
+
+        self.assertTrue(all(Admission().admit(depth) for depth in range(0, 1000)))
+        self.assertRaises(RuntimeError, Admission, 3, 'no-drop')
+
+    def test_random_early_drop(self):
+        random.seed(4)
+        admission = Admission(10, RANDOM_EARLY_DROP)
+        self.assertEqual(admission.min_depth, 5)
+
+        ''' Never dropped below min_depth, always when full, and sometimes in between '''
+        self.assertTrue(all(admission.admit(depth) for depth in range(0, 5) for _ in range(0, 100)))
+        self.assertFalse(any(admission.admit(10) for _ in range(0, 100)))
+        admitted = [admission.admit(7) for _ in range(0, 1000)]
+        self.assertTrue(0 < admitted.count(True) < 1000)
+        self.assertEqual(admission.drops, 100 + admitted.count(False))
+
+    def test_bounded_queue(self):
+        queue = BoundedQueue(3, TAIL_DROP)
+        self.assertEqual(queue.offer([1, 2]), 0)
+        self.assertEqual(queue.offer([3, 4, 5]), 2)
+        self.assertEqual(queue.offer([6]), 1)
+        self.assertEqual(queue.stats(), {'depth': 3, 'drops': 3, 'high_watermark': 3})
+
+        ''' Anything else put always goes through, and doesn't count '''
+        queue.put(None)
+        self.assertEqual(queue.get(), [1, 2])
+        self.assertEqual(queue.get(), [3])
+        self.assertEqual(queue.get(), None)
+        self.assertEqual(queue.stats()['depth'], 0)
+        self.assertEqual(queue.offer([7, 8, 9]), 0)
+
+
+def make_state(port, data):
+    state = State(Header(), Packet(data))
+    state.header[Field('inport_bitmap')] = Value(1 << (port - 1), Size(64))
+    state.header[Field('outport_bitmap')] = Value(0, Size(64))
+    state.header[Field('bit_length')] = Value(len(state.packet), Size(64))
+    state.header[Field('DRP')] = Value(0, Size(1))
+    state.header[Field('CTR')] = Value(0, Size(1))
+    return state
+
+
+# Note: table_based_simple looks the source MAC up in its match table, and sends the packet to the ports of the entry
+#       at the same index of its params table (or to the controller, if there is none)
+class SwapTest(unittest.TestCase):
+    MAC = 0x0a0b0c0d0e0f
+    DATA = '\xff' * 6 + '\x0a\x0b\x0c\x0d\x0e\x0f' + '\x08\x00' + 'x' * 50
+
+    def _policy(self):
+        return import_module('netasm.examples.netasm.controller_assisted.table_based_simple').main()
+
+    def _outport(self, execute):
+        execute.put(make_state(1, self.DATA))
+        state = execute.get()
+        return state.header[Field('outport_bitmap')].value, state.header[Field('CTR')].value
+
+    def _test_swap(self, engine, **kwargs):
+        execute = engine.Execute(self._policy(), **kwargs)
+        execute.start()
+        try:
+            self.assertEqual(self._outport(execute)[1], 1)
+
+            execute.add_table_entry(TableId('match_table'), 1, {'eth_src': (self.MAC, -1)})
+            execute.add_table_entry(TableId('params_table'), 1, {'outport_bitmap': 2})
+            self.assertEqual(self._outport(execute), (2, 0))
+            version, _, entries = execute.dump_table_entries(TableId('match_table'))
+
+            ''' The entries are carried over to the new policy, and the versions only increase '''
+            execute.swap(self._policy())
+            self.assertEqual(self._outport(execute), (2, 0))
+            self.assertEqual(execute.query_table_entry(TableId('params_table'), 1)['outport_bitmap']['value'][0], 2)
+            _version, _, _entries = execute.dump_table_entries(TableId('match_table'))
+            self.assertTrue(_version > version)
+            self.assertEqual(_entries, entries)
+
+            ''' The new policy's tables are the ones updated from then on '''
+            execute.add_table_entry(TableId('params_table'), 1, {'outport_bitmap': 1})
+            self.assertEqual(self._outport(execute), (1, 0))
+        finally:
+            execute.stop()
+
+    def test_single_process(self):
+        self._test_swap(single_process)
+
+    def test_compiled(self):
+        self._test_swap(compiled)
+
+    def test_multi_process(self):
+        self._test_swap(multi_process, workers=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
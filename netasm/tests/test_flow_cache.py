@@ -0,0 +1,115 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        test_flow_cache.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import unittest
+
+from netasm.netasm.core import *
+from netasm.netasm.core.execute import State, Header, Packet
+from netasm.netasm.core.execute import single_process, compiled
+
+
+# Note: writes the first byte of the packet, widened (see operate), to the outport_bitmap. The second byte is loaded
+#       into a dead field (see flow_cache.get_dead_load_offsets), so packets that only differ there hit the same
+#       megaflow but not the same microflow.
+def policy():
+    decls = Decls(TableDecls())
+
+    code = I.Code(
+        Fields(),
+        I.Instructions(
+            I.ADD(O.Field(Field('value')),
+                  Size(8)),
+            I.ADD(O.Field(Field('unused')),
+                  Size(8)),
+            I.LD(O.Field(Field('value')),
+                 O.Location(
+                     Location(
+                         O.Value(Value(0, Size(16)))))),
+            I.LD(O.Field(Field('unused')),
+                 O.Location(
+                     Location(
+                         O.Value(Value(8, Size(16)))))),
+            I.OP(O.Field(Field('outport_bitmap')),
+                 O.Field(Field('value')),
+                 Op.Add,
+                 O.Value(Value(1, Size(16)))),
+            I.HLT()
+        )
+    )
+
+    return Policy(decls, code)
+
+
+def make_state(data):
+    state = State(Header(), Packet(data))
+    state.header[Field('inport_bitmap')] = Value(1, Size(64))
+    state.header[Field('outport_bitmap')] = Value(0, Size(64))
+    state.header[Field('bit_length')] = Value(len(state.packet), Size(64))
+    state.header[Field('DRP')] = Value(0, Size(1))
+    state.header[Field('CTR')] = Value(0, Size(1))
+    return state
+
+
+def dump_header(state):
+    return sorted((str(field), value.value, int(value.size)) for field, value in state.header.iteritems())
+
+
+class FlowCacheTest(unittest.TestCase):
+    def _run(self, engine, flow_cache_size, packets):
+        execute = engine.Execute(policy(), flow_cache_size=flow_cache_size)
+        execute.start()
+        try:
+            headers = []
+            for data in packets:
+                execute.put(make_state(data))
+                headers.append(dump_header(execute.get()))
+            return headers, execute.query_flow_cache()
+        finally:
+            execute.stop()
+
+    def test_hits_match_misses(self):
+        ''' A miss, a microflow hit and a megaflow hit '''
+        packets = ['\x05\x00\x00\x00', '\x05\x00\x00\x00', '\x05\x07\x00\x00']
+
+        for engine in [single_process, compiled]:
+            expected, _ = self._run(engine, 0, packets)
+            headers, counters = self._run(engine, 16, packets)
+
+            self.assertEqual((counters['hits'], counters['misses'], counters['wildcard_hits']), (1, 1, 1))
+            self.assertEqual(headers, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
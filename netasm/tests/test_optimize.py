@@ -0,0 +1,203 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        test_optimize.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import random
+import unittest
+from importlib import import_module
+
+from netasm.netasm.core import *
+from netasm.netasm.core import optimize
+from netasm.netasm.core.analyses import manager as am
+from netasm.netasm.core.analyses import liveness as li
+from netasm.netasm.core.execute import single_process
+import netasm.netasm.core.graphs.control_flow_graph as cfg
+from netasm.tests.test_execute import make_state
+
+POLICIES = ['netasm.examples.netasm.standalone.hub',
+            'netasm.examples.netasm.standalone.pass_through_2ports',
+            'netasm.examples.netasm.standalone.decrement_loop',
+            'netasm.examples.netasm.standalone.learning_switch',
+            'netasm.examples.netasm.controller_assisted.table_based_simple',
+            'netasm.examples.netasm.controller_assisted.send_to_controller']
+
+
+# Note: x is added on both branches (of inport_bitmap) and loaded after they join
+def branch_code():
+    return I.Code(
+        Fields(),
+        I.Instructions(
+            I.BR(O.Field(Field('inport_bitmap')),
+                 Op.Eq,
+                 O.Value(Value(1, Size(16))),
+                 Label('LBL_0')),
+            I.ADD(O.Field(Field('x')),
+                  Size(8)),
+            I.JMP(Label('LBL_1')),
+            I.LBL(Label('LBL_0')),
+            I.ADD(O.Field(Field('x')),
+                  Size(8)),
+            I.LBL(Label('LBL_1')),
+            I.LD(O.Field(Field('x')),
+                 O.Value(Value(1, Size(8)))),
+            I.HLT()
+        )
+    )
+
+
+# Note: the last load of x is dead
+def straight_code():
+    return I.Code(
+        Fields(),
+        I.Instructions(
+            I.ADD(O.Field(Field('x')),
+                  Size(8)),
+            I.ADD(O.Field(Field('y')),
+                  Size(8)),
+            I.LD(O.Field(Field('x')),
+                 O.Value(Value(1, Size(8)))),
+            I.LD(O.Field(Field('y')),
+                 O.Field(Field('x'))),
+            I.OP(O.Field(Field('outport_bitmap')),
+                 O.Field(Field('y')),
+                 Op.Add,
+                 O.Value(Value(0, Size(8)))),
+            I.LD(O.Field(Field('x')),
+                 O.Value(Value(2, Size(8)))),
+            I.HLT()
+        )
+    )
+
+
+class ControlFlowGraphTest(unittest.TestCase):
+    def test_blocks(self):
+        instructions = branch_code().instructions
+        flow_graph = cfg.generate(instructions)
+
+        ''' The entry and exit, the BR, the two branches and the block they join in '''
+        self.assertEqual(len(flow_graph), 6)
+        branch, fall_through, taken, join = 2, 3, 4, 5
+        self.assertEqual(list(flow_graph[cfg.ENTRY].successors), [branch])
+        self.assertTrue(flow_graph[branch].basic_block[0] is instructions[0])
+        self.assertEqual(list(flow_graph[branch].successors), [fall_through, taken])
+        self.assertEqual(sorted(flow_graph[join].predecessors), [fall_through, taken])
+        self.assertEqual(list(flow_graph[join].successors), [cfg.EXIT])
+        self.assertFalse(any(isinstance(instruction, I.LBL)
+                             for _, node in flow_graph.iteritems() for instruction in node.basic_block))
+
+        self.assertTrue(flow_graph.dominates(branch, join))
+        self.assertFalse(flow_graph.dominates(fall_through, join))
+        self.assertFalse(flow_graph.dominates(taken, join))
+        self.assertEqual(flow_graph.reverse_postorder[0], cfg.ENTRY)
+
+    def test_cache(self):
+        instructions = branch_code().instructions
+        flow_graph = cfg.generate(instructions)
+        self.assertTrue(cfg.generate(instructions) is flow_graph)
+
+        del instructions[-2]
+        self.assertFalse(cfg.generate(instructions) is flow_graph)
+
+
+class LivenessTest(unittest.TestCase):
+    def test_liveness(self):
+        code = straight_code()
+        live_ins, live_outs = am.Analyses(code).analyse(li, [I.ADD, I.RMV])
+        x, y = Field('x'), Field('y')
+
+        self.assertEqual([set(live_outs[instruction]) for instruction in code.instructions],
+                         [set(), set(), {x}, {y}, set(), set(), set()])
+        self.assertEqual([set(live_ins[instruction]) for instruction in code.instructions],
+                         [set(), set(), set(), {x}, {y}, set(), set()])
+
+    def test_invalidation(self):
+        ''' Results are kept while the code is as it was, and computed again once it changes '''
+        code = straight_code()
+        analyses = am.Analyses(code)
+        results = analyses.analyse(li, [I.ADD, I.RMV])
+        self.assertTrue(analyses.analyse(li, [I.ADD, I.RMV]) is results)
+
+        ''' y is then read with nothing loaded in it since it was added '''
+        del code.instructions[3]
+        live_ins, live_outs = analyses.analyse(li, [I.ADD, I.RMV])
+        self.assertEqual(set(live_outs[code.instructions[2]]), {Field('y')})
+
+
+class OptimizeTest(unittest.TestCase):
+    def test_transformations(self):
+        policy = optimize.optimize_Policy(Policy(Decls(TableDecls()), straight_code()))
+        instructions = [repr(instruction) for instruction in policy.code.instructions]
+
+        ''' The dead load is eliminated, y is added where it is first loaded and both are removed once dead '''
+        self.assertFalse(any('Value(2,' in instruction for instruction in instructions))
+        self.assertEqual([instruction.split('(')[0] for instruction in instructions],
+                         ['InstructionCollection.ADD', 'InstructionCollection.LD', 'InstructionCollection.ADD',
+                          'InstructionCollection.LD', 'InstructionCollection.OP', 'InstructionCollection.RMV',
+                          'InstructionCollection.RMV', 'InstructionCollection.HLT'])
+
+    def _run(self, policy, packets):
+        execute = single_process.Execute(policy, flow_cache_size=0)
+        execute.start()
+        try:
+            states = []
+            for port, data in packets:
+                execute.put(make_state(port, data))
+                state = execute.get()
+                states.append((state.packet.bytes, state.reason.reason,
+                               [(str(field), state.header[field].value)
+                                for field in sorted(state.header.keys()) if field in
+                                ['inport_bitmap', 'outport_bitmap', 'bit_length', 'DRP', 'CTR']]))
+            return states
+        finally:
+            execute.stop()
+
+    def test_semantics(self):
+        ''' The optimized policies do what the original ones do '''
+        random.seed(5)
+        macs = [''.join([chr(random.randrange(0, 256)) for _ in range(0, 6)]) for _ in range(0, 4)]
+        packets = [(random.randrange(1, 3), random.choice(macs) + random.choice(macs) + '\x08\x00' + 'x' * 50)
+                   for _ in range(0, 50)]
+
+        for policy_name in POLICIES:
+            policy = import_module(policy_name).main()
+            optimized_policy = optimize.optimize_Policy(import_module(policy_name).main(), None, 2)
+            self.assertEqual(self._run(optimized_policy, packets), self._run(policy, packets), policy_name)
+
+    def test_timings(self):
+        policy, timings = optimize.optimize_Policy__time_usage(Policy(Decls(TableDecls()), straight_code()))
+        self.assertEqual(timings.keys(), [name for name, _ in optimize.PASSES])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        test_patterns.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import random
+import unittest
+
+from netasm.netasm.core.syntax import Field, Value, Size, Mask
+from netasm.netasm.core.execute import ExactIndex, TupleSpaceIndex, MatchPattern, SimplePattern, \
+    ArrayMatchPatterns, ArraySimplePatterns
+
+
+# Note: the indices are checked against a plain list of the entries, looked up from the first one on
+def model_lookup(entries, values):
+    for index in range(0, len(entries)):
+        masks, key = entries[index]
+        if key is not None and tuple([values[i] & masks[i] for i in range(0, len(values))]) == key:
+            return index
+    return -1
+
+
+class IndexTest(unittest.TestCase):
+    def test_exact_index(self):
+        random.seed(1)
+        length = 50
+        index = ExactIndex(length, (0, 0))
+        entries = [((-1, -1), (0, 0))] * length
+
+        for _ in range(0, 2000):
+            i = random.randrange(0, length)
+            key = (random.randrange(0, 3), random.randrange(0, 3))
+            index.update(i, key)
+            entries[i] = ((-1, -1), key)
+
+            for values in [(0, 0), (1, 2), key]:
+                self.assertEqual(index.lookup(values), model_lookup(entries, values))
+
+    def test_exact_index_initial_entries(self):
+        ''' The entries holding the initial key aren't kept one by one '''
+        index = ExactIndex(100000, (0, ))
+        self.assertEqual(index.lookup((0, )), 0)
+        self.assertEqual(index.lookup((1, )), -1)
+
+        index.update(0, (1, ))
+        index.update(2, (1, ))
+        self.assertEqual(index.lookup((0, )), 1)
+        self.assertEqual(index.lookup((1, )), 0)
+        index.update(1, (2, ))
+        self.assertEqual(index.lookup((0, )), 3)
+        index.update(0, (0, ))
+        self.assertEqual(index.lookup((0, )), 0)
+        self.assertEqual(len(index._keys), 3)
+
+    def test_tuple_space_index(self):
+        random.seed(2)
+        length = 40
+        index = TupleSpaceIndex(length, (0xF, 0xF), (0, 0))
+        entries = [((0xF, 0xF), (0, 0))] * length
+
+        for _ in range(0, 2000):
+            i = random.randrange(0, length)
+            masks = random.choice([(0xF, 0xF), (0xF, 0), (0, 0xF), (0x3, 0xC)])
+            key = tuple([random.randrange(0, 4) & mask for mask in masks])
+            index.update(i, masks, key)
+            entries[i] = (masks, key)
+
+            for values in [(0, 0), (1, 2), (3, 12), key]:
+                self.assertEqual(index.lookup(values), model_lookup(entries, values))
+
+        self.assertTrue(len(index._groups) <= 4)
+
+
+def simple_patterns(length):
+    pattern = SimplePattern()
+    pattern[Field('a')] = Value(0, Size(8))
+    pattern[Field('b')] = Value(0, Size(16))
+    return ArraySimplePatterns(pattern, length)
+
+
+def match_patterns(length):
+    pattern = MatchPattern()
+    pattern[Field('a')] = (Value(0, Size(8)), Mask(-1))
+    pattern[Field('b')] = (Value(0, Size(16)), Mask(-1))
+    return ArrayMatchPatterns(pattern, length)
+
+
+class PatternsTest(unittest.TestCase):
+    def test_simple_patterns(self):
+        patterns = simple_patterns(8)
+        fields = [str(field) for field in patterns.fields]
+        self.assertEqual(patterns.lookup_entry([0, 0]), 0)
+
+        patterns.add_entry(0, {'a': 1, 'b': 2})
+        patterns.add_entry(5, {'a': 1, 'b': 2})
+        self.assertEqual(patterns.read_entry(0), [{'a': 1, 'b': 2}[field] for field in fields])
+        self.assertEqual(patterns.lookup_entry(patterns.read_entry(0)), 0)
+        self.assertEqual(patterns.lookup_entry([0, 0]), 1)
+
+        patterns.del_entry(0)
+        self.assertEqual(patterns.lookup_entry(patterns.read_entry(5)), 5)
+        self.assertEqual(patterns.lookup_entry([0, 0]), 0)
+
+        ''' Values are stored at the field's width, so an INCt wraps around '''
+        patterns.add_entry(3, {'a': 0xFF})
+        patterns.increment_entry(3)
+        self.assertEqual(patterns.query_entry(3)['a'], {'value': (0, 8)})
+
+    def test_match_patterns(self):
+        patterns = match_patterns(4)
+        a, b = [patterns.fields.index(Field(field)) for field in ['a', 'b']]
+
+        patterns.add_entry(2, {'a': (1, -1), 'b': (0, 0)})
+        patterns.add_entry(3, {'a': (1, -1), 'b': (7, -1)})
+        values = [0, 0]
+        values[a], values[b] = 1, 7
+        self.assertEqual(patterns.lookup_entry(values), 2)
+        self.assertEqual(patterns.query_entry(2)['b'], {'value': (0, 16), 'mask': 0})
+        self.assertEqual(patterns.query_entry(3)['b'], {'value': (7, 16), 'mask': -1})
+
+        patterns.del_entry(2)
+        self.assertEqual(patterns.lookup_entry(values), 3)
+        values[b] = 8
+        self.assertEqual(patterns.lookup_entry(values), -1)
+
+    def test_dump_entries(self):
+        patterns = match_patterns(4)
+        version, fields, entries = patterns.dump_entries()
+        self.assertEqual(sorted(fields), ['a', 'b'])
+        self.assertEqual([entry[0] for entry in entries], [0, 1, 2, 3])
+        self.assertEqual(entries[0][2], [-1, -1])
+
+        patterns.add_entry(1, {'a': (5, 0xF)})
+        _version, _, entries = patterns.dump_entries(since=version)
+        self.assertTrue(_version > version)
+        self.assertEqual([entry[0] for entry in entries], [1])
+
+        ''' Nothing is updated since the last dump, and a since from elsewhere is ignored '''
+        self.assertEqual(patterns.dump_entries(since=_version)[2], [])
+        self.assertEqual(len(patterns.dump_entries(since=_version + 1)[2]), 4)
+
+        self.assertEqual([entry[0] for entry in patterns.dump_entries(non_zero=True)[2]], [1])
+        self.assertEqual([entry[0] for entry in patterns.dump_entries(1, 3)[2]], [1, 2])
+
+    def test_copy_entries(self):
+        patterns = simple_patterns(6)
+        patterns.add_entry(1, {'a': 3})
+        patterns.add_entry(4, {'b': 9})
+        version, _, _ = patterns.dump_entries()
+
+        ''' The entries are copied up to the shorter length, and the versions only increase '''
+        _patterns = simple_patterns(3)
+        _patterns.copy_entries(patterns)
+        self.assertTrue(_patterns.version() > version)
+        self.assertEqual([entry[0] for entry in _patterns.dump_entries(since=0)[2]], [1])
+        self.assertEqual(_patterns.lookup_entry(patterns.read_entry(1)), 1)
+        self.assertEqual(_patterns.lookup_entry(patterns.read_entry(4)), -1)
+        self.assertEqual(_patterns.lookup_entry([0, 0]), 0)
+
+        self.assertRaises(RuntimeError, _patterns.copy_entries, match_patterns(3))
+
+
+if __name__ == '__main__':
+    unittest.main()
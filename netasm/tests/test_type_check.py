@@ -0,0 +1,90 @@
+# ################################################################################
+# ##
+# ##  https://github.com/NetASM/NetASM-python
+# ##
+# ##  File:
+# ##        test_type_check.py
+# ##
+# ##  Project:
+# ##        NetASM: A Network Assembly Language for Programmable Dataplanes
+# ##
+# ##  Author:
+# ##        Muhammad Shahbaz
+# ##
+# ##  Copyright notice:
+# ##        Copyright (C) 2014 Princeton University
+# ##      Network Operations and Internet Security Lab
+# ##
+# ##  Licence:
+# ##        This file is a part of the NetASM development base package.
+# ##
+# ##        This file is free code: you can redistribute it and/or modify it under
+# ##        the terms of the GNU Lesser General Public License version 2.1 as
+# ##        published by the Free Software Foundation.
+# ##
+# ##        This package is distributed in the hope that it will be useful, but
+# ##        WITHOUT ANY WARRANTY; without even the implied warranty of
+# ##        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# ##        Lesser General Public License for more details.
+# ##
+# ##        You should have received a copy of the GNU Lesser General Public
+# ##        License along with the NetASM source package.  If not, see
+# ##        http://www.gnu.org/licenses/.
+
+__author__ = 'shahbaz'
+
+import unittest
+from importlib import import_module
+
+from netasm.netasm.core import *
+from netasm.netasm.core import type_check
+from netasm.tests.test_optimize import POLICIES
+
+
+# Note: x is added (of size) on one branch only, unless both
+def branch_policy(both, size=8):
+    if both:
+        branch = [I.ADD(O.Field(Field('x')),
+                        Size(size)),
+                  I.JMP(Label('LBL_1'))]
+    else:
+        branch = [I.JMP(Label('LBL_1'))]
+
+    instructions = [I.BR(O.Field(Field('inport_bitmap')),
+                         Op.Eq,
+                         O.Value(Value(1, Size(16))),
+                         Label('LBL_0'))] + branch + \
+                   [I.LBL(Label('LBL_0')),
+                    I.ADD(O.Field(Field('x')),
+                          Size(8)),
+                    I.LBL(Label('LBL_1')),
+                    I.LD(O.Field(Field('x')),
+                         O.Value(Value(1, Size(8)))),
+                    I.HLT()]
+
+    return Policy(Decls(TableDecls()), I.Code(Fields(), I.Instructions(*instructions)))
+
+
+class TypeCheckTest(unittest.TestCase):
+    def test_examples(self):
+        ''' Including decrement_loop, whose loop is checked to a fixed-point '''
+        for policy_name in POLICIES:
+            type_check.type_check_Policy(import_module(policy_name).main(), 16)
+
+    def test_joins(self):
+        type_check.type_check_Policy(branch_policy(True), 16)
+
+        ''' A field added on some paths only can't be used '''
+        self.assertRaises(TypeError, type_check.type_check_Policy, branch_policy(False), 16)
+
+        ''' Paths along which a field differs in size are checked separately '''
+        type_check.type_check_Policy(branch_policy(True, 16), 16)
+        self.assertRaises(TypeError, type_check.type_check_Policy, branch_policy(True, 4), 16)
+
+    def test_arguments(self):
+        self.assertRaises(TypeError, type_check.type_check_Policy, None, 16)
+        self.assertRaises(TypeError, type_check.type_check_Policy, branch_policy(True), '16')
+
+
+if __name__ == '__main__':
+    unittest.main()